@@ -1,106 +1,473 @@
 import asyncio
 import logging
-from typing import Union
+import math
+import random
+import ssl
+from typing import AsyncIterator, Dict, Optional, Union
 import uuid
 
+from pydantic import ValidationError
+
 from gameserver.misc.connection import Connection
-from gameserver.misc.protocol import Protocol, ProtocolRequest, ProtocolResponse, BasicResponse, ErrorResponse
-from gameserver.misc.models import ActionType, AccountLoginRequest, GameSessionData, ItemRequest, ShopItemList
+from gameserver.misc.errors import ConnectionLost
+from gameserver.misc.tls import ResumingSSLContext
+from gameserver.misc.protocol import (
+    Protocol,
+    ProtocolRequest,
+    ProtocolResponse,
+    LoginRequest,
+    LogoutRequest,
+    SubscribeRequest,
+    BuyItemRequest,
+    SellItemRequest,
+    GetAllItemListRequest,
+    SearchItemsRequest,
+    StreamItemsRequest,
+    GetGameSessionRequest,
+    validate_response,
+    warmup,
+)
+from gameserver.misc.models import (
+    AccountLoginRequest,
+    BasicResponse,
+    ErrorResponse,
+    GameSessionData,
+    GameSessionDelta,
+    GameSessionRequest,
+    ItemRequest,
+    ItemSearchRequest,
+    ItemStreamRequest,
+    ShopItem,
+    ShopItemChunk,
+    ShopItemType,
+    ShopItemList,
+    ServerEvent,
+    EventType,
+)
 
 
-class Client:
-    def __init__(self, host: str, port: int) -> None:
+class Client:  #  pylint: disable=too-many-instance-attributes,too-many-public-methods
+    def __init__(  #  pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        compact: bool = False,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        server_hostname: Optional[str] = None,
+        reconnect_attempts: int = 5,
+        reconnect_delay: float = 0.05,
+        reconnect_max_delay: float = 2.0,
+        timeout: Optional[float] = None,
+        path: Optional[str] = None,
+    ) -> None:
         self.host = host
         self.port = port
+        #  Unix socket of server on the same host, which is connected instead of host and port, when given
+        self.path = path
+        self.compact = compact
+        #  TLS is used when context is given. ResumingSSLContext keeps the session, so that next connection resumes it
+        self.ssl_context = ssl_context
+        self.server_hostname = server_hostname
+        #  Shop items by compact handles, they are known after the first items request
+        self.shop_items: Dict[int, ShopItem] = {}
+        self.item_handles: Dict[uuid.UUID, int] = {}
+        self.shop_items_version: Optional[int] = None
         self.game_session: GameSessionData = None
         self.connection: Connection = None
+        self.is_subscribed = False
+        self.catalog_version: Optional[int] = None
+        #  Dropped connection is opened again up to reconnect_attempts times, after delays of full jitter, which grow
+        #  twice with every attempt, so that clients dropped at once do not come back at once. 0 disables reconnects
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.reconnects = 0
+        #  Seconds, which every request waits for its response, unless its own timeout is given. Server is told about
+        #  it, so that it does not do the work, which nobody waits for
+        self.timeout = timeout
+        #  Responses to requests, which have timed out, still arrive in order, and are skipped
+        self._abandoned_responses = 0
+        #  Token of the stream, whose frames are being read. Stream, which is left before its end, is skipped as well
+        self._stream: Optional[object] = None
+        self._responses: asyncio.Queue = None
+        self._reader_task: asyncio.Task = None
 
     async def __aenter__(self):
-        # Open Socket to serve connections
-        reader, writer = await asyncio.open_connection(self.host, self.port)
-        self.connection = Connection(reader, writer)
+        # Build validators before the first request, not on it
+        warmup()
+        await self.connect()
 
         return self
 
+    async def connect(self) -> None:
+        # Open Socket to serve connections
+        if self.path is not None:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        else:
+            reader, writer = await asyncio.open_connection(
+                self.host,
+                self.port,
+                ssl=self.ssl_context,
+                server_hostname=self.server_hostname if self.ssl_context is not None else None,
+            )
+        self.connection = Connection(reader, writer)
+        self._responses = asyncio.Queue()
+        self._abandoned_responses = 0
+        self._stream = None
+        self._reader_task = asyncio.create_task(self._read_frames())
+
     async def __aexit__(self, exc_type, exc_value, exc_tb):
+        self.save_tls_session()
         await self.connection.close()
+        await self._reader_task
 
-    async def send_request(self, request: ProtocolRequest):
-        bytes_message = Protocol.construct(request.model_dump(mode="json"))
-        await self.connection.send(bytes_message)
+    @property
+    def ssl_object(self) -> Optional[ssl.SSLObject]:
+        return self.connection.writer.get_extra_info("ssl_object")
+
+    #  TLS 1.3 tickets arrive after the handshake, along with the first frames, so session is taken once the first frame
+    #  has been read, and again when connection is done with, so that the next connection, also the one opened by
+    #  reconnect, resumes it instead of a full handshake
+    def save_tls_session(self) -> None:
+        ssl_object = self.ssl_object
+        if isinstance(self.ssl_context, ResumingSSLContext) and ssl_object is not None and ssl_object.session:
+            self.ssl_context.session = ssl_object.session
 
-    async def get_response(self) -> ProtocolResponse:
+    @property
+    def tls_session_reused(self) -> bool:
+        ssl_object = self.ssl_object
+        return ssl_object is not None and ssl_object.session_reused
+
+    #  Reads every frame from server: events are applied to game session right away, responses are queued
+    #  Frame, which is not a valid response, breaks the order of responses, so connection is dropped as on EOF
+    async def _read_frames(self) -> None:
+        is_first = True
         async for message in self.connection.listen():
-            logging.debug("Got a response from server")
+            logging.debug("Got a frame from server")
+            if is_first:
+                self.save_tls_session()
+                is_first = False
             logging.debug(message)
-            response = ProtocolResponse.model_validate_json(message, strict=True)
-            break
-        return response
+            try:
+                response = validate_response(message, strict=True)
+            except ValidationError:
+                logging.exception("Got an invalid frame from server, dropping connection")
+                self.connection.writer.close()
+                break
+            if isinstance(response.data, ServerEvent):
+                self.apply_event(response.data)
+            else:
+                self._responses.put_nowait(response)
+        self._responses.put_nowait(None)
+
+    def apply_event(self, event: ServerEvent) -> None:
+        if event.event_type == EventType.CATALOG_CHANGED:
+            self.catalog_version = event.catalog_version
+        if not self.game_session:
+            return
+
+        # Version is advanced only while no event has been missed, otherwise refresh has to catch up from known one
+        if event.version is not None and event.version == self.game_session.version + 1:
+            self.game_session.version = event.version
+
+        owned_items = self.game_session.owned_items
+        if event.event_type == EventType.BALANCE_CHANGED:
+            self.game_session.balance = event.balance
+        elif event.event_type == EventType.ITEM_ADDED:
+            if str(event.shop_item.uuid) not in owned_items.as_dict():
+                owned_items.append(event.shop_item)
+        elif event.event_type == EventType.ITEM_REMOVED:
+            owned_items.root = [shop_item for shop_item in owned_items if shop_item.uuid != event.shop_item.uuid]
 
-    async def send_login_request(self, nickname: str) -> Union[GameSessionData, ErrorResponse]:
-        request = ProtocolRequest(
-            action_type=ActionType.LOGIN, session_uuid=None, data=AccountLoginRequest(nickname=nickname)
+    def apply_game_session_delta(self, delta: GameSessionDelta) -> None:
+        owned_items = self.game_session.owned_items
+        removed_item_uuids = set(delta.removed_item_uuids)
+        owned_items.root = [shop_item for shop_item in owned_items if shop_item.uuid not in removed_item_uuids]
+        owned_item_uuids = {shop_item.uuid for shop_item in owned_items}
+        for shop_item in delta.added_items:
+            if shop_item.uuid not in owned_item_uuids:
+                owned_items.append(shop_item)
+
+        self.game_session.balance = delta.balance
+        self.game_session.version = delta.version
+
+    #  Compact game session refers to owned items by handles, they are expanded with the local copy of the catalog,
+    #  which is fetched again only when it is outdated
+    async def expand_owned_item_handles(self) -> None:
+        handles = self.game_session.owned_item_handles
+        if not handles:
+            return
+        if self.shop_items_version != self.game_session.catalog_version or any(
+            handle not in self.shop_items for handle in handles
+        ):
+            response = await self.send_get_all_items_request()
+            if isinstance(response, ErrorResponse):
+                return
+            self.shop_items_version = self.game_session.catalog_version
+        self.game_session.owned_items.root.extend(
+            self.shop_items[handle] for handle in handles if handle in self.shop_items
         )
-        await self.send_request(request)
+        self.game_session.owned_item_handles = None
+
+    def find_item_handle(self, item_uuid: uuid.UUID) -> Optional[int]:
+        return self.item_handles.get(item_uuid)
+
+    def make_item_request(self, item_uuid: uuid.UUID, idempotency_key: Optional[str]) -> ItemRequest:
+        handle = self.find_item_handle(item_uuid) if self.compact else None
+        if handle is not None:
+            return ItemRequest(item_handle=handle, idempotency_key=idempotency_key)
+        return ItemRequest(item_uuid=item_uuid, idempotency_key=idempotency_key)
+
+    #  Request carries the time left until deadline, sent again it carries less of it
+    async def send_request(self, request: ProtocolRequest, deadline: Optional[float] = None):
+        if deadline is not None:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            request.timeout_ms = math.ceil(remaining * 1e3)
+        bytes_message = Protocol.construct(request.model_dump(mode="json"))
+        await self.connection.send(bytes_message)
 
+    @property
+    def is_connection_lost(self) -> bool:
+        return self._reader_task.done()
+
+    #  Sends request and waits for its response, reconnecting when connection drops. Connection, which is known to be
+    #  lost, is opened again before sending. Request, which was in flight, is sent again only when it is idempotent,
+    #  as otherwise it is unknown whether server has applied it, and ConnectionLost is raised instead
+    async def call(
+        self, request: ProtocolRequest, idempotent: bool, timeout: Optional[float] = None
+    ) -> ProtocolResponse:
+        if timeout is None:
+            timeout = self.timeout
+        deadline = asyncio.get_running_loop().time() + timeout if timeout is not None else None
+        if self.is_connection_lost and self.reconnect_attempts:
+            await self.reconnect(self.connection)
+        resends = 0
+        while True:
+            connection = self.connection
+            try:
+                await self.send_request(request, deadline)
+                return await self.get_response(deadline)
+            except ConnectionError:
+                if not self.reconnect_attempts:
+                    raise
+                await self.reconnect(connection)
+                if not idempotent:
+                    raise ConnectionLost(f"Connection has been lost during {request.action_type.value}") from None
+                resends += 1
+                if resends > self.reconnect_attempts:
+                    raise ConnectionLost(f"Connection has been lost on every {request.action_type.value}") from None
+
+    #  Opens connection again, unless it has been done since the given one was lost, and resumes the game session:
+    #  the same session_uuid is used further, and subscription is renewed with the missed changes fetched as delta
+    async def reconnect(self, lost_connection: Connection) -> None:
+        if self.connection is not lost_connection:
+            return
+        self.save_tls_session()
+        await self.connection.close()
+        await self._reader_task
+
+        error: Optional[OSError] = None
+        for attempt in range(self.reconnect_attempts):
+            delay = min(self.reconnect_max_delay, self.reconnect_delay * 2**attempt)
+            await asyncio.sleep(random.uniform(0, delay))
+            try:
+                await self.connect()
+                await self.resume()
+            except OSError as e:
+                logging.warning("Failed to reconnect to server: %s", e)
+                error = e
+                await self.connection.close()
+                await self._reader_task
+                continue
+            self.reconnects += 1
+            logging.info("Reconnected to server")
+            return
+        raise ConnectionLost("Failed to reconnect to server") from error
+
+    async def resume(self) -> None:
+        if self.game_session is None or not self.is_subscribed:
+            return
+        await self.send_request(SubscribeRequest(session_uuid=self.game_session.session_uuid))
         response = await self.get_response()
+        if isinstance(response.data, ErrorResponse):
+            self.is_subscribed = False
+            return
+        await self.send_request(self.make_game_session_request())
+        await self.apply_game_session_response((await self.get_response()).data)
+
+    async def get_response(self, deadline: Optional[float] = None) -> ProtocolResponse:
+        await self._skip_abandoned()
+        if deadline is None:
+            return await self._next_response()
+        try:
+            return await asyncio.wait_for(self._next_response(), deadline - asyncio.get_running_loop().time())
+        except asyncio.TimeoutError:
+            self._abandoned_responses += 1
+            raise
+
+    async def _skip_abandoned(self) -> None:
+        while self._abandoned_responses:
+            await self._next_response()
+            self._abandoned_responses -= 1
+        if self._stream is not None:
+            self._stream = None
+            while not self._is_stream_end((await self._next_response()).data):
+                pass
+
+    @staticmethod
+    def _is_stream_end(data: object) -> bool:
+        return isinstance(data, ErrorResponse) or (isinstance(data, ShopItemChunk) and data.last)
+
+    async def _next_response(self) -> ProtocolResponse:
+        response = await self._responses.get()
+        if response is None:
+            # Keep the mark for everyone, who waits for response later
+            self._responses.put_nowait(None)
+            raise ConnectionError("Connection to server has been closed")
+        return response
+
+    async def send_login_request(
+        self, nickname: str, timeout: Optional[float] = None
+    ) -> Union[GameSessionData, ErrorResponse]:
+        request = LoginRequest(data=AccountLoginRequest(nickname=nickname, compact=self.compact))
+        #  Every login creates a session, so it is never sent twice
+        response = await self.call(request, idempotent=False, timeout=timeout)
         logging.debug(response)
         assert not isinstance(response.data, BasicResponse)
         if isinstance(response.data, GameSessionData):
             self.game_session = response.data
+            await self.expand_owned_item_handles()
+        return response.data
 
-    async def send_logout_request(self) -> Union[BasicResponse, ErrorResponse]:
+    async def send_subscribe_request(self, timeout: Optional[float] = None) -> Union[BasicResponse, ErrorResponse]:
         assert self.game_session
-        request = ProtocolRequest(action_type=ActionType.LOGOUT, session_uuid=self.game_session.session_uuid, data=None)
-        await self.send_request(request)
+        request = SubscribeRequest(session_uuid=self.game_session.session_uuid)
+        response = await self.call(request, idempotent=True, timeout=timeout)
+        if isinstance(response.data, BasicResponse):
+            self.is_subscribed = True
+        return response.data
 
-        response = await self.get_response()
+    async def send_logout_request(self, timeout: Optional[float] = None) -> Union[BasicResponse, ErrorResponse]:
+        assert self.game_session
+        request = LogoutRequest(session_uuid=self.game_session.session_uuid)
+        response = await self.call(request, idempotent=False, timeout=timeout)
         self.game_session = None
+        self.is_subscribed = False
         return response.data
 
-    async def send_buy_request(self, item_uuid: uuid.UUID) -> Union[BasicResponse, ErrorResponse]:
+    async def send_buy_request(
+        self, item_uuid: uuid.UUID, idempotency_key: Optional[str] = None, timeout: Optional[float] = None
+    ) -> Union[BasicResponse, ErrorResponse]:
         assert self.game_session
-        request = ProtocolRequest(
-            action_type=ActionType.BUY_ITEM,
+        request = BuyItemRequest(
             session_uuid=self.game_session.session_uuid,
-            data=ItemRequest(item_uuid=item_uuid),
+            data=self.make_item_request(item_uuid, idempotency_key),
         )
-        await self.send_request(request)
-
-        response = await self.get_response()
+        #  Server applies request with idempotency key once, so only such request is safe to send again
+        response = await self.call(request, idempotent=idempotency_key is not None, timeout=timeout)
         return response.data
 
-    async def send_sell_request(self, item_uuid: uuid.UUID) -> Union[BasicResponse, ErrorResponse]:
+    async def send_sell_request(
+        self, item_uuid: uuid.UUID, idempotency_key: Optional[str] = None, timeout: Optional[float] = None
+    ) -> Union[BasicResponse, ErrorResponse]:
         assert self.game_session
-        request = ProtocolRequest(
-            action_type=ActionType.SELL_ITEM,
+        request = SellItemRequest(
             session_uuid=self.game_session.session_uuid,
-            data=ItemRequest(item_uuid=item_uuid),
+            data=self.make_item_request(item_uuid, idempotency_key),
         )
-        await self.send_request(request)
-
-        response = await self.get_response()
+        #  Server applies request with idempotency key once, so only such request is safe to send again
+        response = await self.call(request, idempotent=idempotency_key is not None, timeout=timeout)
         return response.data
 
-    async def send_get_all_items_request(self) -> Union[ShopItemList, ErrorResponse]:
+    async def send_get_all_items_request(self, timeout: Optional[float] = None) -> Union[ShopItemList, ErrorResponse]:
         logging.debug("Sending get items info request")
         assert self.game_session
-        request = ProtocolRequest(
-            action_type=ActionType.GET_ALL_ITEM_LIST, session_uuid=self.game_session.session_uuid, data=None
-        )
+        request = GetAllItemListRequest(session_uuid=self.game_session.session_uuid)
         logging.debug(request)
-        await self.send_request(request)
+        response = await self.call(request, idempotent=True, timeout=timeout)
+        if isinstance(response.data, ShopItemList):
+            self.shop_items = {
+                shop_item.handle: shop_item for shop_item in response.data if shop_item.handle is not None
+            }
+            self.item_handles = {shop_item.uuid: handle for handle, shop_item in self.shop_items.items()}
+        return response.data
 
-        response = await self.get_response()
+    async def send_search_items_request(  #  pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        query: str,
+        item_type: Optional[ShopItemType] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        limit: int = 20,
+        timeout: Optional[float] = None,
+    ) -> Union[ShopItemList, ErrorResponse]:
+        assert self.game_session
+        request = SearchItemsRequest(
+            session_uuid=self.game_session.session_uuid,
+            data=ItemSearchRequest(query=query, type=item_type, min_price=min_price, max_price=max_price, limit=limit),
+        )
+        response = await self.call(request, idempotent=True, timeout=timeout)
         return response.data
 
-    async def refresh_game_session(self) -> Union[GameSessionData, ErrorResponse]:
+    #  Yields items in chunks, as server reads and sends them, instead of one list of all of them. Error ends the
+    #  stream. Timeout is given to server, which ends the stream with DeadlineExceeded, once it has passed, as amount
+    #  of frames is not known upfront. Request, which is sent, while stream is not read to its end, abandons it
+    async def stream_items(
+        self, owned: bool = False, chunk_size: int = 500, timeout: Optional[float] = None
+    ) -> AsyncIterator[Union[ShopItemList, ErrorResponse]]:
         assert self.game_session
-        request = ProtocolRequest(
-            action_type=ActionType.GET_GAME_DATA_SESSION, session_uuid=self.game_session.session_uuid, data=None
+        request = StreamItemsRequest(
+            session_uuid=self.game_session.session_uuid, data=ItemStreamRequest(owned=owned, chunk_size=chunk_size)
         )
-        await self.send_request(request)
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is not None:
+            request.timeout_ms = math.ceil(timeout * 1e3)
+        if self.is_connection_lost and self.reconnect_attempts:
+            await self.reconnect(self.connection)
 
-        response = await self.get_response()
-        if isinstance(response.data, GameSessionData):
-            self.game_session = response.data
+        connection = self.connection
+        stream = object()
+        try:
+            await self.send_request(request)
+            await self._skip_abandoned()
+            self._stream = stream
+            while self._stream is stream:
+                data = (await self._next_response()).data
+                if self._is_stream_end(data):
+                    self._stream = None
+                    if isinstance(data, ErrorResponse):
+                        yield data
+                    return
+                yield ShopItemList(data.shop_items)
+        except ConnectionError:
+            self._stream = None
+            if not self.reconnect_attempts:
+                raise
+            #  Chunks, which have been yielded, can not be taken back, so stream is not started again
+            await self.reconnect(connection)
+            raise ConnectionLost("Connection has been lost during stream_items") from None
+
+    #  Sends the known state version, so that server replies only with changes since then
+    async def refresh_game_session(
+        self, timeout: Optional[float] = None
+    ) -> Union[GameSessionData, GameSessionDelta, ErrorResponse]:
+        assert self.game_session
+        response = await self.call(self.make_game_session_request(), idempotent=True, timeout=timeout)
+        await self.apply_game_session_response(response.data)
+        return response.data
+
+    def make_game_session_request(self) -> GetGameSessionRequest:
+        return GetGameSessionRequest(
+            session_uuid=self.game_session.session_uuid,
+            data=GameSessionRequest(known_version=self.game_session.version, compact=self.compact),
+        )
+
+    async def apply_game_session_response(self, data: Union[GameSessionData, GameSessionDelta, ErrorResponse]) -> None:
+        if isinstance(data, GameSessionData):
+            self.game_session = data
+            await self.expand_owned_item_handles()
+        elif isinstance(data, GameSessionDelta):
+            self.apply_game_session_delta(data)
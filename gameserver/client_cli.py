@@ -1,7 +1,10 @@
 import argparse
 import asyncio
 import logging
+import uuid
 from gameserver.client import Client
+from gameserver.misc.tls import make_client_context
+from gameserver.misc.errors import ConnectionLost
 from gameserver.misc.models import ErrorResponse, ShopItemList, ShopItem
 
 MENU_STRING = """
@@ -13,6 +16,7 @@ Please, choose desired action:
 5) Sell Item
 6) Refresh game session
 7) Logout
+8) Search items
 """
 
 
@@ -30,8 +34,13 @@ def print_separator() -> None:
     print()
 
 
+#  Money travels as integer cents and is turned into credits only to be shown
+def format_money(cents: int) -> str:
+    return f"{'-' if cents < 0 else ''}{abs(cents) // 100}.{abs(cents) % 100:02d} CR"
+
+
 def print_item_description(shop_item: ShopItem, index: int, owned: bool = False):
-    msg = f"{index + 1}) Item name: {shop_item.name}. Price: {shop_item.price}"
+    msg = f"{index + 1}) Item name: {shop_item.name}. Price: {format_money(shop_item.price)}"
     if owned:  #  Check if item is owned by the account
         msg += ". Owned"
     print(msg)
@@ -51,6 +60,21 @@ async def view_shop_items(client: Client) -> ShopItemList:
     return response
 
 
+async def search_items(client: Client):
+    query = input("Search for (words of item name): ")
+    response = await client.send_search_items_request(query)
+    if check_if_error_recieved(response):
+        return
+    if len(response) == 0:
+        print("No items found")
+        return
+
+    owned_items_dict = client.game_session.owned_items.as_dict()
+    for index, shop_item in enumerate(response):
+        is_owned = owned_items_dict.get(str(shop_item.uuid)) is not None
+        print_item_description(shop_item, index, is_owned)
+
+
 def view_purchased_items(client: Client):
     owned_items = client.game_session.owned_items
     if len(owned_items) == 0:
@@ -62,8 +86,9 @@ def view_purchased_items(client: Client):
 
 
 async def buy_item(client: Client):
-    # Refresh to get actual information at the moment
-    await client.refresh_game_session()
+    # Refresh to get actual information at the moment. Subscribed client is kept up to date by server events
+    if not client.is_subscribed:
+        await client.refresh_game_session()
     shop_item_list = await view_shop_items(client)
 
     while True:
@@ -82,17 +107,20 @@ async def buy_item(client: Client):
             continue
         break
 
-    response = await client.send_buy_request(shop_item_list.at(shop_item_index).uuid)
+    #  Idempotency key lets the request be sent again, when connection drops while it is in flight
+    response = await client.send_buy_request(shop_item_list.at(shop_item_index).uuid, idempotency_key=str(uuid.uuid4()))
     if check_if_error_recieved(response):
         return
-    client.game_session.owned_items.append(shop_item_list.at(shop_item_index))
+    if not client.is_subscribed:
+        client.game_session.owned_items.append(shop_item_list.at(shop_item_index))
 
     print("Successfully bought item!")
 
 
 async def sell_item(client: Client):
-    # Refresh to get actual information at the moment
-    await client.refresh_game_session()
+    # Refresh to get actual information at the moment. Subscribed client is kept up to date by server events
+    if not client.is_subscribed:
+        await client.refresh_game_session()
     view_purchased_items(client)
     owned_items = client.game_session.owned_items
     if len(owned_items) == 0:
@@ -111,17 +139,18 @@ async def sell_item(client: Client):
         break
     print()
 
-    response = await client.send_sell_request(owned_items.at(shop_item_index).uuid)
+    response = await client.send_sell_request(owned_items.at(shop_item_index).uuid, idempotency_key=str(uuid.uuid4()))
     if check_if_error_recieved(response):
         return
-    owned_items.remove(owned_items.at(shop_item_index))
+    if not client.is_subscribed:
+        owned_items.remove(owned_items.at(shop_item_index))
 
     print("Successfully sold item!")
 
 
 async def process_menu_option(client: Client, menu_option: int):
     if menu_option == 1:
-        print(f"Your current balance: {client.game_session.balance} CR")
+        print(f"Your current balance: {format_money(client.game_session.balance)}")
 
     if menu_option == 2:
         view_purchased_items(client)
@@ -144,6 +173,9 @@ async def process_menu_option(client: Client, menu_option: int):
         response = await client.send_logout_request()
         check_if_error_recieved(response)
 
+    if menu_option == 8:
+        await search_items(client)
+
     print_separator()
     return
 
@@ -156,39 +188,67 @@ async def main_menu_loop(client: Client):
         print(MENU_STRING)
 
         menu_option = input("Your choise: ")
-        if not menu_option.isdigit() or int(menu_option) < 1 or int(menu_option) > 7:
-            input("Your selection should be number within 1-7 range. Press Enter to continue")
+        if not menu_option.isdigit() or int(menu_option) < 1 or int(menu_option) > 8:
+            input("Your selection should be number within 1-8 range. Press Enter to continue")
             continue
 
         print()
-        await process_menu_option(client, int(menu_option))
+        try:
+            await process_menu_option(client, int(menu_option))
+        except ConnectionLost as e:
+            #  Connection has been opened again with the same session, unless it has failed as well
+            logging.error(e.message)
+            if client.is_connection_lost:
+                break
+            continue
+        except asyncio.TimeoutError:
+            logging.error("Server has not replied in time")
+            continue
         if int(menu_option) == 7:
             break
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--host", dest="host", type=str, default="localhost", required=True, help="IP address of server to connect to"
-    )
+    parser.add_argument("--host", dest="host", type=str, default="localhost", help="IP address of server to connect to")
     parser.add_argument(
         "--port",
         dest="port",
         type=int,
         default=3233,
-        required=True,
         help="Port of server to connect to",
     )
+    parser.add_argument(
+        "--unix-path",
+        dest="unix_path",
+        type=str,
+        default=None,
+        help="Unix socket of server on the same host to connect to instead of host and port",
+    )
+    parser.add_argument(
+        "--timeout", dest="timeout", type=float, default=None, help="Seconds to wait for every response"
+    )
+    parser.add_argument("--tls", dest="tls", action="store_true", help="Connect over TLS")
+    parser.add_argument(
+        "--cafile", dest="cafile", type=str, default=None, help="Certificate of server to trust, system ones by default"
+    )
 
     return parser.parse_args()
 
 
 async def main(args: argparse.Namespace):
     print("Welcome to basic Ship Economy game")
-    async with Client(args.host, args.port) as client:
+    ssl_context = make_client_context(args.cafile) if args.tls or args.cafile else None
+    async with Client(
+        args.host, args.port, ssl_context=ssl_context, timeout=args.timeout, path=args.unix_path
+    ) as client:
         nickname = input("Please, provide nickname to login into an account: ")
 
         response = await client.send_login_request(nickname)
+        if check_if_error_recieved(response):
+            return
+
+        response = await client.send_subscribe_request()
         check_if_error_recieved(response)
 
         await main_menu_loop(client)
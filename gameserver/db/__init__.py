@@ -1,2 +1,16 @@
-from .manager import DBManager
-from .settings import DBSettings
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .manager import DBManager
+    from .settings import DBSettings
+
+#  Submodules are imported on first access, so that importing settings does not pull in SQLAlchemy
+_LAZY_ATTRIBUTES = {"DBManager": ".manager", "DBSettings": ".settings"}
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
@@ -1,61 +1,146 @@
+import datetime
 import logging
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import uuid
 import random
 
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
 
 from gameserver.misc.models import ShopItem
 from gameserver.misc import errors
 
 from gameserver.db.settings import DBSettings
-from gameserver.db import tables
+from gameserver.db.statements import CompiledCacheStats
+from gameserver.db.sharding import HashRing, hash_point, make_uuid
+from gameserver.db import tables, statements, migrations
 
 
-class DBManager:
-    def __init__(self, settings: DBSettings) -> None:
+class DBManager:  #  pylint: disable=too-many-instance-attributes,too-many-public-methods
+    #  Owned items changes are guaranteed to be kept for this many latest state versions of account
+    ITEM_CHANGES_HISTORY = 64
+    ITEM_CHANGES_PRUNE_PERIOD = 16
+
+    def __init__(
+        self,
+        settings: DBSettings,
+        session_ttl: Optional[datetime.timedelta] = None,
+        max_sessions_per_account: Optional[int] = None,
+    ) -> None:
         self.settings = settings
-        self._engine: AsyncEngine = None
+        self.session_ttl = session_ttl
+        self.max_sessions_per_account = max_sessions_per_account
+        self.ring = HashRing([shard.shard_key for shard in settings.all_shards])
+        self._engines: List[AsyncEngine] = []
+        self.sessionmakers: List[async_sessionmaker] = []
+        #  First shard also serves reads of the shop catalog, which is replicated to every shard
         self.sessionmaker: async_sessionmaker = None
+        self.cache_stats = CompiledCacheStats()
 
-    async def init_db_engine(self) -> None:
-        if self.settings.db_type != "mysql":
-            raise NotImplementedError("Unsupported DB type")
+    async def init_db_engine(self, migrate: bool = True) -> None:
+        for shard in self.settings.all_shards:
+            engine = create_async_engine(shard.url, echo=False)
+            self.cache_stats.attach(engine.sync_engine)
+            self._engines.append(engine)
+            self.sessionmakers.append(async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession))
 
-        self._engine = create_async_engine(
-            f"mysql+aiomysql://{self.settings.user}:{self.settings.password}@{self.settings.host}:{self.settings.port}/gmdb?charset=utf8mb4", #  pylint: disable=line-too-long
-            echo=False,
-        )
-        async with self._engine.begin() as conn:
+        if migrate:
             if self.settings.is_test_env:
-                await conn.run_sync(tables.BaseTable.metadata.drop_all)
-            await conn.run_sync(tables.BaseTable.metadata.create_all)
+                for engine in self._engines:
+                    async with engine.begin() as conn:
+                        await conn.run_sync(tables.BaseTable.metadata.drop_all)
+            await self.migrate()
+
+        self.sessionmaker = self.sessionmakers[0]
+
+    @property
+    def engines(self) -> List[AsyncEngine]:
+        return list(self._engines)
+
+    async def migrate(self) -> int:
+        versions = []
+        for engine in self._engines:
+            async with engine.begin() as conn:
+                versions.append(await conn.run_sync(migrations.migrate))
+
+        return min(versions)
+
+    async def get_schema_version(self) -> int:
+        versions = []
+        for engine in self._engines:
+            async with engine.connect() as conn:
+                versions.append(await conn.run_sync(migrations.get_schema_version))
+
+        return min(versions)
 
-        self.sessionmaker = async_sessionmaker(self._engine, expire_on_commit=False, class_=AsyncSession)
+    async def explain_hot_queries(self) -> Dict[str, List[str]]:
+        result: Dict[str, List[str]] = {}
+        async with self._engines[0].connect() as conn:
+            for name, (statement, params) in statements.HOT_STATEMENTS.items():
+                result[name] = await conn.run_sync(statements.explain, statement, params)
+
+        return result
 
     async def shutdown(self) -> None:
         logging.info("Shutting down db connection")
-        await self._engine.dispose()
+        for engine in self._engines:
+            await engine.dispose()
+
+    #  Routing between shards
+
+    def sessionmaker_for_nickname(self, nickname: str) -> async_sessionmaker:
+        return self.sessionmakers[self.ring.shard_for_nickname(nickname)]
+
+    def sessionmaker_for_session(self, session_uuid: Optional[uuid.UUID]) -> async_sessionmaker:
+        #  Request without a session has no shard to go to, and is unauthorized on any of them
+        if session_uuid is None:
+            raise errors.AccountSessionNotFound()
+        return self.sessionmakers[self.ring.shard_for_uuid(session_uuid)]
+
+    #  Copies shop items missing on other shards from the first one, keeping their uuids
+    async def replicate_shop_items(self) -> None:
+        async with self.sessionmaker() as session:
+            shop_items = [item.to_shop_item_model() for item in await self.get_shop_items_list(session)]
+
+        for sessionmaker in self.sessionmakers[1:]:
+            async with sessionmaker.begin() as session:
+                for shop_item in shop_items:
+                    await self.add_shop_item(session, shop_item)
 
     #  Work with shop_items
 
     async def add_shop_item(self, session: AsyncSession, item: ShopItem) -> None:
         result = await session.execute(
-            select(tables.DBShopItem)
-            .where(tables.DBShopItem.name == item.name)
-            .where(tables.DBShopItem.price == item.price)
+            statements.SELECT_SHOP_ITEM_BY_NAME_AND_PRICE, {"name": item.name, "price": item.price}
         )
         if result.scalar():
             print(f"Item {item.name} with price {item.price} already exists!")
         else:
-            item = tables.DBShopItem(name=item.name, type=item.type, price=item.price)
+            item = tables.DBShopItem(uuid=item.uuid or uuid.uuid4(), name=item.name, type=item.type, price=item.price)
             session.add(item)
             await session.flush()
 
+    #  Applies catalog diff in two bulk statements instead of a lookup and an insert per item
+
+    async def apply_shop_items_changes(
+        self, session: AsyncSession, inserted: List[ShopItem], changed: List[ShopItem]
+    ) -> None:
+        if inserted:
+            await session.execute(
+                statements.INSERT_SHOP_ITEMS,
+                [{"uuid": item.uuid, "name": item.name, "price": item.price, "type": item.type} for item in inserted],
+            )
+        if changed:
+            await session.execute(
+                statements.UPDATE_SHOP_ITEMS_BY_UUID,
+                [
+                    {"item_uuid": item.uuid, "new_name": item.name, "new_price": item.price, "new_type": item.type}
+                    for item in changed
+                ],
+            )
+
     async def get_shop_items_list(self, session: AsyncSession) -> List[tables.DBShopItem]:
         result: List[tables.DBShopItem] = []
-        rows = await session.execute(select(tables.DBShopItem))
+        rows = await session.execute(statements.SELECT_ALL_SHOP_ITEMS)
 
         for item in rows.scalars():
             result.append(item)
@@ -65,11 +150,7 @@ class DBManager:
     async def get_user_owned_items_list(
         self, session: AsyncSession, account: tables.DBAccount
     ) -> List[tables.DBShopItem]:
-        rows = await session.execute(
-            select(tables.DBShopItem)
-            .join(tables.DBShopItem2Account, tables.DBShopItem2Account.shop_item == tables.DBShopItem.id)
-            .where(tables.DBShopItem2Account.account == account.id)
-        )
+        rows = await session.execute(statements.SELECT_OWNED_SHOP_ITEMS, {"account_id": account.id})
 
         result: List[tables.DBShopItem] = []
         for item in rows.scalars():
@@ -77,131 +158,225 @@ class DBManager:
 
         return result
 
+    #  Rows are fetched through a server-side cursor, chunk_size at a time, so only one chunk of them is held in memory
+    async def stream_user_owned_items(
+        self, session: AsyncSession, account: tables.DBAccount, chunk_size: int
+    ) -> AsyncIterator[List[tables.DBShopItem]]:
+        result = await session.stream_scalars(
+            statements.SELECT_OWNED_SHOP_ITEMS, {"account_id": account.id}, execution_options={"yield_per": chunk_size}
+        )
+        async for shop_items in result.partitions():
+            yield shop_items
+
     # Work with Account Session
 
+    #  Every value of the new session is known upfront, so it is inserted without reading it back
     async def create_account_session(self, session: AsyncSession, account: tables.DBAccount) -> tables.DBAccountSession:
-        account_session = tables.DBAccountSession(account=account.id)
-        session.add(account_session)
-        await session.flush()
-        await session.refresh(account_session)
+        account_session = tables.DBAccountSession(
+            uuid=make_uuid(hash_point(account.nickname)), account=account.id, created=tables.utcnow()
+        )
+        result = await session.execute(
+            statements.INSERT_ACCOUNT_SESSION,
+            {"uuid": account_session.uuid, "account": account_session.account, "created": account_session.created},
+        )
+        account_session.id = result.inserted_primary_key[0]
+
+        if self.max_sessions_per_account:
+            stale_ids = (
+                await session.execute(
+                    statements.SELECT_STALE_ACCOUNT_SESSION_IDS,
+                    {"account_id": account.id, "keep": self.max_sessions_per_account},
+                )
+            ).scalars().all()
+            if stale_ids:
+                await session.execute(statements.DELETE_ACCOUNT_SESSIONS_BY_IDS, {"ids": stale_ids})
 
         return account_session
 
     async def delete_account_session(self, session: AsyncSession, session_uuid: uuid.UUID) -> None:
         account_session = (
-            await session.execute(select(tables.DBAccountSession).where(tables.DBAccountSession.uuid == session_uuid))
+            await session.execute(statements.SELECT_ACCOUNT_SESSION_BY_UUID, {"session_uuid": session_uuid})
         ).scalar()
         if not account_session:
             raise errors.AccountSessionNotFound(session_uuid)
 
         await session.delete(account_session)
 
+    #  Deletes at most batch_size sessions per call, so that every purge transaction stays short
+    async def purge_expired_sessions(
+        self, session: AsyncSession, created_before: datetime.datetime, batch_size: int
+    ) -> int:
+        expired_ids = (
+            await session.execute(
+                statements.SELECT_EXPIRED_ACCOUNT_SESSION_IDS,
+                {"created_before": created_before, "batch_size": batch_size},
+            )
+        ).scalars().all()
+        if expired_ids:
+            await session.execute(statements.DELETE_ACCOUNT_SESSIONS_BY_IDS, {"ids": expired_ids})
+
+        return len(expired_ids)
+
     # Work with Account
 
+    #  Returns account and, when it has just been created, its starting balance in cents. Returning players are
+    #  the common case, so account is looked up first. Concurrent first logins under the same nickname race on its
+    #  unique index: all inserts but one are ignored, and the losers read the winner's account
     async def find_or_create_account(
-        self, session: AsyncSession, nickname: str, min_money: float, max_money: float
-    ) -> tables.DBAccount:
+        self, session: AsyncSession, nickname: str, min_money_cents: int, max_money_cents: int
+    ) -> Tuple[tables.DBAccount, Optional[int]]:
         account = await self.find_account_by_nickname(session, nickname)
         if account:
-            return account
+            return account, None
 
-        account = await self.create_account(session, nickname)
-        await self.create_balance_record_for_account(session, account)
-        random_balance = round(random.uniform(min_money, max_money), 2)
-        await self.add_balance_to_account(session, account, random_balance)
-
-        return account
+        balance_cents = random.randint(min_money_cents, max_money_cents)
+        account = await self.create_account(session, nickname, balance_cents)
+        if account:
+            return account, balance_cents
 
-    async def create_account(self, session: AsyncSession, nickname: str) -> tables.DBAccount:
-        if (await session.execute(select(tables.DBAccount).where(tables.DBAccount.nickname == nickname))).scalar():
-            raise errors.AccountAlreadyExists(nickname)
+        account = (
+            await session.execute(statements.SELECT_ACCOUNT_BY_NICKNAME_FOR_SHARE, {"nickname": nickname})
+        ).scalar()
+        if not account:
+            raise errors.AccountNotExist(nickname)
 
-        new_account = tables.DBAccount(nickname=nickname)
-        session.add(new_account)
-        await session.flush()
-        await session.refresh(new_account)
+        return account, None
 
-        return new_account
+    #  Inserts account with its balance, or returns None when account with this nickname already exists
+    async def create_account(
+        self, session: AsyncSession, nickname: str, balance_cents: int = 0
+    ) -> Optional[tables.DBAccount]:
+        account = tables.DBAccount(uuid=make_uuid(hash_point(nickname)), nickname=nickname, state_version=0)
+        result = await session.execute(
+            statements.INSERT_ACCOUNT_IF_MISSING,
+            {"uuid": account.uuid, "nickname": account.nickname, "state_version": account.state_version},
+        )
+        if result.rowcount != 1:
+            return None
 
-    async def create_balance_record_for_account(
-        self, session: AsyncSession, account: tables.DBAccount
-    ) -> tables.DBAccountBalance:
-        balance = tables.DBAccountBalance(account=account.id)
-        session.add(balance)
-        await session.flush()
-        await session.refresh(balance)
+        account.id = result.inserted_primary_key[0]
+        await session.execute(
+            statements.INSERT_ACCOUNT_BALANCE, {"account": account.id, "balance_cents": balance_cents}
+        )
 
-        return balance
+        return account
 
     async def find_account_by_nickname(self, session: AsyncSession, nickname: str) -> Optional[tables.DBAccount]:
-        return (await session.execute(select(tables.DBAccount).where(tables.DBAccount.nickname == nickname))).scalar()
+        return (await session.execute(statements.SELECT_ACCOUNT_BY_NICKNAME, {"nickname": nickname})).scalar()
 
     async def find_account_by_session(self, session: AsyncSession, account_session: uuid.UUID) -> tables.DBAccount:
         db_account_session = (
-            await session.execute(
-                select(tables.DBAccountSession).where(tables.DBAccountSession.uuid == account_session)
-            )
+            await session.execute(statements.SELECT_ACCOUNT_SESSION_BY_UUID, {"session_uuid": account_session})
         ).scalar()
         if not db_account_session:
             raise errors.AccountSessionNotFound()
+        if self.session_ttl and db_account_session.created < tables.utcnow() - self.session_ttl:
+            raise errors.AccountSessionExpired()
 
         account = (
-            await session.execute(select(tables.DBAccount).where(tables.DBAccount.id == db_account_session.account))
+            await session.execute(statements.SELECT_ACCOUNT_BY_ID, {"account_id": db_account_session.account})
         ).scalar()
         if not account:
             raise errors.AccountNotExist()
 
         return account
 
+    # Work with account state version
+
+    async def bump_state_version(
+        self,
+        session: AsyncSession,
+        account: tables.DBAccount,
+        shop_item: Optional[tables.DBShopItem] = None,
+        added: bool = True,
+    ) -> int:
+        #  Incremented by DBMS, so that concurrent changes of one account never get the same version
+        account.state_version = tables.DBAccount.state_version + 1
+        await session.flush()
+        await session.refresh(account, ["state_version"])
+
+        if shop_item is not None:
+            session.add(
+                tables.DBAccountItemChange(
+                    account=account.id, version=account.state_version, shop_item=shop_item.id, added=added
+                )
+            )
+            if account.state_version % self.ITEM_CHANGES_PRUNE_PERIOD == 0:
+                await session.execute(
+                    statements.DELETE_ITEM_CHANGES_BEFORE,
+                    {"account_id": account.id, "version": account.state_version - self.ITEM_CHANGES_HISTORY},
+                )
+            await session.flush()
+
+        return account.state_version
+
+    async def get_item_changes_since(
+        self, session: AsyncSession, account: tables.DBAccount, known_version: int
+    ) -> List[Tuple[tables.DBShopItem, bool]]:
+        rows = await session.execute(
+            statements.SELECT_ITEM_CHANGES_SINCE, {"account_id": account.id, "known_version": known_version}
+        )
+        return list(rows.tuples())
+
     # Work with account balance
 
     async def get_account_balance(self, session: AsyncSession, account: tables.DBAccount) -> tables.DBAccountBalance:
         account_balance = (
-            await session.execute(select(tables.DBAccountBalance).where(tables.DBAccountBalance.account == account.id))
+            await session.execute(statements.SELECT_ACCOUNT_BALANCE, {"account_id": account.id})
         ).scalar()
         if not account_balance:
             raise errors.AccountBalanceNotFound(account.id)
 
         return account_balance
 
-    async def add_balance_to_account(self, session: AsyncSession, account: tables.DBAccount, amount: float) -> None:
-        assert amount >= 0
+    async def add_balance_to_account(
+        self, session: AsyncSession, account: tables.DBAccount, amount_cents: int
+    ) -> tables.DBAccountBalance:
+        assert amount_cents >= 0
         account_balance = (
-            await session.execute(select(tables.DBAccountBalance).where(tables.DBAccountBalance.account == account.id))
+            await session.execute(statements.SELECT_ACCOUNT_BALANCE, {"account_id": account.id})
         ).scalar()
         if not account_balance:
             raise errors.AccountBalanceNotFound(account.id)
 
-        account_balance.balance = float(account_balance.balance) + amount
+        account_balance.balance_cents += amount_cents
         await session.flush()
 
+        return account_balance
+
     async def substitute_balance_from_account(
-        self, session: AsyncSession, account: tables.DBAccount, amount: float
-    ) -> None:
-        assert amount >= 0
+        self, session: AsyncSession, account: tables.DBAccount, amount_cents: int
+    ) -> tables.DBAccountBalance:
+        assert amount_cents >= 0
         account_balance = (
-            await session.execute(select(tables.DBAccountBalance).where(tables.DBAccountBalance.account == account.id))
+            await session.execute(statements.SELECT_ACCOUNT_BALANCE, {"account_id": account.id})
         ).scalar()
         if not account_balance:
             raise errors.AccountBalanceNotFound(account.id)
 
-        if account_balance.balance < amount:
-            raise errors.NotEnoughFundsInAccountBalance(amount)
+        if account_balance.balance_cents < amount_cents:
+            raise errors.NotEnoughFundsInAccountBalance(amount_cents)
 
-        account_balance.balance = float(account_balance.balance) - amount
+        account_balance.balance_cents -= amount_cents
         await session.flush()
 
-    async def set_balance_for_account(self, session: AsyncSession, account: tables.DBAccount, amount: float) -> None:
-        assert amount >= 0
+        return account_balance
+
+    async def set_balance_for_account(
+        self, session: AsyncSession, account: tables.DBAccount, amount_cents: int
+    ) -> tables.DBAccountBalance:
+        assert amount_cents >= 0
         account_balance = (
-            await session.execute(select(tables.DBAccountBalance).where(tables.DBAccountBalance.account == account.id))
+            await session.execute(statements.SELECT_ACCOUNT_BALANCE, {"account_id": account.id})
         ).scalar()
         if not account_balance:
             raise errors.AccountBalanceNotFound(account.id)
 
-        account_balance.balance = amount
+        account_balance.balance_cents = amount_cents
         await session.flush()
 
+        return account_balance
+
     # Work with item ownership
 
     async def add_item_ownership_to_account(
@@ -209,9 +384,7 @@ class DBManager:
     ) -> None:
         shop_item2account = (
             await session.execute(
-                select(tables.DBShopItem2Account)
-                .where(tables.DBShopItem2Account.account == account.id)
-                .where(tables.DBShopItem2Account.shop_item == shop_item.id)
+                statements.SELECT_ITEM_OWNERSHIP, {"account_id": account.id, "shop_item_id": shop_item.id}
             )
         ).scalar()
 
@@ -227,9 +400,7 @@ class DBManager:
     ) -> None:
         shop_item2account = (
             await session.execute(
-                select(tables.DBShopItem2Account)
-                .where(tables.DBShopItem2Account.account == account.id)
-                .where(tables.DBShopItem2Account.shop_item == shop_item.id)
+                statements.SELECT_ITEM_OWNERSHIP, {"account_id": account.id, "shop_item_id": shop_item.id}
             )
         ).scalar()
 
@@ -240,9 +411,9 @@ class DBManager:
 
     async def find_item_by_uuid(self, session: AsyncSession, item_uuid: uuid.UUID) -> tables.DBShopItem:
         shop_item = (
-            await session.execute(select(tables.DBShopItem).where(tables.DBShopItem.uuid == item_uuid))
+            await session.execute(statements.SELECT_SHOP_ITEM_BY_UUID, {"item_uuid": item_uuid})
         ).scalar()
         if not shop_item:
-            raise errors.ShopItemNotFound(item_uuid)
+            raise errors.ShopItemNotFound(str(item_uuid))
 
         return shop_item
@@ -0,0 +1,182 @@
+import logging
+from typing import Callable, List, NamedTuple
+import uuid
+
+from sqlalchemy import (
+    BINARY,
+    Column,
+    Connection,
+    MetaData,
+    String,
+    Table,
+    bindparam,
+    func,
+    inspect,
+    insert,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.schema import CreateColumn
+
+from gameserver.db import tables
+
+#  Every migration must be idempotent: the first one creates missing tables in their latest shape, so on a fresh
+#  database the following ones only find that there is nothing left to do
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    def decorator(func_: Callable[[Connection], None]) -> Callable[[Connection], None]:
+        assert not MIGRATIONS or MIGRATIONS[-1].version < version, "Migrations must be registered in order"
+        MIGRATIONS.append(Migration(version, description, func_))
+        return func_
+
+    return decorator
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version
+
+
+def get_schema_version(conn: Connection) -> int:
+    if not inspect(conn).has_table(tables.DBSchemaVersion.__tablename__):
+        return 0
+    return conn.execute(select(func.max(tables.DBSchemaVersion.version))).scalar() or 0
+
+
+def migrate(conn: Connection) -> int:
+    tables.DBSchemaVersion.__table__.create(conn, checkfirst=True)
+    current_version = get_schema_version(conn)
+
+    for pending in MIGRATIONS:
+        if pending.version <= current_version:
+            continue
+        logging.info("Applying migration %d: %s", pending.version, pending.description)
+        pending.apply(conn)
+        conn.execute(insert(tables.DBSchemaVersion).values(version=pending.version, description=pending.description))
+        current_version = pending.version
+
+    return current_version
+
+
+#  Steps of migrations, which can not be applied in one transaction, as DDL commits at once on MySQL
+MIGRATION_STEPS = Table("gm_migration_step", MetaData(), Column("name", String(64), primary_key=True))
+
+
+def is_step_done(conn: Connection, name: str) -> bool:
+    return conn.execute(select(MIGRATION_STEPS.c.name).where(MIGRATION_STEPS.c.name == name)).first() is not None
+
+
+def mark_step_done(conn: Connection, name: str) -> None:
+    conn.execute(insert(MIGRATION_STEPS).values(name=name))
+
+
+def create_missing_indexes(conn: Connection, table: Table) -> None:
+    inspector = inspect(conn)
+    existing = {index["name"] for index in inspector.get_indexes(table.name)}
+    existing.update(constraint["name"] for constraint in inspector.get_unique_constraints(table.name))
+
+    for index in table.indexes:
+        if index.name not in existing:
+            logging.info("Creating index %s on %s", index.name, table.name)
+            index.create(conn)
+
+
+def add_missing_column(conn: Connection, column: Column) -> None:
+    if column.name in {existing["name"] for existing in inspect(conn).get_columns(column.table.name)}:
+        return
+    logging.info("Adding column %s to %s", column.name, column.table.name)
+    column_ddl = CreateColumn(column).compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {column.table.name} ADD COLUMN {column_ddl}"))
+
+
+@migration(1, "Initial schema")
+def _initial_schema(conn: Connection) -> None:
+    tables.BaseTable.metadata.create_all(conn, checkfirst=True)
+
+
+@migration(2, "Composite unique constraints and covering indexes")
+def _composite_indexes(conn: Connection) -> None:
+    # Unique constraint on ownership was never created, so duplicated rows may exist. Keep the oldest ones
+    conn.execute(
+        text(
+            "DELETE FROM gm_shop_item2account WHERE id NOT IN "
+            "(SELECT id FROM (SELECT MIN(id) AS id FROM gm_shop_item2account GROUP BY account, shop_item) AS keep)"
+        )
+    )
+    for table in tables.BaseTable.metadata.sorted_tables:
+        create_missing_indexes(conn, table)
+
+
+@migration(3, "Account state versions and owned items change log")
+def _account_state_versions(conn: Connection) -> None:
+    add_missing_column(conn, tables.DBAccount.__table__.c.state_version)
+    tables.DBAccountItemChange.__table__.create(conn, checkfirst=True)
+    create_missing_indexes(conn, tables.DBAccountItemChange.__table__)
+
+
+@migration(4, "Money in integer cents")
+def _money_in_cents(conn: Connection) -> None:
+    add_missing_column(conn, tables.DBAccountBalance.__table__.c.balance_cents)
+    #  Old float balance column only exists in databases created before this migration, so does the price in credits
+    if "balance" not in {column["name"] for column in inspect(conn).get_columns("gm_account_balance")}:
+        return
+    #  DDL commits at once on MySQL, so a run, which has been interrupted, may leave any of these steps done. Prices
+    #  are converted before the old column is dropped, and are marked so in the same transaction, so that a run, which
+    #  is repeated, neither converts them twice nor skips them
+    MIGRATION_STEPS.create(conn, checkfirst=True)
+    if not is_step_done(conn, "prices_in_cents"):
+        conn.execute(text("UPDATE gm_shop_item SET price = price * 100"))
+        mark_step_done(conn, "prices_in_cents")
+    conn.execute(text("UPDATE gm_account_balance SET balance_cents = ROUND(balance * 100)"))
+    conn.execute(text("ALTER TABLE gm_account_balance DROP COLUMN balance"))
+
+
+@migration(5, "Binary uuids")
+def _binary_uuids(conn: Connection) -> None:
+    for table in (tables.DBShopItem.__table__, tables.DBAccount.__table__, tables.DBAccountSession.__table__):
+        if conn.dialect.name == "mysql":
+            _convert_mysql_uuid_column(conn, table)
+        else:
+            _convert_uuid_values(conn, table)
+
+
+#  MySQL keeps declared column types, so the column is rebuilt as BINARY(16) along with its unique index
+def _convert_mysql_uuid_column(conn: Connection, table: Table) -> None:
+    column_type = {column["name"]: column["type"] for column in inspect(conn).get_columns(table.name)}["uuid"]
+    if isinstance(column_type, BINARY):
+        return
+    logging.info("Converting %s.uuid to BINARY(16)", table.name)
+    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN uuid_binary BINARY(16)"))
+    conn.execute(text(f"UPDATE {table.name} SET uuid_binary = UNHEX(uuid)"))
+    conn.execute(text(f"ALTER TABLE {table.name} DROP COLUMN uuid"))
+    conn.execute(text(f"ALTER TABLE {table.name} CHANGE COLUMN uuid_binary uuid BINARY(16) NOT NULL AFTER id"))
+    conn.execute(text(f"ALTER TABLE {table.name} ADD UNIQUE (uuid)"))
+
+
+#  SQLite stores any value in any column, so hex strings are just replaced with their bytes in place
+def _convert_uuid_values(conn: Connection, table: Table, batch_size: int = 1000) -> None:
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text(f"SELECT id, uuid FROM {table.name} WHERE id > :last_id ORDER BY id LIMIT :batch_size"),
+            {"last_id": last_id, "batch_size": batch_size},
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+
+        converted = [{"row_id": row.id, "new_uuid": uuid.UUID(row.uuid)} for row in rows if isinstance(row.uuid, str)]
+        if converted:
+            conn.execute(
+                update(table).where(table.c.id == bindparam("row_id")).values(uuid=bindparam("new_uuid")), converted
+            )
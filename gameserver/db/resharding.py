@@ -0,0 +1,130 @@
+import logging
+
+from sqlalchemy import delete, select
+
+from gameserver.db.manager import DBManager
+from gameserver.db import tables, statements
+
+#  Offline resharding: server must be stopped, as accounts are copied to their new shard and only then deleted from
+#  the old one. Interrupted run can be safely restarted, accounts which are already copied are not copied again
+
+
+async def copy_shop_items(source: DBManager, target: DBManager) -> None:
+    async with source.sessionmaker() as session:
+        shop_items = [item.to_shop_item_model() for item in await source.get_shop_items_list(session)]
+
+    for sessionmaker in target.sessionmakers:
+        async with sessionmaker.begin() as session:
+            for shop_item in shop_items:
+                await target.add_shop_item(session, shop_item)
+
+
+async def move_account(  #  pylint: disable=too-many-locals
+    source: DBManager, source_index: int, target: DBManager, account: tables.DBAccount
+) -> None:
+    target_index = target.ring.shard_for_nickname(account.nickname)
+    source_sessionmaker = source.sessionmakers[source_index]
+
+    async with source_sessionmaker() as session:
+        balance = (await session.execute(statements.SELECT_ACCOUNT_BALANCE, {"account_id": account.id})).scalar()
+        owned_items = (await session.execute(statements.SELECT_OWNED_SHOP_ITEMS, {"account_id": account.id})).scalars()
+        owned_item_uuids = [shop_item.uuid for shop_item in owned_items]
+        # Change log is moved along with state version, so that clients keep getting deltas
+        item_changes = [
+            (shop_item.uuid, version, added)
+            for shop_item, version, added in await session.execute(
+                select(tables.DBShopItem, tables.DBAccountItemChange.version, tables.DBAccountItemChange.added)
+                .join(tables.DBAccountItemChange, tables.DBAccountItemChange.shop_item == tables.DBShopItem.id)
+                .where(tables.DBAccountItemChange.account == account.id)
+            )
+        ]
+        account_sessions = (
+            (
+                await session.execute(
+                    select(tables.DBAccountSession).where(tables.DBAccountSession.account == account.id)
+                )
+            )
+            .scalars()
+            .all()
+        )
+
+    async with target.sessionmakers[target_index].begin() as session:
+        if not (await session.execute(statements.SELECT_ACCOUNT_BY_NICKNAME, {"nickname": account.nickname})).scalar():
+            new_account = tables.DBAccount(
+                uuid=account.uuid, nickname=account.nickname, state_version=account.state_version
+            )
+            session.add(new_account)
+            await session.flush()
+
+            balance_cents = balance.balance_cents if balance else 0
+            session.add(tables.DBAccountBalance(account=new_account.id, balance_cents=balance_cents))
+            for item_uuid in owned_item_uuids:
+                shop_item = (
+                    await session.execute(statements.SELECT_SHOP_ITEM_BY_UUID, {"item_uuid": item_uuid})
+                ).scalar()
+                session.add(tables.DBShopItem2Account(account=new_account.id, shop_item=shop_item.id))
+            for item_uuid, version, added in item_changes:
+                shop_item = (
+                    await session.execute(statements.SELECT_SHOP_ITEM_BY_UUID, {"item_uuid": item_uuid})
+                ).scalar()
+                session.add(
+                    tables.DBAccountItemChange(
+                        account=new_account.id, version=version, shop_item=shop_item.id, added=added
+                    )
+                )
+            # Sessions, which would not be routed to the new shard, are dropped. Their owners have to login again
+            for account_session in account_sessions:
+                if target.ring.shard_for_uuid(account_session.uuid) == target_index:
+                    session.add(
+                        tables.DBAccountSession(
+                            uuid=account_session.uuid, created=account_session.created, account=new_account.id
+                        )
+                    )
+
+    async with source_sessionmaker.begin() as session:
+        for table in (
+            tables.DBShopItem2Account,
+            tables.DBAccountItemChange,
+            tables.DBAccountBalance,
+            tables.DBAccountSession,
+        ):
+            await session.execute(delete(table).where(table.account == account.id))
+        await session.execute(delete(tables.DBAccount).where(tables.DBAccount.id == account.id))
+
+
+async def reshard(source: DBManager, target: DBManager, batch_size: int = 500) -> int:
+    await copy_shop_items(source, target)
+
+    target_shards = target.settings.all_shards
+    moved = 0
+    for source_index, source_shard in enumerate(source.settings.all_shards):
+        last_id = 0
+        while True:
+            async with source.sessionmakers[source_index]() as session:
+                accounts = (
+                    (
+                        await session.execute(
+                            select(tables.DBAccount)
+                            .where(tables.DBAccount.id > last_id)
+                            .order_by(tables.DBAccount.id)
+                            .limit(batch_size)
+                        )
+                    )
+                    .scalars()
+                    .all()
+                )
+            if not accounts:
+                break
+            last_id = accounts[-1].id
+
+            for account in accounts:
+                target_index = target.ring.shard_for_nickname(account.nickname)
+                if target_shards[target_index].shard_key == source_shard.shard_key:
+                    continue
+
+                await move_account(source, source_index, target, account)
+                moved += 1
+
+        logging.info("Processed shard %s, moved %d accounts so far", source_shard.shard_key, moved)
+
+    return moved
@@ -1,11 +1,38 @@
+from typing import List, Optional
+
 from pydantic import BaseModel, Field
 from pydantic.networks import IPvAnyAddress
 
 
-class DBSettings(BaseModel):
+class DBShardSettings(BaseModel):
     db_type: str
-    host: IPvAnyAddress
-    port: int = Field(gt=0)
-    user: str
-    password: str #  It is better to hide this in .env file for security reasons
+    host: Optional[IPvAnyAddress] = None
+    port: Optional[int] = Field(default=None, gt=0)
+    user: Optional[str] = None
+    password: Optional[str] = None #  It is better to hide this in .env file for security reasons
+    database: str = "gmdb" #  Path to database file for sqlite
+
+    @property
+    def url(self) -> str:
+        if self.db_type == "mysql":
+            return f"mysql+aiomysql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}?charset=utf8mb4" #  pylint: disable=line-too-long
+        if self.db_type == "sqlite":
+            return f"sqlite+aiosqlite:///{self.database}"
+        raise NotImplementedError("Unsupported DB type")
+
+    #  Identifies shard on the hash ring, so it must not change while shard holds any accounts
+    @property
+    def shard_key(self) -> str:
+        if self.db_type == "sqlite":
+            return self.database
+        return f"{self.host}:{self.port}/{self.database}"
+
+
+class DBSettings(DBShardSettings):
     is_test_env: bool
+    #  Accounts are spread across these databases. When empty, the database above is the only shard
+    shards: List[DBShardSettings] = Field(default_factory=list)
+
+    @property
+    def all_shards(self) -> List[DBShardSettings]:
+        return self.shards or [self]
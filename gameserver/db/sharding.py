@@ -0,0 +1,45 @@
+import bisect
+import hashlib
+from typing import List
+import uuid
+
+#  Accounts are placed on a consistent hash ring by their nickname. Every account and session uuid carries the ring
+#  point of its account in the first 4 bytes (uuid4 version and variant bits are left untouched), so requests
+#  holding only a session uuid are routed to the right shard without any global lookup
+
+VIRTUAL_NODES = 64
+
+
+def hash_point(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+def point_of_uuid(value: uuid.UUID) -> int:
+    return int.from_bytes(value.bytes[:4], "big")
+
+
+def make_uuid(point: int) -> uuid.UUID:
+    return uuid.UUID(bytes=point.to_bytes(4, "big") + uuid.uuid4().bytes[4:])
+
+
+class HashRing:
+    def __init__(self, shard_keys: List[str], virtual_nodes: int = VIRTUAL_NODES) -> None:
+        assert shard_keys, "At least one shard is required"
+        assert len(set(shard_keys)) == len(shard_keys), "Shard keys must be unique"
+
+        ring = sorted(
+            (hash_point(f"{shard_key}#{vnode}"), index)
+            for index, shard_key in enumerate(shard_keys)
+            for vnode in range(virtual_nodes)
+        )
+        self._points = [point for point, _ in ring]
+        self._shards = [index for _, index in ring]
+
+    def shard_for_point(self, point: int) -> int:
+        return self._shards[bisect.bisect(self._points, point) % len(self._points)]
+
+    def shard_for_nickname(self, nickname: str) -> int:
+        return self.shard_for_point(hash_point(nickname))
+
+    def shard_for_uuid(self, value: uuid.UUID) -> int:
+        return self.shard_for_point(point_of_uuid(value))
@@ -0,0 +1,160 @@
+import datetime
+from typing import Any, Dict, List, Tuple
+import uuid
+
+from sqlalchemy import Connection, Executable, Integer, bindparam, delete, event, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.interfaces import CacheStats
+
+from gameserver.db import tables
+
+#  Statements are built once at import time and executed with bound parameters. Hot paths skip the construction
+#  of select() objects and the engine finds their compiled form in its cache on every call after the first one
+
+SELECT_ALL_SHOP_ITEMS = select(tables.DBShopItem)
+
+SELECT_SHOP_ITEM_BY_UUID = select(tables.DBShopItem).where(tables.DBShopItem.uuid == bindparam("item_uuid"))
+
+SELECT_SHOP_ITEM_BY_NAME_AND_PRICE = (
+    select(tables.DBShopItem)
+    .where(tables.DBShopItem.name == bindparam("name"))
+    .where(tables.DBShopItem.price == bindparam("price"))
+)
+
+INSERT_SHOP_ITEMS = insert(tables.DBShopItem)
+
+#  Executed with a list of parameters, one per changed item. Items are matched by uuid, as ids differ between shards
+UPDATE_SHOP_ITEMS_BY_UUID = (
+    update(tables.DBShopItem.__table__)
+    .where(tables.DBShopItem.__table__.c.uuid == bindparam("item_uuid"))
+    .values(name=bindparam("new_name"), price=bindparam("new_price"), type=bindparam("new_type"))
+)
+
+SELECT_OWNED_SHOP_ITEMS = (
+    select(tables.DBShopItem)
+    .join(tables.DBShopItem2Account, tables.DBShopItem2Account.shop_item == tables.DBShopItem.id)
+    .where(tables.DBShopItem2Account.account == bindparam("account_id"))
+)
+
+SELECT_ACCOUNT_BY_ID = select(tables.DBAccount).where(tables.DBAccount.id == bindparam("account_id"))
+
+SELECT_ACCOUNT_BY_NICKNAME = select(tables.DBAccount).where(tables.DBAccount.nickname == bindparam("nickname"))
+
+#  Locking read sees rows committed by other transactions after this one has started. SQLite drops the clause, as it
+#  serializes writers anyway
+SELECT_ACCOUNT_BY_NICKNAME_FOR_SHARE = SELECT_ACCOUNT_BY_NICKNAME.with_for_update(read=True)
+
+#  Insert, which loses the race for the nickname to a concurrent one, is ignored instead of failing the transaction
+INSERT_ACCOUNT_IF_MISSING = (
+    insert(tables.DBAccount.__table__).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+)
+
+INSERT_ACCOUNT_BALANCE = insert(tables.DBAccountBalance.__table__)
+
+INSERT_ACCOUNT_SESSION = insert(tables.DBAccountSession.__table__)
+
+SELECT_ACCOUNT_SESSION_BY_UUID = select(tables.DBAccountSession).where(
+    tables.DBAccountSession.uuid == bindparam("session_uuid")
+)
+
+SELECT_EXPIRED_ACCOUNT_SESSION_IDS = (
+    select(tables.DBAccountSession.id)
+    .where(tables.DBAccountSession.created < bindparam("created_before"))
+    .order_by(tables.DBAccountSession.created)
+    .limit(bindparam("batch_size", type_=Integer))
+)
+
+#  Sessions of account past the newest `keep` ones
+SELECT_STALE_ACCOUNT_SESSION_IDS = (
+    select(tables.DBAccountSession.id)
+    .where(tables.DBAccountSession.account == bindparam("account_id"))
+    .order_by(tables.DBAccountSession.id.desc())
+    .offset(bindparam("keep", type_=Integer))
+)
+
+DELETE_ACCOUNT_SESSIONS_BY_IDS = (
+    delete(tables.DBAccountSession)
+    .where(tables.DBAccountSession.id.in_(bindparam("ids", expanding=True)))
+    .execution_options(synchronize_session=False)
+)
+
+SELECT_ITEM_CHANGES_SINCE = (
+    select(tables.DBShopItem, tables.DBAccountItemChange.added)
+    .join(tables.DBAccountItemChange, tables.DBAccountItemChange.shop_item == tables.DBShopItem.id)
+    .where(tables.DBAccountItemChange.account == bindparam("account_id"))
+    .where(tables.DBAccountItemChange.version > bindparam("known_version"))
+    .order_by(tables.DBAccountItemChange.version)
+)
+
+DELETE_ITEM_CHANGES_BEFORE = (
+    delete(tables.DBAccountItemChange)
+    .where(tables.DBAccountItemChange.account == bindparam("account_id"))
+    .where(tables.DBAccountItemChange.version <= bindparam("version"))
+    .execution_options(synchronize_session=False)
+)
+
+SELECT_ACCOUNT_BALANCE = select(tables.DBAccountBalance).where(
+    tables.DBAccountBalance.account == bindparam("account_id")
+)
+
+SELECT_ITEM_OWNERSHIP = (
+    select(tables.DBShopItem2Account)
+    .where(tables.DBShopItem2Account.account == bindparam("account_id"))
+    .where(tables.DBShopItem2Account.shop_item == bindparam("shop_item_id"))
+)
+
+
+#  Hot statements with sample parameters, used to report their query plans
+HOT_STATEMENTS: Dict[str, Tuple[Executable, Dict[str, Any]]] = {
+    "add_shop_item": (SELECT_SHOP_ITEM_BY_NAME_AND_PRICE, {"name": "Sampson", "price": 24}),
+    "find_item_by_uuid": (SELECT_SHOP_ITEM_BY_UUID, {"item_uuid": uuid.uuid4()}),
+    "get_user_owned_items_list": (SELECT_OWNED_SHOP_ITEMS, {"account_id": 1}),
+    "find_account_by_nickname": (SELECT_ACCOUNT_BY_NICKNAME, {"nickname": "rickastley"}),
+    "find_account_by_session": (SELECT_ACCOUNT_SESSION_BY_UUID, {"session_uuid": uuid.uuid4()}),
+    "find_account_by_id": (SELECT_ACCOUNT_BY_ID, {"account_id": 1}),
+    "get_account_balance": (SELECT_ACCOUNT_BALANCE, {"account_id": 1}),
+    "get_item_changes_since": (SELECT_ITEM_CHANGES_SINCE, {"account_id": 1, "known_version": 1}),
+    "find_item_ownership": (SELECT_ITEM_OWNERSHIP, {"account_id": 1, "shop_item_id": 1}),
+    "purge_expired_sessions": (
+        SELECT_EXPIRED_ACCOUNT_SESSION_IDS,
+        {"created_before": datetime.datetime(2000, 1, 1), "batch_size": 1000},
+    ),
+    "create_account_session": (SELECT_STALE_ACCOUNT_SESSION_IDS, {"account_id": 1, "keep": 16}),
+}
+
+
+def explain(conn: Connection, statement: Executable, params: Dict[str, Any]) -> List[str]:
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    compiled = statement.params(**params).compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    #  Some dialects render constants like SQLite's "LIMIT -1" as binds even with literal_binds
+    remaining_params = tuple(compiled.params[name] for name in compiled.positiontup or ())
+    rows = conn.exec_driver_sql(prefix + str(compiled), remaining_params)
+    return [" | ".join(str(column) for column in row) for row in rows]
+
+
+#  Counts compiled cache hits and misses of every statement executed by an engine
+class CompiledCacheStats:
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def attach(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._on_cursor_execute)
+
+    def reset(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    #  pylint: disable=too-many-arguments,too-many-positional-arguments,unused-argument
+    def _on_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if context is None:
+            return
+        if context.cache_hit is CacheStats.CACHE_HIT:
+            self.hits += 1
+        elif context.cache_hit is CacheStats.CACHE_MISS:
+            self.misses += 1
@@ -1,13 +1,45 @@
 import datetime
 import uuid
 
-from sqlalchemy import String, Enum, Uuid, DateTime, ForeignKey, Numeric, UniqueConstraint
+from sqlalchemy import BINARY, BigInteger, String, Enum, Uuid, DateTime, ForeignKey, Index, Boolean, TypeDecorator
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.sql import func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from gameserver.misc.models import ShopItemType, ShopItem
 
 
+#  Timestamps are written by application in UTC, so that they do not depend on DBMS timezone settings
+def utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+#  Uuids are stored as 16 raw bytes instead of 32 hex characters, which keeps rows and unique indexes on them narrow
+class BinaryUuid(TypeDecorator):  #  pylint: disable=too-many-ancestors,abstract-method
+    impl = BINARY(16)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return value.bytes
+
+    def process_result_value(self, value, dialect):
+        return uuid.UUID(bytes=bytes(value)) if value is not None else None
+
+    #  Hex literal is understood by both MySQL and SQLite
+    def literal_processor(self, dialect):
+        def process(value):
+            return f"X'{uuid.UUID(str(value)).hex}'" if value is not None else "NULL"
+
+        return process
+
+    @property
+    def python_type(self):
+        return uuid.UUID
+
+
 #  Do not put id column definition, as it gets dragged to the end in DBMS. Embrace breaking DRY
 class BaseTable(AsyncAttrs, DeclarativeBase): #  pylint: disable=too-few-public-methods
     __table_args__ = {"mysql_engine": "InnoDB", "mysql_charset": "utf8mb4"}
@@ -15,15 +47,18 @@ class BaseTable(AsyncAttrs, DeclarativeBase): #  pylint: disable=too-few-public-
 
 class DBShopItem(BaseTable):
     __tablename__ = "gm_shop_item"
+    #  Columns are ordered to serve lookups by (name, price) in add_shop_item
+    __table_args__ = (
+        Index("uix_shop_item_name_price_type", "name", "price", "type", unique=True),
+        BaseTable.__table_args__,
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    uuid: Mapped[Uuid] = mapped_column(Uuid, unique=True, nullable=False, default=uuid.uuid4)
+    uuid: Mapped[Uuid] = mapped_column(BinaryUuid, unique=True, nullable=False, default=uuid.uuid4)
     type: Mapped[ShopItemType] = mapped_column(Enum(ShopItemType))
     name: Mapped[str] = mapped_column(String(64), nullable=False)
     price: Mapped[int] = mapped_column(nullable=False)
 
-    UniqueConstraint(type, name, price, name="uix_1")
-
     def to_shop_item_model(self) -> ShopItem:
         return ShopItem(uuid=self.uuid, name=self.name, type=self.type, price=self.price)
 
@@ -33,8 +68,10 @@ class DBAccount(BaseTable):
     __tablename__ = "gm_account"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    uuid: Mapped[Uuid] = mapped_column(Uuid, unique=True, nullable=False, default=uuid.uuid4)
+    uuid: Mapped[Uuid] = mapped_column(BinaryUuid, unique=True, nullable=False, default=uuid.uuid4)
     nickname: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    #  Incremented on every change of balance or owned items
+    state_version: Mapped[int] = mapped_column(nullable=False, default=0, server_default="0")
 
 
 #  pylint: disable=too-few-public-methods
@@ -42,9 +79,11 @@ class DBAccountSession(BaseTable):
     __tablename__ = "gm_account_session"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    uuid: Mapped[Uuid] = mapped_column(Uuid, unique=True, nullable=False, default=uuid.uuid4)
-    created: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=False), server_default=func.now()) #  pylint: disable=not-callable
-    account: Mapped[int] = mapped_column(ForeignKey(DBAccount.id))
+    uuid: Mapped[Uuid] = mapped_column(BinaryUuid, unique=True, nullable=False, default=uuid.uuid4)
+    created: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=False), default=utcnow, server_default=func.now(), index=True #  pylint: disable=not-callable
+    )
+    account: Mapped[int] = mapped_column(ForeignKey(DBAccount.id), index=True)
 
 
 #  Make balance separate table as in real world you probably take billing data from another service
@@ -53,15 +92,43 @@ class DBAccountBalance(BaseTable): #  pylint: disable=too-few-public-methods
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     account: Mapped[int] = mapped_column(ForeignKey(DBAccount.id), unique=True)
-    balance: Mapped[float] = mapped_column(Numeric(precision=10, scale=2, asdecimal=False), default=0.0)
+    #  Money is stored in integer cents, so that balance math never drifts
+    balance_cents: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
 
 
 #  pylint: disable=too-few-public-methods
 class DBShopItem2Account(BaseTable):
     __tablename__ = "gm_shop_item2account"
+    #  Serves lookups both by (account, shop_item) and by account only
+    __table_args__ = (
+        Index("uix_shop_item2account_account_shop_item", "account", "shop_item", unique=True),
+        BaseTable.__table_args__,
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    account: Mapped[int] = mapped_column(ForeignKey(DBAccount.id))
+    shop_item: Mapped[int] = mapped_column(ForeignKey(DBShopItem.id))
+
+
+#  Log of owned items changes, which lets clients fetch only changes since the state version they know
+class DBAccountItemChange(BaseTable): #  pylint: disable=too-few-public-methods
+    __tablename__ = "gm_account_item_change"
+    __table_args__ = (
+        Index("ix_account_item_change_account_version", "account", "version"),
+        BaseTable.__table_args__,
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     account: Mapped[int] = mapped_column(ForeignKey(DBAccount.id))
+    version: Mapped[int] = mapped_column(nullable=False)
     shop_item: Mapped[int] = mapped_column(ForeignKey(DBShopItem.id))
+    added: Mapped[bool] = mapped_column(Boolean, nullable=False)
+
+
+#  pylint: disable=too-few-public-methods
+class DBSchemaVersion(BaseTable):
+    __tablename__ = "gm_schema_version"
 
-    UniqueConstraint(account, shop_item, name="uix_1")
+    version: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    description: Mapped[str] = mapped_column(String(256), nullable=False)
+    applied: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=False), default=utcnow)
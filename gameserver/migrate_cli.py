@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import logging
+
+from gameserver.db import DBManager
+from gameserver.misc.settings import make_settings_parser, validate_settings
+
+
+def parse_args() -> argparse.Namespace:
+    parser = make_settings_parser()
+    parser.add_argument(
+        "--explain",
+        dest="explain",
+        action="store_true",
+        help="Print query plans of hot queries after migrating",
+    )
+    parser.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="Only report schema version without applying migrations",
+    )
+
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    settings = validate_settings(args.settings_path)
+    db = DBManager(settings.db_settings)
+    await db.init_db_engine(migrate=False)
+
+    try:
+        logging.info("Current schema version: %d", await db.get_schema_version())
+        if not args.dry_run:
+            logging.info("Migrated to schema version: %d", await db.migrate())
+
+        if args.explain:
+            for name, plan in (await db.explain_hot_queries()).items():
+                print(name)
+                for row in plan:
+                    print("   ", row)
+    finally:
+        await db.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -1,76 +1,93 @@
+import binascii
 import logging
 import asyncio
 from typing import AsyncGenerator
-from io import BytesIO
-from pydantic import ValidationError
 
 from gameserver.misc.models import ErrorResponse
 from gameserver.misc.protocol import Protocol, ProtocolResponse
 from gameserver.misc import errors
 
+#  Bytes of pushed frames, which may wait in the write buffer of a peer, who does not read them fast enough
+MAX_PUSH_BUFFER_SIZE = 4 * 1024 * 1024
+
 
 class Connection:
-    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        max_push_buffer_size: int = MAX_PUSH_BUFFER_SIZE,
+    ) -> None:
         self.reader = reader
         self.writer = writer
         self.is_closed = False
+        #  Request has been read, and its response is not sent yet
+        self.is_busy = False
+        self.max_push_buffer_size = max_push_buffer_size
+        #  Size of the response, which is being drained, it is not counted against the limit of pushed frames
+        self._sending = 0
 
+    #  Frames are read exactly by their header, so that frames pushed back to back are never mixed up
     async def listen(self) -> AsyncGenerator[bytes, None]:
-        msglen = 0
-        readlen = 0
-        message = BytesIO()
         logging.debug("Begin reading")
         while True:
-            msg = await self.reader.read(Protocol.CHUNK_SIZE)
-            if self.reader.at_eof():
+            try:
+                header = await self.reader.readexactly(Protocol.HEADER_TOTAL_SIZE)
+                if not header[: Protocol.HEADER_SIZE].rstrip().isdigit():
+                    await self.send_bad_request()
+                    continue
+                message = await self.reader.readexactly(int(header[: Protocol.HEADER_SIZE]))
+            except (asyncio.IncompleteReadError, OSError):
+                #  Reset by peer, or broken TLS stream
                 break
-            logging.debug("Read chunk")
-
-            if len(msg) < Protocol.HEADER_TOTAL_SIZE:
-                await self.send_bad_request()
-                message.truncate(0)
-                continue
-            if not msg[: Protocol.HEADER_SIZE].rstrip().isdigit():
-                await self.send_bad_request()
-                message.truncate(0)
-                continue
-
-            msglen = int(msg[: Protocol.HEADER_SIZE])
-            readlen += message.write(msg[Protocol.HEADER_TOTAL_SIZE :])
-            while readlen < msglen:
-                msg = await self.reader.read(Protocol.CHUNK_SIZE)
-                readlen += message.write(msg)
 
-            message.seek(0)
-            readlen = 0
-            msglen = 0
             try:
-                parsed_bytes = Protocol.parse(message.read())
-                yield parsed_bytes
-            except ValidationError:
+                parsed_bytes = Protocol.parse(message)
+            except binascii.Error:
                 await self.send_bad_request()
-            finally:
-                message.truncate(0)
+                continue
+            yield parsed_bytes
 
     async def close(self) -> None:
         if self.is_closed:
             return
+        self.is_closed = True
 
         try:
             self.reader.feed_eof()
-            self.writer.write_eof()
+            #  TLS transports can not half-close, they are closed with close_notify below
+            if self.writer.can_write_eof():
+                self.writer.write_eof()
             await self.writer.drain()
-        except ConnectionResetError:
+        except OSError:
+            #  Peer has closed the connection first
             pass
         self.writer.close()
         await self.writer.wait_closed()
-        self.is_closed = True
 
     async def send_bad_request(self) -> None:
-        error = ProtocolResponse(data=ErrorResponse.from_base_gameserver_exception(errors.BadRequest()))
+        error = ProtocolResponse.of(ErrorResponse.from_base_gameserver_exception(errors.BadRequest()))
         self.writer.write(Protocol.construct(error.model_dump()))
         await self.writer.drain()
 
     async def send(self, response: bytes) -> None:
+        #  Response to a request, which has been in flight when connection was closed, goes nowhere
+        if self.is_closed:
+            return
+        self._sending = len(response)
+        try:
+            self.writer.write(response)
+            await self.writer.drain()
+        finally:
+            self._sending = 0
+
+    #  Only buffers the frame, so that a slow peer never blocks the sender. Peer, who lets too much of them pile up,
+    #  is dropped, as skipping some of them would leave it with a state, which is silently wrong
+    def send_nowait(self, response: bytes) -> None:
+        if self.is_closed or self.writer.transport.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() - self._sending + len(response) > self.max_push_buffer_size:
+            logging.warning("Peer does not keep up with pushed frames, dropping connection")
+            self.writer.transport.abort()
+            return
         self.writer.write(response)
-        await self.writer.drain()
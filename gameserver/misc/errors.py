@@ -35,6 +35,21 @@ class UnknownServerError(BaseGameServerException):
         super().__init__("Unknown error on server has happened", 1003, value)
 
 
+class RateLimitExceeded(BaseGameServerException):
+    def __init__(self, value: Optional[str] = None):
+        super().__init__("Too many requests", 1004, value)
+
+
+class DeadlineExceeded(BaseGameServerException):
+    def __init__(self, value: Optional[str] = None):
+        super().__init__("Deadline of request has passed", 1005, value)
+
+
+class IdempotencyKeyReused(BaseGameServerException):
+    def __init__(self, value: Optional[str] = None):
+        super().__init__("Idempotency key has been used for another request", 1006, value)
+
+
 # 51 - 100 - Account errors
 
 
@@ -56,6 +71,11 @@ class AccountSessionNotFound(BaseGameServerException):
         super().__init__("Unathorized", 1001, value)
 
 
+class AccountSessionExpired(BaseGameServerException):
+    def __init__(self, value: Optional[str] = None):
+        super().__init__("Account session has expired", 1101, value)
+
+
 # 151 - 200 - AccountBalance erros
 
 
@@ -88,3 +108,12 @@ class AccountAlreadyOwnsItem(BaseGameServerException):
 class AccountDoesntOwnItem(BaseGameServerException):
     def __init__(self, value: Optional[str] = None):
         super().__init__("Account doesn't have this item", 1252, value)
+
+
+# Client errors, they are raised by Client and never sent by server
+
+
+class ConnectionLost(ConnectionError):
+    def __init__(self, message: str = "Connection to server has been lost"):
+        super().__init__(message)
+        self.message = message
@@ -1,11 +1,17 @@
-from decimal import Decimal
 import enum
 from typing import List, Optional, Generator, Union, Literal, Dict
 
-from pydantic import BaseModel, RootModel, Field, UUID4
+from pydantic import BaseModel, ConfigDict, RootModel, Field, UUID4, model_validator
 
 from gameserver.misc.errors import BaseGameServerException
 
+
+#  Validators and serializers are not built at import time, so that short-lived processes start faster.
+#  They are built by warmup() from protocol before the first request instead of on it
+class DeferredModel(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
+
 # Requests
 
 
@@ -16,14 +22,48 @@ class ActionType(str, enum.Enum):
     LOGOUT = "logout"
     BUY_ITEM = "buy_item"
     SELL_ITEM = "sell_item"
+    SUBSCRIBE = "subscribe"
+    SEARCH_ITEMS = "search_items"
+    STREAM_ITEMS = "stream_items"
+
+
+#  Item is referenced either by its uuid or by its compact handle from the catalog
+class ItemRequest(DeferredModel):
+    item_uuid: Optional[UUID4] = None
+    item_handle: Optional[int] = Field(default=None, ge=0)
+    #  Retried request with the same key gets the result of the first one instead of being applied again
+    idempotency_key: Optional[str] = Field(default=None, min_length=1, max_length=64)
 
+    @model_validator(mode="after")
+    def check_item_reference(self) -> "ItemRequest":
+        if (self.item_uuid is None) == (self.item_handle is None):
+            raise ValueError("Exactly one of item_uuid and item_handle must be set")
+        return self
 
-class ItemRequest(BaseModel):
-    item_uuid: UUID4
 
+#  Items, whose names have every word of query, the last one may be just the start of a word, ranked by name
+class ItemSearchRequest(DeferredModel):
+    query: str = Field(default="", max_length=64)
+    type: Optional["ShopItemType"] = None
+    min_price: Optional[int] = Field(default=None, ge=0)  #  Cents
+    max_price: Optional[int] = Field(default=None, ge=0)  #  Cents
+    limit: int = Field(default=20, gt=0, le=100)
 
-class AccountLoginRequest(BaseModel):
+
+#  Catalog, or items owned by account of the session, sent in frames of chunk_size items each
+class ItemStreamRequest(DeferredModel):
+    owned: bool = False
+    chunk_size: int = Field(default=500, gt=0, le=5000)
+
+
+class AccountLoginRequest(DeferredModel):
     nickname: str = Field(max_length=12)
+    compact: bool = False  #  Owned items are sent as catalog handles
+
+
+class GameSessionRequest(DeferredModel):
+    known_version: Optional[int] = Field(default=None, ge=0)
+    compact: bool = False  #  Owned items are sent as catalog handles
 
 
 # Responses
@@ -34,14 +74,18 @@ class ShopItemType(str, enum.Enum):
     EQUIPMENT = "equipment"
 
 
-class ShopItem(BaseModel):
+class ShopItem(DeferredModel):
     uuid: Optional[UUID4] = Field(default=None)
     name: str
-    price: int
+    price: int = Field(ge=0)  #  Cents
     type: ShopItemType
+    #  Small integer, which identifies the item in catalog. It never changes and is never reused by another item
+    handle: Optional[int] = None
 
 
 class ShopItemList(RootModel):
+    model_config = ConfigDict(defer_build=True)
+
     root: List[ShopItem]
 
     def append(self, el: ShopItem) -> None:
@@ -67,19 +111,53 @@ class ShopItemList(RootModel):
         return len(self.root)
 
 
-class BasicResponse(BaseModel):
+#  Frame of streamed items. Stream ends with an empty chunk, whose last is set, or with an error
+class ShopItemChunk(DeferredModel):
+    shop_items: List[ShopItem]
+    last: bool = False
+
+
+class BasicResponse(DeferredModel):
     status: Literal["ok"]
 
 
-class GameSessionData(BaseModel):
+class GameSessionData(DeferredModel):
     account_uuid: UUID4
     nickname: str = Field(max_length=12)
-    balance: Decimal = Field(decimal_places=2)
+    balance: int  #  Cents
     session_uuid: UUID4
     owned_items: ShopItemList
+    version: int = 0
+    #  In compact mode owned items, which are in catalog of this version, are referenced by their handles instead
+    owned_item_handles: Optional[List[int]] = None
+    catalog_version: Optional[int] = None
+
+
+#  Changes since the version known by client. When nothing has changed, version stays the same and lists are empty
+class GameSessionDelta(DeferredModel):
+    version: int
+    balance: int  #  Cents
+    added_items: ShopItemList
+    removed_item_uuids: List[UUID4]
+
+
+class EventType(str, enum.Enum):
+    BALANCE_CHANGED = "balance_changed"
+    ITEM_ADDED = "item_added"
+    ITEM_REMOVED = "item_removed"
+    CATALOG_CHANGED = "catalog_changed"
+
+
+#  Pushed by server to subscribed connections without any request
+class ServerEvent(DeferredModel):
+    event_type: EventType
+    balance: Optional[int] = None  #  Cents
+    shop_item: Optional[ShopItem] = None
+    catalog_version: Optional[int] = None
+    version: Optional[int] = None  #  State version of account after the change
 
 
-class ErrorResponse(BaseModel):
+class ErrorResponse(DeferredModel):
     error_code: int
     message: str
     value: Union[str, int, float, None]
@@ -1,30 +1,212 @@
 import base64
-from typing import Optional, Union, Dict, Any
+import enum
+import functools
+from typing import Annotated, Optional, Union, Dict, Any, Literal, Type
 import json
 import uuid
-from decimal import Decimal
 
-from pydantic import BaseModel, UUID4
+from pydantic import Field, TypeAdapter, UUID4
 
 from gameserver.misc.models import (
+    DeferredModel,
     ActionType,
     ItemRequest,
+    ItemSearchRequest,
+    ItemStreamRequest,
     AccountLoginRequest,
+    GameSessionRequest,
     GameSessionData,
+    GameSessionDelta,
     ShopItemList,
+    ShopItemChunk,
     ErrorResponse,
     BasicResponse,
+    ServerEvent,
 )
 
+ResponseData = Union[
+    GameSessionData, GameSessionDelta, BasicResponse, ShopItemList, ShopItemChunk, ErrorResponse, ServerEvent
+]
 
-class ProtocolRequest(BaseModel):
+
+#  Requests and responses are discriminated unions: every action type and every kind of response has its own
+#  envelope, so that incoming message is validated against exactly one model picked by its tag
+
+
+#  pylint: disable=too-few-public-methods
+class ProtocolRequest(DeferredModel):
     action_type: ActionType
-    session_uuid: Optional[UUID4]
-    data: Union[ItemRequest, AccountLoginRequest, None]
+    session_uuid: Optional[UUID4] = None
+    #  Milliseconds, which client waits for response. Server gives up on request once they have passed
+    timeout_ms: Optional[int] = Field(default=None, gt=0)
+
+
+class LoginRequest(ProtocolRequest):
+    action_type: Literal[ActionType.LOGIN] = ActionType.LOGIN
+    data: AccountLoginRequest
+
+
+class LogoutRequest(ProtocolRequest):
+    action_type: Literal[ActionType.LOGOUT] = ActionType.LOGOUT
+    data: None = None
+
+
+class BuyItemRequest(ProtocolRequest):
+    action_type: Literal[ActionType.BUY_ITEM] = ActionType.BUY_ITEM
+    data: ItemRequest
+
+
+class SellItemRequest(ProtocolRequest):
+    action_type: Literal[ActionType.SELL_ITEM] = ActionType.SELL_ITEM
+    data: ItemRequest
+
+
+class GetAllItemListRequest(ProtocolRequest):
+    action_type: Literal[ActionType.GET_ALL_ITEM_LIST] = ActionType.GET_ALL_ITEM_LIST
+    data: None = None
+
 
+class SearchItemsRequest(ProtocolRequest):
+    action_type: Literal[ActionType.SEARCH_ITEMS] = ActionType.SEARCH_ITEMS
+    data: ItemSearchRequest
+
+
+class StreamItemsRequest(ProtocolRequest):
+    action_type: Literal[ActionType.STREAM_ITEMS] = ActionType.STREAM_ITEMS
+    data: ItemStreamRequest = Field(default_factory=ItemStreamRequest)
+
+
+class GetGameSessionRequest(ProtocolRequest):
+    action_type: Literal[ActionType.GET_GAME_DATA_SESSION] = ActionType.GET_GAME_DATA_SESSION
+    data: Optional[GameSessionRequest] = None
+
+
+class SubscribeRequest(ProtocolRequest):
+    action_type: Literal[ActionType.SUBSCRIBE] = ActionType.SUBSCRIBE
+    data: None = None
+
+
+AnyProtocolRequest = Annotated[
+    Union[
+        LoginRequest,
+        LogoutRequest,
+        BuyItemRequest,
+        SellItemRequest,
+        GetAllItemListRequest,
+        SearchItemsRequest,
+        StreamItemsRequest,
+        GetGameSessionRequest,
+        SubscribeRequest,
+    ],
+    Field(discriminator="action_type"),
+]
+
+
+class ResponseKind(str, enum.Enum):
+    GAME_SESSION_DATA = "game_session_data"
+    GAME_SESSION_DELTA = "game_session_delta"
+    BASIC = "basic"
+    SHOP_ITEM_LIST = "shop_item_list"
+    SHOP_ITEM_CHUNK = "shop_item_chunk"
+    ERROR = "error"
+    EVENT = "event"
+
+
+class ProtocolResponse(DeferredModel):
+    kind: ResponseKind
+
+    #  Wraps response data into its envelope
+    @staticmethod
+    def of(data: ResponseData) -> "ProtocolResponse":
+        return RESPONSE_ENVELOPES[type(data)](data=data)
 
-class ProtocolResponse(BaseModel):
-    data: Union[GameSessionData, BasicResponse, ShopItemList, ErrorResponse]
+
+class GameSessionDataEnvelope(ProtocolResponse):
+    kind: Literal[ResponseKind.GAME_SESSION_DATA] = ResponseKind.GAME_SESSION_DATA
+    data: GameSessionData
+
+
+class GameSessionDeltaEnvelope(ProtocolResponse):
+    kind: Literal[ResponseKind.GAME_SESSION_DELTA] = ResponseKind.GAME_SESSION_DELTA
+    data: GameSessionDelta
+
+
+class BasicEnvelope(ProtocolResponse):
+    kind: Literal[ResponseKind.BASIC] = ResponseKind.BASIC
+    data: BasicResponse
+
+
+class ShopItemListEnvelope(ProtocolResponse):
+    kind: Literal[ResponseKind.SHOP_ITEM_LIST] = ResponseKind.SHOP_ITEM_LIST
+    data: ShopItemList
+
+
+class ShopItemChunkEnvelope(ProtocolResponse):
+    kind: Literal[ResponseKind.SHOP_ITEM_CHUNK] = ResponseKind.SHOP_ITEM_CHUNK
+    data: ShopItemChunk
+
+
+class ErrorEnvelope(ProtocolResponse):
+    kind: Literal[ResponseKind.ERROR] = ResponseKind.ERROR
+    data: ErrorResponse
+
+
+class ServerEventEnvelope(ProtocolResponse):
+    kind: Literal[ResponseKind.EVENT] = ResponseKind.EVENT
+    data: ServerEvent
+
+
+RESPONSE_ENVELOPES: Dict[type, Type[ProtocolResponse]] = {
+    GameSessionData: GameSessionDataEnvelope,
+    GameSessionDelta: GameSessionDeltaEnvelope,
+    BasicResponse: BasicEnvelope,
+    ShopItemList: ShopItemListEnvelope,
+    ShopItemChunk: ShopItemChunkEnvelope,
+    ErrorResponse: ErrorEnvelope,
+    ServerEvent: ServerEventEnvelope,
+}
+
+AnyProtocolResponse = Annotated[
+    Union[
+        GameSessionDataEnvelope,
+        GameSessionDeltaEnvelope,
+        BasicEnvelope,
+        ShopItemListEnvelope,
+        ShopItemChunkEnvelope,
+        ErrorEnvelope,
+        ServerEventEnvelope,
+    ],
+    Field(discriminator="kind"),
+]
+
+
+#  Adapters are built on first use or by warmup, not at import time
+@functools.lru_cache(maxsize=None)
+def request_adapter() -> TypeAdapter:
+    return TypeAdapter(AnyProtocolRequest)
+
+
+@functools.lru_cache(maxsize=None)
+def response_adapter() -> TypeAdapter:
+    return TypeAdapter(AnyProtocolResponse)
+
+
+def validate_request(message: bytes) -> ProtocolRequest:
+    return request_adapter().validate_json(message)
+
+
+def validate_response(message: bytes, strict: bool = False) -> ProtocolResponse:
+    return response_adapter().validate_json(message, strict=strict)
+
+
+#  Nested models are built first, so that protocol models reuse their schemas
+def warmup() -> None:
+    models = [ShopItemList, *DeferredModel.__subclasses__()]
+    for model in models:
+        models.extend(model.__subclasses__())
+        model.model_rebuild(force=True)
+    request_adapter()
+    response_adapter()
 
 
 class Protocol:
@@ -43,10 +225,6 @@ class Protocol:
                 if isinstance(o, uuid.UUID):
                     # if the obj is uuid, we simply return the value of uuid
                     return o.hex
-                if isinstance(o, Decimal):
-                    # if the obj is uuid, we simply return the value of uuid
-                    o: Decimal
-                    return float(o)
                 return json.JSONEncoder.default(self, o)
 
         msg = base64.b64encode(json.dumps(data, cls=JSONEnconderMonkeyPatch).encode("utf-8"))
@@ -1,15 +1,95 @@
-from decimal import Decimal
-from pydantic import BaseModel, Field
+import argparse
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel, Field, model_validator
 from gameserver.db import DBSettings
+from gameserver.misc.models import ActionType
+
+
+class SessionSettings(BaseModel):
+    ttl: int = Field(default=86400, gt=0)  #  Seconds
+    purge_interval: int = Field(default=60, gt=0)  #  Seconds
+    purge_batch_size: int = Field(default=1000, gt=0)
+    max_per_account: int = Field(default=16, gt=0)
+
+
+class IdempotencySettings(BaseModel):
+    ttl: int = Field(default=300, gt=0)  #  Seconds
+    max_size: int = Field(default=10000, gt=0)
+
+
+def default_action_costs() -> Dict[ActionType, float]:
+    #  Requests, which read a lot or create accounts and sessions, are more expensive
+    return {
+        ActionType.LOGIN: 5,
+        ActionType.GET_ALL_ITEM_LIST: 5,
+        ActionType.GET_GAME_DATA_SESSION: 2,
+    }
+
+
+class RateLimitSettings(BaseModel):
+    enabled: bool = True
+    peer_rate: float = Field(default=50, gt=0)  #  Tokens per second
+    peer_burst: float = Field(default=100, gt=0)
+    session_rate: float = Field(default=20, gt=0)  #  Tokens per second
+    session_burst: float = Field(default=40, gt=0)
+    max_buckets: int = Field(default=10000, gt=0)
+    default_cost: float = Field(default=1, ge=0)
+    costs: Dict[ActionType, float] = Field(default_factory=default_action_costs)
+
+
+class LogSettings(BaseModel):
+    level: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "INFO"
+    structured: bool = False  #  One JSON object per line
+    path: Optional[str] = None  #  Standard error, when not set
+    #  Share of requests, which are logged, from 0 to 1
+    request_sample_rate: float = Field(default=0.01, ge=0, le=1)
+    #  Requests are logged with their payloads, which hold nicknames and session uuids
+    log_payloads: bool = False
+
+
+class TLSSettings(BaseModel):
+    enabled: bool = False
+    certfile: Optional[str] = None
+    keyfile: Optional[str] = None  #  Taken from certfile, when not set
+    minimum_version: Literal["TLSv1.2", "TLSv1.3"] = "TLSv1.2"
+    ciphers: Optional[str] = None  #  OpenSSL cipher list, applies to TLS 1.2 only
+    #  Tickets let clients resume their sessions with an abbreviated handshake on reconnect
+    session_tickets: bool = True
+    num_tickets: int = Field(default=2, ge=0)  #  Tickets sent after every TLS 1.3 handshake
+
+    @model_validator(mode="after")
+    def check_certfile(self) -> "TLSSettings":
+        if self.enabled and not self.certfile:
+            raise ValueError("certfile is required, when TLS is enabled")
+        return self
 
 
 class ServerSettings(BaseModel):
     host: str
-    port: int = Field(gt=0)
+    port: Optional[int] = Field(default=None, gt=0)  #  None serves Unix sockets only
+    #  Paths of Unix sockets, which are served in addition to TCP, for clients on the same host. They skip TCP and
+    #  loopback, and are never encrypted, so access to them is controlled by permissions of their directory
+    unix_paths: List[str] = Field(default_factory=list)
     items_path: str
+    items_reload_interval: float = Field(default=5, ge=0)  #  Seconds, 0 disables watching of items file
     db_settings: DBSettings
-    min_amount_of_money: Decimal = Field(gt=0.0, decimal_places=2)
-    max_amount_of_money: Decimal = Field(gt=0.0, decimal_places=2)
+    min_amount_of_money_cents: int = Field(gt=0)
+    max_amount_of_money_cents: int = Field(gt=0)
+    session_settings: SessionSettings = Field(default_factory=SessionSettings)
+    idempotency_settings: IdempotencySettings = Field(default_factory=IdempotencySettings)
+    rate_limit_settings: RateLimitSettings = Field(default_factory=RateLimitSettings)
+    #  Seconds, which requests in flight are given to finish on shutdown and restart
+    drain_timeout: float = Field(default=30, ge=0)
+    #  Seconds, which a restarted server is given to start serving the inherited socket
+    handoff_timeout: float = Field(default=60, gt=0)
+    tls_settings: TLSSettings = Field(default_factory=TLSSettings)
+    log_settings: LogSettings = Field(default_factory=LogSettings)
+
+    @model_validator(mode="after")
+    def check_listeners(self) -> "ServerSettings":
+        if self.port is None and not self.unix_paths:
+            raise ValueError("port or unix_paths is required")
+        return self
 
 
 def load_settings(settings_path: str) -> ServerSettings:
@@ -19,5 +99,18 @@ def load_settings(settings_path: str) -> ServerSettings:
 
 def validate_settings(settings_path: str) -> ServerSettings:
     settings = load_settings(settings_path)
-    assert settings.max_amount_of_money >= settings.min_amount_of_money
+    assert settings.max_amount_of_money_cents >= settings.min_amount_of_money_cents
     return settings
+
+
+#  Command line tools, which read server settings, take the path of them the same way
+def make_settings_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--settings-path",
+        dest="settings_path",
+        type=str,
+        default="settings.json",
+        help="Path to the server settings",
+    )
+    return parser
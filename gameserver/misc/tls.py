@@ -0,0 +1,96 @@
+import datetime
+import ipaddress
+import os
+import ssl
+from typing import Optional, Tuple
+
+#  TLS is optional. Server sends session tickets, and client keeps the session of its last connection, so that
+#  reconnecting resumes it and skips the full handshake with its key exchange and certificate verification
+
+TLS_VERSIONS = {"TLSv1.2": ssl.TLSVersion.TLSv1_2, "TLSv1.3": ssl.TLSVersion.TLSv1_3}
+
+
+#  asyncio has no way to pass a session to resume, so context hands it to every connection it wraps
+class ResumingSSLContext(ssl.SSLContext):
+    session: Optional[ssl.SSLSession] = None
+
+    #  pylint: disable=too-many-arguments,too-many-positional-arguments
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session or self.session)
+
+
+def make_server_context(  #  pylint: disable=too-many-arguments,too-many-positional-arguments
+    certfile: str,
+    keyfile: Optional[str] = None,
+    minimum_version: str = "TLSv1.2",
+    ciphers: Optional[str] = None,
+    session_tickets: bool = True,
+    num_tickets: int = 2,
+) -> ssl.SSLContext:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    context.minimum_version = TLS_VERSIONS[minimum_version]
+    if ciphers:
+        #  Applies to TLS 1.2 only, suites of TLS 1.3 are always the default ones
+        context.set_ciphers(ciphers)
+    if session_tickets:
+        context.num_tickets = num_tickets
+    else:
+        context.options |= ssl.Options.OP_NO_TICKET
+        context.num_tickets = 0
+    return context
+
+
+def make_client_context(
+    cafile: Optional[str] = None, minimum_version: str = "TLSv1.2", ciphers: Optional[str] = None
+) -> ResumingSSLContext:
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.minimum_version = TLS_VERSIONS[minimum_version]
+    if cafile:
+        context.load_verify_locations(cafile)
+    else:
+        context.load_default_certs()
+    if ciphers:
+        context.set_ciphers(ciphers)
+    return context
+
+
+#  Self-signed certificate for local runs, tests and benchmarks. Client has to trust it with cafile
+def generate_self_signed_certificate(directory: str, hostname: str = "localhost") -> Tuple[str, str]:
+    #  Imported here, as only this helper needs cryptography
+    #  pylint: disable=import-outside-toplevel
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostname)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .add_extension(
+            x509.SubjectAlternativeName([x509.DNSName(hostname), x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]),
+            critical=False,
+        )
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    with open(certfile, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            )
+        )
+    return certfile, keyfile
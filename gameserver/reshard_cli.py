@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import logging
+
+from gameserver.db import DBManager
+from gameserver.db.resharding import reshard
+from gameserver.misc.settings import validate_settings
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--from-settings",
+        dest="from_settings",
+        type=str,
+        required=True,
+        help="Path to the server settings with current shards",
+    )
+    parser.add_argument(
+        "--to-settings",
+        dest="to_settings",
+        type=str,
+        required=True,
+        help="Path to the server settings with new shards",
+    )
+    parser.add_argument("--batch-size", dest="batch_size", type=int, default=500, help="Accounts read per query")
+
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    source = DBManager(validate_settings(args.from_settings).db_settings)
+    target = DBManager(validate_settings(args.to_settings).db_settings)
+    await source.init_db_engine(migrate=False)
+    await target.init_db_engine(migrate=False)
+
+    try:
+        await target.migrate()
+        moved = await reshard(source, target, args.batch_size)
+        logging.info("Resharding is done, %d accounts have been moved", moved)
+    finally:
+        await source.shutdown()
+        await target.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -1 +1,15 @@
-from .server import Server
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .server import Server
+
+#  Server is imported on first access, so that importing helpers of this package does not pull in SQLAlchemy
+_LAZY_ATTRIBUTES = {"Server": ".server"}
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
@@ -0,0 +1,97 @@
+from collections import defaultdict
+from itertools import chain
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+import uuid
+
+from gameserver.misc.models import ShopItem, ShopItemList, ShopItemType
+from gameserver.server.search import SearchIndex
+
+#  In-memory snapshot of the shop catalog. It is never changed in place: reload builds a new one and the server swaps
+#  the reference, so a request always sees a whole catalog of a single version. Search index is a part of snapshot
+#  too, so it is rebuilt with every one instead of being updated
+
+
+ItemKey = Tuple[str, int, ShopItemType]
+
+
+def item_key(shop_item: ShopItem) -> ItemKey:
+    return shop_item.name, shop_item.price, shop_item.type
+
+
+class CatalogDiff(NamedTuple):
+    inserted: List[ShopItem]
+    changed: List[ShopItem]
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.inserted and not self.changed
+
+
+class Catalog:  #  pylint: disable=too-few-public-methods,too-many-instance-attributes
+    def __init__(self, version: int, shop_items: ShopItemList) -> None:
+        self.version = version
+        self.shop_items = shop_items
+        self.by_uuid: Dict[uuid.UUID, ShopItem] = {shop_item.uuid: shop_item for shop_item in shop_items}
+        self.by_handle: Dict[int, ShopItem] = {
+            shop_item.handle: shop_item for shop_item in shop_items if shop_item.handle is not None
+        }
+        #  Items, which come without uuids, are matched by these, name, price and type are unique
+        self.by_key: Dict[ItemKey, ShopItem] = {item_key(shop_item): shop_item for shop_item in shop_items}
+        self.by_name_and_type: Dict[Tuple[str, ShopItemType], List[ShopItem]] = defaultdict(list)
+        self.by_name_and_price: Dict[Tuple[str, int], List[ShopItem]] = defaultdict(list)
+        for shop_item in shop_items:
+            self.by_name_and_type[(shop_item.name, shop_item.type)].append(shop_item)
+            self.by_name_and_price[(shop_item.name, shop_item.price)].append(shop_item)
+        self.search_index = SearchIndex(shop_items)
+
+    #  Items file may omit uuids, then an item is matched by name, price and type first. Item, which has none of them
+    #  matched, has either its price changed, and is matched by name and type, or its type, and is matched by name and
+    #  price, so that it is updated instead of being inserted as another one. Items, which are missing in the file, are
+    #  kept, as accounts may own them
+    def diff(self, shop_items: ShopItemList) -> CatalogDiff:
+        inserted: List[ShopItem] = []
+        changed: List[ShopItem] = []
+        seen: Set[ItemKey] = set()
+        matched: Set[uuid.UUID] = set()
+        unmatched: List[ShopItem] = []
+
+        for shop_item in shop_items:
+            if item_key(shop_item) in seen:
+                continue
+            seen.add(item_key(shop_item))
+
+            if shop_item.uuid is None:
+                current = self.by_key.get(item_key(shop_item))
+                if current is None:
+                    unmatched.append(shop_item)
+                    continue
+            else:
+                current = self.by_uuid.get(shop_item.uuid)
+            self.__match(shop_item, current, matched, inserted, changed)
+
+        #  Items, which are matched exactly, are never taken by the ones, which have changed
+        for shop_item in unmatched:
+            candidates = chain(
+                self.by_name_and_type.get((shop_item.name, shop_item.type), ()),
+                self.by_name_and_price.get((shop_item.name, shop_item.price), ()),
+            )
+            current = next((candidate for candidate in candidates if candidate.uuid not in matched), None)
+            self.__match(shop_item, current, matched, inserted, changed)
+
+        return CatalogDiff(inserted, changed)
+
+    @staticmethod
+    def __match(
+        shop_item: ShopItem,
+        current: Optional[ShopItem],
+        matched: Set[uuid.UUID],
+        inserted: List[ShopItem],
+        changed: List[ShopItem],
+    ) -> None:
+        if current is None:
+            #  Uuid is generated here, so that the item gets the same one on every shard
+            inserted.append(shop_item.model_copy(update={"uuid": shop_item.uuid or uuid.uuid4()}))
+            return
+        matched.add(current.uuid)
+        if item_key(current) != item_key(shop_item):
+            changed.append(shop_item.model_copy(update={"uuid": current.uuid}))
@@ -0,0 +1,65 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+#  Identical reads, which arrive while one of them is being served, wait for its result instead of doing the same
+#  work again. Work runs in a task of its own, so that the request, which has started it, may leave without taking
+#  the result away from the others. It is cancelled only when every request, which waits for it, has left. Result is
+#  shared only while work is in flight, keys carry everything, which makes results of two requests differ
+
+
+class CoalescingStats:
+    def __init__(self) -> None:
+        self.computed = 0  #  Requests, which have started the work
+        self.coalesced = 0  #  Requests, which have joined work in flight
+
+    @property
+    def coalesce_rate(self) -> float:
+        total = self.computed + self.coalesced
+        return self.coalesced / total if total else 0.0
+
+    def reset(self) -> None:
+        self.computed = 0
+        self.coalesced = 0
+
+
+class Flight:  #  pylint: disable=too-few-public-methods
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, stats: Optional[CoalescingStats] = None) -> None:
+        self.stats = stats if stats is not None else CoalescingStats()
+        self._flights: Dict[Hashable, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: Hashable, action: Callable[[], Awaitable[T]]) -> T:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight(asyncio.ensure_future(action()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.stats.computed += 1
+        else:
+            self.stats.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                #  Nobody joins a flight, which is being cancelled, as its cancellation is not theirs
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
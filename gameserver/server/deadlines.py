@@ -0,0 +1,56 @@
+import asyncio
+import time
+from typing import Awaitable, Optional, TypeVar
+
+from gameserver.misc import errors
+from gameserver.misc.models import ActionType
+
+T = TypeVar("T")
+
+#  Request may carry a timeout, which is counted from the moment server has read it, as clocks of client and server
+#  may differ. Request, which has expired before dispatch, is answered with an error right away. Handlers, which only
+#  read, are cancelled once their deadline passes. Handlers, which write, run to the end, as rolling back a change,
+#  which may already be committed, would leave client even less sure about its outcome. Stream, which is cancelled,
+#  is ended with the error after the chunks, which have been sent already
+
+READ_ONLY_ACTIONS = frozenset(
+    {
+        ActionType.GET_ALL_ITEM_LIST,
+        ActionType.SEARCH_ITEMS,
+        ActionType.GET_GAME_DATA_SESSION,
+        ActionType.STREAM_ITEMS,
+    }
+)
+
+
+class ShedStats:
+    def __init__(self) -> None:
+        self.expired = 0  #  Dropped before dispatch
+        self.cancelled = 0  #  Cancelled in flight
+
+    @property
+    def total(self) -> int:
+        return self.expired + self.cancelled
+
+    def reset(self) -> None:
+        self.expired = 0
+        self.cancelled = 0
+
+
+async def run_before_deadline(
+    action_type: ActionType, handler: Awaitable[T], deadline: Optional[float], shed_stats: ShedStats
+) -> T:
+    if deadline is None:
+        return await handler
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        handler.close()
+        shed_stats.expired += 1
+        raise errors.DeadlineExceeded(action_type.value)
+    if action_type not in READ_ONLY_ACTIONS:
+        return await handler
+    try:
+        return await asyncio.wait_for(handler, remaining)
+    except asyncio.TimeoutError:
+        shed_stats.cancelled += 1
+        raise errors.DeadlineExceeded(action_type.value) from None
@@ -0,0 +1,67 @@
+import asyncio
+from asyncio.subprocess import Process
+import logging
+import os
+import socket
+import sys
+from typing import List, Optional
+
+#  Zero downtime restart: running server starts its successor with the listening socket inherited, waits until the
+#  successor serves it, and only then stops accepting. The socket is never closed in between, so clients which connect
+#  meanwhile wait in its backlog instead of being refused. Socket files of Unix sockets are replaced by the ones of
+#  successor, connections to the old ones are drained
+
+LISTEN_FD_ENV = "GAMESERVER_LISTEN_FD"
+READY_FD_ENV = "GAMESERVER_READY_FD"
+
+
+def inherited_socket() -> Optional[socket.socket]:
+    listen_fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if listen_fd is None:
+        return None
+    return socket.socket(fileno=int(listen_fd))
+
+
+#  Tells the predecessor, that the inherited socket is served now
+def notify_ready() -> None:
+    ready_fd = os.environ.pop(READY_FD_ENV, None)
+    if ready_fd is None:
+        return
+    with os.fdopen(int(ready_fd), "wb") as f:
+        f.write(b"1")
+
+
+#  Server, which listens on Unix sockets only, has no socket to hand off, successor binds their paths again
+async def spawn_successor(sock: Optional[socket.socket], args: List[str], timeout: float) -> Optional[Process]:
+    ready_read_fd, ready_write_fd = os.pipe()
+    env = dict(os.environ, **{READY_FD_ENV: str(ready_write_fd)})
+    pass_fds = [ready_write_fd]
+    if sock is not None:
+        env[LISTEN_FD_ENV] = str(sock.fileno())
+        pass_fds.append(sock.fileno())
+    try:
+        process = await asyncio.create_subprocess_exec(sys.executable, *args, env=env, pass_fds=pass_fds)
+    finally:
+        #  Only the successor keeps the write end, so that its exit is seen as end of file
+        os.close(ready_write_fd)
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(ready_read_fd, "rb", buffering=0)
+    )
+    try:
+        ready = await asyncio.wait_for(reader.read(1), timeout)
+    except asyncio.TimeoutError:
+        ready = b""
+    finally:
+        transport.close()
+
+    if ready:
+        return process
+
+    logging.error("Successor %d has not started serving, stopping it", process.pid)
+    if process.returncode is None:
+        process.kill()
+    await process.wait()
+    return None
@@ -0,0 +1,108 @@
+import asyncio
+from collections import OrderedDict
+import time
+from typing import Awaitable, Callable, Hashable, Optional, Tuple, TypeVar
+import uuid
+
+from gameserver.misc import errors
+
+T = TypeVar("T")
+
+#  Results of requests, which were retried with the same idempotency key. Keys are kept in insertion order, and
+#  every key lives for the same ttl, so expired ones are always at the front and are evicted without a full scan.
+#  Pending requests are stored too, so that a retry, which arrives before the first attempt is done, waits for it.
+#  Every key remembers fingerprint of its request, and request, which reuses the key for something else, is rejected
+
+
+class IdempotencyCache:
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Optional[Hashable], asyncio.Future]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def evict_expired(self) -> None:
+        now = time.monotonic()
+        while self._entries:
+            expires, _, _ = next(iter(self._entries.values()))
+            if expires > now:
+                break
+            self._entries.popitem(last=False)
+
+    async def run(
+        self, key: Hashable, action: Callable[[], Awaitable[T]], fingerprint: Optional[Hashable] = None
+    ) -> T:
+        self.evict_expired()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] != fingerprint:
+                raise errors.IdempotencyKeyReused()
+            self.hits += 1
+            return await asyncio.shield(entry[2])
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = (time.monotonic() + self.ttl, fingerprint, future)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+        try:
+            result = await action()
+        except asyncio.CancelledError:
+            self._forget(key, future)
+            future.cancel()
+            raise
+        except BaseException as e:
+            #  Only successful results are replayed, failed request may be retried with the same key
+            self._forget(key, future)
+            future.set_exception(e)
+            #  Mark exception as retrieved, when nobody waits for it
+            future.exception()
+            raise
+
+        future.set_result(result)
+        return result
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] is future:
+            del self._entries[key]
+
+
+#  Accounts of sessions, which have sent requests with idempotency keys, so that their retries find the key of the
+#  account without DB. Session never changes its account, so entries are only evicted by age and size, or on logout
+
+
+class SessionAccounts:
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[uuid.UUID, Tuple[float, uuid.UUID]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def evict_expired(self) -> None:
+        now = time.monotonic()
+        while self._entries:
+            expires, _ = next(iter(self._entries.values()))
+            if expires > now:
+                break
+            self._entries.popitem(last=False)
+
+    def get(self, session_uuid: uuid.UUID) -> Optional[uuid.UUID]:
+        self.evict_expired()
+        entry = self._entries.get(session_uuid)
+        return entry[1] if entry is not None else None
+
+    def add(self, session_uuid: uuid.UUID, account_uuid: uuid.UUID) -> None:
+        #  Entry is moved to the end, so that expired ones stay at the front
+        self._entries.pop(session_uuid, None)
+        self._entries[session_uuid] = (time.monotonic() + self.ttl, account_uuid)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, session_uuid: uuid.UUID) -> None:
+        self._entries.pop(session_uuid, None)
@@ -0,0 +1,82 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from typing import Any, Dict, Optional
+
+from gameserver.misc.settings import LogSettings
+
+#  Event loop only puts records into a queue, formatting and writing happen on a thread of QueueListener. Records
+#  about single requests are sampled before they are created, so that skipped ones cost a random number only
+
+REQUEST_LOGGER = "gameserver.requests"
+
+#  Attributes of every LogRecord, the rest has come from extra and is written as fields of structured record
+RECORD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in record.__dict__.items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+#  Standard QueueHandler formats message on the calling thread. Record is passed as it is instead, so arguments
+#  of records have to stay unchanged after logging, which holds for strings and numbers logged by server
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RequestLogger:
+    def __init__(self, sample_rate: float, log_payloads: bool, logger: Optional[logging.Logger] = None) -> None:
+        self.sample_rate = sample_rate
+        self.log_payloads = log_payloads
+        self.logger = logger or logging.getLogger(REQUEST_LOGGER)
+
+    def sample(self) -> bool:
+        if self.sample_rate <= 0 or not self.logger.isEnabledFor(logging.INFO):
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def log(self, fields: Dict[str, Any], payload: Optional[bytes] = None) -> None:
+        if self.log_payloads and payload is not None:
+            fields["payload"] = payload.decode("utf-8", "replace")
+        self.logger.info("Request %s", fields["action"], extra=fields)
+
+
+def make_formatter(log_settings: LogSettings) -> logging.Formatter:
+    if log_settings.structured:
+        return JSONFormatter()
+    return logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+#  Replaces handlers of root logger with the queue one, returned listener has to be stopped on exit to flush records
+def setup_logging(log_settings: LogSettings) -> logging.handlers.QueueListener:
+    handler: logging.Handler
+    if log_settings.path:
+        handler = logging.FileHandler(log_settings.path, encoding="utf-8")
+    else:
+        handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(make_formatter(log_settings))
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for previous in root.handlers[:]:
+        root.removeHandler(previous)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(log_settings.level)
+
+    listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    return listener
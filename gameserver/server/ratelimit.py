@@ -0,0 +1,76 @@
+from collections import OrderedDict
+import time
+from typing import Hashable, Optional
+
+from gameserver.misc.models import ActionType
+from gameserver.misc.settings import RateLimitSettings
+
+#  Token buckets are refilled lazily, when they are touched, so every request costs O(1) regardless of amount of
+#  clients. Buckets are kept in LRU order: a bucket, which was idle long enough to be refilled up to its burst, is
+#  the same as a new one, so it is dropped from the front without losing anything
+
+
+class TokenBucket:  #  pylint: disable=too-few-public-methods
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float) -> None:
+        self.tokens = tokens
+        self.updated = updated
+
+
+class TokenBuckets:
+    def __init__(self, rate: float, burst: float, max_buckets: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self.refill_time = burst / rate
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def get(self, key: Hashable, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self.evict_idle(now)
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def evict_idle(self, now: float) -> None:
+        while self._buckets:
+            bucket = next(iter(self._buckets.values()))
+            if now - bucket.updated < self.refill_time and len(self._buckets) < self.max_buckets:
+                break
+            self._buckets.popitem(last=False)
+
+
+class RateLimiter:  #  pylint: disable=too-few-public-methods
+    def __init__(self, settings: RateLimitSettings) -> None:
+        self.costs = settings.costs
+        self.default_cost = settings.default_cost
+        self.peers = TokenBuckets(settings.peer_rate, settings.peer_burst, settings.max_buckets)
+        self.sessions = TokenBuckets(settings.session_rate, settings.session_burst, settings.max_buckets)
+        self.rejected = 0
+
+    #  Tokens are taken only when both peer and session buckets have enough of them
+    def acquire(self, peer: Optional[str], session_uuid: Optional[Hashable], action_type: ActionType) -> bool:
+        cost = self.costs.get(action_type, self.default_cost)
+        now = time.monotonic()
+        peer_bucket = self.peers.get(peer, now) if peer is not None else None
+        session_bucket = self.sessions.get(session_uuid, now) if session_uuid is not None else None
+
+        if (peer_bucket is not None and peer_bucket.tokens < cost) or (
+            session_bucket is not None and session_bucket.tokens < cost
+        ):
+            self.rejected += 1
+            return False
+
+        if peer_bucket is not None:
+            peer_bucket.tokens -= cost
+        if session_bucket is not None:
+            session_bucket.tokens -= cost
+        return True
@@ -0,0 +1,259 @@
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+import heapq
+from itertools import accumulate, chain
+import re
+from typing import DefaultDict, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from gameserver.misc.models import ShopItem, ShopItemType
+
+#  Inverted index over names of catalog items. Items are ranked statically: shorter names first, so that "Falcon" comes
+#  before "Falcon Mk II". Search walks postings from the best ranked item and stops as soon as it has enough results,
+#  instead of collecting every match and sorting it.
+#
+#  Items are numbered by type first and by rank within type, so items of one type have a contiguous range of ids, and
+#  type filter only narrows every postings list with bisect. Postings of all tokens share one flat array, token k owns
+#  offsets[k]:offsets[k + 1] of it. Last token of a query is a prefix: its matches are merged from postings of every
+#  token in its range, or, when there are many of them, taken from postings of the prefix itself, which are prepared for
+#  such prefixes only
+
+TOKEN_RE = re.compile(r"\w+")
+#  Prefix, which covers more tokens or, with several tokens, more postings than this, has its postings prepared,
+#  so no query merges more of them. Every level of prefixes takes at most as much memory as postings of tokens
+MAX_MERGED_TOKENS = 64
+MAX_MERGED_POSTINGS = 1024
+#  Sorts after every character, which a token may have
+TOKEN_END = "\U0010ffff"
+
+Postings = Sequence[int]
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.casefold())
+
+
+def name_key(name: str) -> Tuple[int, str]:
+    return len(name), name.casefold()
+
+
+def unique(ids: Iterable[int]) -> Iterator[int]:
+    previous = -1
+    for item_id in ids:
+        if item_id != previous:
+            yield item_id
+            previous = item_id
+
+
+def contains(postings: Postings, item_id: int) -> bool:
+    index = bisect_left(postings, item_id)
+    return index < len(postings) and postings[index] == item_id
+
+
+class SearchIndex:  #  pylint: disable=too-many-instance-attributes
+    def __init__(self, shop_items: Iterable[ShopItem]) -> None:  #  pylint: disable=too-many-locals
+        shop_items = list(shop_items)
+        #  Names repeat in big catalogs, so distinct ones are ranked and tokenized once, and items are put in rank
+        #  order by buckets of their names, instead of sorting all of them by name. Items themselves are read once
+        #  and in their order, as reading them in any other one is slower than the rest of the build
+        names = sorted({shop_item.name for shop_item in shop_items}, key=name_key)
+        name_ranks = {name: rank for rank, name in enumerate(names)}
+        item_names = [name_ranks[shop_item.name] for shop_item in shop_items]
+        item_prices = [shop_item.price for shop_item in shop_items]
+        item_types = [shop_item.type for shop_item in shop_items]
+        buckets: List[List[int]] = [[] for _ in names]
+        for index, name_rank in enumerate(item_names):
+            buckets[name_rank].append(index)
+        for bucket in buckets:
+            bucket.sort(key=item_prices.__getitem__)
+        ranked = list(chain.from_iterable(buckets))
+
+        ranks = array("I", bytes(4 * len(ranked)))
+        for rank, index in enumerate(ranked):
+            ranks[index] = rank
+        self._type_ranges: Dict[ShopItemType, Tuple[int, int]] = {}
+        order: List[int] = []
+        for item_type in ShopItemType:
+            start = len(order)
+            order.extend(index for index in ranked if item_types[index] == item_type)
+            self._type_ranges[item_type] = (start, len(order))
+        self.items: List[ShopItem] = [shop_items[index] for index in order]
+        self._rank = array("I", (ranks[index] for index in order))
+
+        name_tokens = [set(tokenize(name)) for name in names]
+        postings_by_token: DefaultDict[str, List[int]] = defaultdict(list)
+        for item_id, index in enumerate(order):
+            for token in name_tokens[item_names[index]]:
+                postings_by_token[token].append(item_id)
+
+        self.tokens: List[str] = sorted(postings_by_token)
+        self._postings = array("I", chain.from_iterable(postings_by_token[token] for token in self.tokens))
+        self._offsets = array("I", accumulate((len(postings_by_token[token]) for token in self.tokens), initial=0))
+        self._view = memoryview(self._postings)
+        self._prefix_postings = self.__prepare_prefix_postings()
+
+        #  Filters are checked against arrays, as reading items, which are scattered in memory, is slower
+        self._item_prices = array("q", (item_prices[index] for index in order))
+        self._by_price = array("I", sorted(range(len(order)), key=self._item_prices.__getitem__))
+        self._prices = array("q", (self._item_prices[item_id] for item_id in self._by_price))
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def postings(self, token_index: int) -> Postings:
+        return self._view[self._offsets[token_index] : self._offsets[token_index + 1]]
+
+    def token_postings(self, token: str) -> Postings:
+        token_index = bisect_left(self.tokens, token)
+        if token_index < len(self.tokens) and self.tokens[token_index] == token:
+            return self.postings(token_index)
+        return ()
+
+    def token_range(self, prefix: str, lo: int = 0, hi: Optional[int] = None) -> Tuple[int, int]:
+        hi = len(self.tokens) if hi is None else hi
+        return bisect_left(self.tokens, prefix, lo, hi), bisect_left(self.tokens, prefix + TOKEN_END, lo, hi)
+
+    #  Prefixes are split level by level, and only ranges, which are still too long, are split further
+    def __prepare_prefix_postings(self) -> Dict[str, Postings]:
+        prefix_postings: Dict[str, Postings] = {}
+        ranges = [(0, len(self.tokens))]
+        length = 1
+        while ranges:
+            long_ranges = []
+            for lo, hi in ranges:
+                token_index = lo
+                while token_index < hi:
+                    if len(self.tokens[token_index]) < length:
+                        token_index += 1
+                        continue
+                    prefix = self.tokens[token_index][:length]
+                    _, end = self.token_range(prefix, token_index, hi)
+                    start, stop = self._offsets[token_index], self._offsets[end]
+                    tokens = end - token_index
+                    if tokens > MAX_MERGED_TOKENS or (tokens > 1 and stop - start > MAX_MERGED_POSTINGS):
+                        prefix_postings[prefix] = array("I", sorted(set(self._postings[start:stop])))
+                        long_ranges.append((token_index, end))
+                    token_index = end
+            ranges = long_ranges
+            length += 1
+        return prefix_postings
+
+    def __type_ranges(self, item_type: Optional[ShopItemType]) -> List[Tuple[int, int]]:
+        if item_type is not None:
+            return [self._type_ranges[item_type]]
+        return [item_range for item_range in self._type_ranges.values() if item_range[0] < item_range[1]]
+
+    #  Ids, which are in any of postings, in rank order. Postings are cut to ranges of types first, and streams of
+    #  different types are merged by rank. Returns amount of ids too, or its upper bound, when postings overlap
+    def __stream(self, postings: List[Postings], item_type: Optional[ShopItemType]) -> Tuple[Iterable[int], int]:
+        streams: List[Iterable[int]] = []
+        size = 0
+        for lo, hi in self.__type_ranges(item_type):
+            parts = [part[bisect_left(part, lo) : bisect_left(part, hi)] for part in postings]
+            parts = [part for part in parts if len(part)]
+            size += sum(len(part) for part in parts)
+            if len(parts) == 1:
+                streams.append(parts[0])
+            elif parts:
+                streams.append(unique(heapq.merge(*parts)))
+        if len(streams) == 1:
+            return streams[0], size
+        return heapq.merge(*streams, key=self._rank.__getitem__), size
+
+    def __prefix_postings(self, prefix: str) -> List[Postings]:
+        prepared = self._prefix_postings.get(prefix)
+        if prepared is not None:
+            return [prepared]
+        lo, hi = self.token_range(prefix)
+        return [self.postings(token_index) for token_index in range(lo, hi)]
+
+    #  pylint: disable=too-many-arguments,too-many-positional-arguments
+    def search(
+        self,
+        query: str,
+        item_type: Optional[ShopItemType] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        limit: int = 20,
+    ) -> List[ShopItem]:
+        tokens = tokenize(query)
+        #  Query, which ends with a finished word, has no prefix to complete
+        prefix = tokens.pop() if tokens and not query[-1:].isspace() else None
+
+        results: List[ShopItem] = []
+        seen: Set[int] = set()
+        filters = (item_type, min_price, max_price)
+        if prefix is not None:
+            #  Items, which have the prefix as a whole word, are ranked above the ones, which only start with it
+            self.__collect(tokens + [prefix], None, filters, limit, results, seen)
+        if len(results) < limit:
+            self.__collect(tokens, prefix, filters, limit, results, seen)
+        return results
+
+    #  Walks the shortest stream of candidates in rank order and checks every other condition for each of them
+    #  pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals,too-many-branches
+    def __collect(
+        self,
+        tokens: List[str],
+        prefix: Optional[str],
+        filters: Tuple[Optional[ShopItemType], Optional[int], Optional[int]],
+        limit: int,
+        results: List[ShopItem],
+        seen: Set[int],
+    ) -> None:
+        item_type, min_price, max_price = filters
+        token_postings = {token: self.token_postings(token) for token in set(tokens)}
+        if any(not postings for postings in token_postings.values()):
+            return
+
+        driver: Optional[str] = None
+        if prefix is not None:
+            ids, size = self.__stream(self.__prefix_postings(prefix), item_type)
+            driver = prefix
+        else:
+            ids, size = self.__stream([range(len(self.items))], item_type)
+        for token, postings in token_postings.items():
+            if len(postings) < size:
+                token_ids, token_size = self.__stream([postings], item_type)
+                if token_size < size:
+                    ids, size, driver = token_ids, token_size, token
+        if not size:
+            return
+
+        #  Narrow price range is cheaper to sort by rank than to be found by walking other candidates, which stop
+        #  early, once limit is reached: with prices independent from names, about limit / share of range of them
+        if min_price is not None or max_price is not None:
+            lo = bisect_left(self._prices, min_price) if min_price is not None else 0
+            hi = bisect_left(self._prices, max_price + 1) if max_price is not None else len(self._prices)
+            if (hi - lo) ** 2 < limit * len(self.items) and hi - lo < size:
+                type_lo, type_hi = self._type_ranges[item_type] if item_type is not None else (0, len(self.items))
+                ids = sorted(
+                    (item_id for item_id in self._by_price[lo:hi] if type_lo <= item_id < type_hi),
+                    key=self._rank.__getitem__,
+                )
+                driver = None
+
+        others = [postings for token, postings in token_postings.items() if token != driver]
+        prefix_re = None
+        if prefix is not None and driver != prefix:
+            if prefix in self._prefix_postings:
+                others.append(self._prefix_postings[prefix])
+            else:
+                #  Word, which starts with the prefix, starts at a word boundary, as it is cheaper than tokenizing
+                prefix_re = re.compile(r"\b" + re.escape(prefix))
+        prices = self._item_prices
+        for item_id in ids:
+            if item_id in seen:
+                continue
+            if min_price is not None and prices[item_id] < min_price:
+                continue
+            if max_price is not None and prices[item_id] > max_price:
+                continue
+            if others and not all(contains(postings, item_id) for postings in others):
+                continue
+            if prefix_re is not None and not prefix_re.search(self.items[item_id].name.casefold()):
+                continue
+            seen.add(item_id)
+            results.append(self.items[item_id])
+            if len(results) >= limit:
+                return
@@ -1,123 +1,472 @@
 import asyncio
+import datetime
 import logging
-from typing import List
+import os
+import socket
+import ssl
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple, Union
 import uuid
 
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+
 from gameserver.db.manager import DBManager
+from gameserver.db.tables import DBAccount, DBShopItem, utcnow
 from gameserver.misc.settings import validate_settings
 from gameserver.misc.models import (
     ErrorResponse,
+    ShopItem,
+    ShopItemChunk,
     ShopItemList,
     AccountLoginRequest,
     GameSessionData,
+    GameSessionDelta,
     ActionType,
     BasicResponse,
     ItemRequest,
+    ItemSearchRequest,
+    ItemStreamRequest,
+    ServerEvent,
+    EventType,
 )
-from gameserver.misc import errors
-from gameserver.misc.protocol import Protocol, ProtocolRequest, ProtocolResponse
+from gameserver.misc import errors, tls
+from gameserver.misc.protocol import Protocol, ProtocolRequest, ProtocolResponse, validate_request, warmup
 from gameserver.misc.connection import Connection
+from gameserver.server.idempotency import IdempotencyCache, SessionAccounts
+from gameserver.server.ratelimit import RateLimiter
+from gameserver.server.catalog import Catalog
+from gameserver.server.coalescing import CoalescingStats, SingleFlight
+from gameserver.server.deadlines import ShedStats, run_before_deadline
+from gameserver.server.logs import RequestLogger
+
+#  Items file with one of these suffixes holds one item per line instead of a JSON array
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
 
 
-class Server:
-    def __init__(self, settings_path = "settings.json") -> None:
+class Server:  #  pylint: disable=too-many-instance-attributes,too-many-public-methods
+    def __init__(self, settings_path = "settings.json", sock: Optional[socket.socket] = None) -> None:
         self._settings = validate_settings(settings_path)
         self._sessions: List[Connection] = []
+        #  Listening socket inherited from the previous server process, when restarted without downtime
+        self._inherited_socket = sock
         self._socket = None
-
-        self.db = DBManager(self._settings.db_settings)
+        #  Servers of Unix sockets with paths and inodes of their socket files
+        self._unix_servers: List[Tuple[str, int, asyncio.AbstractServer]] = []
+        self._draining = False
+        self._drained: Optional[asyncio.Event] = None
+        self._purge_task: Optional[asyncio.Task] = None
+        #  Connections subscribed to events of account, keyed by account uuid
+        self._subscribers: Dict[uuid.UUID, Set[Connection]] = {}
+        self._subscriptions: Dict[Connection, uuid.UUID] = {}
+        self.catalog = Catalog(0, ShopItemList([]))
+        self._items_mtime: Optional[float] = None
+        self._reload_lock = asyncio.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+        self._reload_task: Optional[asyncio.Task] = None
+        self.idempotency_cache = IdempotencyCache(
+            self._settings.idempotency_settings.max_size, self._settings.idempotency_settings.ttl
+        )
+        self.session_accounts = SessionAccounts(
+            self._settings.idempotency_settings.max_size, self._settings.idempotency_settings.ttl
+        )
+        self.rate_limiter = RateLimiter(self._settings.rate_limit_settings)
+        self.shed_stats = ShedStats()
+        self.coalescing_stats = CoalescingStats()
+        self.single_flight = SingleFlight(self.coalescing_stats)
+        log_settings = self._settings.log_settings
+        self.request_logger = RequestLogger(log_settings.request_sample_rate, log_settings.log_payloads)
+
+        self.db = DBManager(
+            self._settings.db_settings,
+            session_ttl=datetime.timedelta(seconds=self._settings.session_settings.ttl),
+            max_sessions_per_account=self._settings.session_settings.max_per_account,
+        )
 
     def __get_items_data(self) -> ShopItemList:
         with open(self._settings.items_path, encoding="utf-8") as f:
+            #  NDJSON file is parsed line by line, so that large catalogs are never held in memory as a whole text
+            if self._settings.items_path.endswith(NDJSON_SUFFIXES):
+                return ShopItemList([ShopItem.model_validate_json(line) for line in f if line.strip()])
             return ShopItemList.model_validate_json(f.read())
 
-    async def add_new_data_to_items(self, shop_items: ShopItemList) -> None:
-        async with self.db.sessionmaker.begin() as session:
-            for shop_item in shop_items:
-                await self.db.add_shop_item(session, shop_item)
+    #  Catalog
+
+    @property
+    def catalog_version(self) -> int:
+        return self.catalog.version
 
-        async with self.db.sessionmaker.begin() as session:
-            result = await self.db.get_shop_items_list(session)
-            for item in result:
-                print(item.uuid, item.name, item.price, sep=" | ")
+    async def load_catalog(self) -> None:
+        async with self.db.sessionmaker() as session:
+            shop_item_list = await self.db.get_shop_items_list(session)
+        #  Ids of the first shard never change and are never reused, so they serve as compact handles of items
+        shop_items = ShopItemList(
+            [shop_item.to_shop_item_model().model_copy(update={"handle": shop_item.id}) for shop_item in shop_item_list]
+        )
+        #  Indexes of big catalogs take seconds to build, requests are served from the old catalog meanwhile
+        self.catalog = await asyncio.to_thread(Catalog, self.catalog.version + 1, shop_items)
+        logging.info("Loaded catalog version %d with %d items", self.catalog.version, len(shop_items))
+
+        event = ServerEvent(event_type=EventType.CATALOG_CHANGED, catalog_version=self.catalog.version)
+        frame = Protocol.construct(ProtocolResponse.of(event).model_dump())
+        for conn in self._subscriptions:
+            conn.send_nowait(frame)
+
+    #  Only inserted and changed items are written, on every shard. Requests keep being served from the old catalog
+    #  until the new one is loaded
+
+    async def reload_items(self) -> bool:
+        async with self._reload_lock:
+            #  Taken before reading, so that a change made meanwhile is picked up by the next check
+            self._items_mtime = os.stat(self._settings.items_path).st_mtime
+            #  Parsing and diffing a big items file take seconds, connections are served meanwhile. Catalog is never
+            #  changed in place, so the snapshot is safe to read from the worker thread
+            catalog = self.catalog
+            diff = await asyncio.to_thread(lambda: catalog.diff(self.__get_items_data()))
+            if diff.is_empty:
+                return False
+
+            logging.info("Applying catalog changes: %d inserted, %d changed", len(diff.inserted), len(diff.changed))
+            for sessionmaker in self.db.sessionmakers:
+                async with sessionmaker.begin() as session:
+                    await self.db.apply_shop_items_changes(session, diff.inserted, diff.changed)
+            await self.load_catalog()
+            return True
+
+    def request_items_reload(self) -> None:
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = asyncio.create_task(self.reload_items_safely())
+
+    async def reload_items_safely(self) -> None:
+        try:
+            await self.reload_items()
+        except (OSError, ValidationError, SQLAlchemyError):
+            logging.exception("Failed to reload items from %s", self._settings.items_path)
+
+    async def watch_items_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self._settings.items_reload_interval)
+            try:
+                mtime = os.stat(self._settings.items_path).st_mtime
+            except OSError:
+                logging.exception("Failed to check items file %s", self._settings.items_path)
+                continue
+            if mtime != self._items_mtime:
+                await self.reload_items_safely()
+
+    def __make_ssl_context(self) -> Optional[ssl.SSLContext]:
+        tls_settings = self._settings.tls_settings
+        if not tls_settings.enabled:
+            return None
+        return tls.make_server_context(
+            tls_settings.certfile,
+            tls_settings.keyfile,
+            minimum_version=tls_settings.minimum_version,
+            ciphers=tls_settings.ciphers,
+            session_tickets=tls_settings.session_tickets,
+            num_tickets=tls_settings.num_tickets,
+        )
 
     async def __aenter__(self):
+        # Build validators before the first connection, not on its first request
+        warmup()
         # Open DB connection
         await self.db.init_db_engine()
         # Parse Items Data
-        shop_items = self.__get_items_data()
-        await self.add_new_data_to_items(shop_items)
+        await self.load_catalog()
+        await self.db.replicate_shop_items()
+        #  Server, whose items file can not be applied, still starts with the catalog, which is in DB
+        await self.reload_items_safely()
+
+        self._purge_task = asyncio.create_task(self.purge_expired_sessions_forever())
+        if self._settings.items_reload_interval:
+            self._watch_task = asyncio.create_task(self.watch_items_forever())
 
         # Open Socket to serve connections
-        self._socket = await asyncio.start_server(self.handle_client, self._settings.host, self._settings.port)
-        await self._socket.start_serving()
+        ssl_context = self.__make_ssl_context()
+        if self._inherited_socket is not None:
+            self._socket = await asyncio.start_server(self.handle_client, sock=self._inherited_socket, ssl=ssl_context)
+        elif self._settings.port is not None:
+            self._socket = await asyncio.start_server(
+                self.handle_client, self._settings.host, self._settings.port, ssl=ssl_context
+            )
+        for path in self._settings.unix_paths:
+            #  Socket file left by a stopped server is removed by asyncio before binding
+            unix_server = await asyncio.start_unix_server(self.handle_client, path)
+            self._unix_servers.append((path, os.stat(path).st_ino, unix_server))
 
         return self
 
     async def __aexit__(self, exc_type, exc_value, exc_tb):
+        self._purge_task.cancel()
+        for task in (self._watch_task, self._reload_task):
+            if task is not None:
+                task.cancel()
+
         # Send all clients a close request
         for conn in self._sessions:
             await conn.close()
 
         # Close Socket
-        self._socket.close()
-        await self._socket.wait_closed()
+        self.close_listeners()
+        for listener in self.listeners:
+            await listener.wait_closed()
 
         # Close DB connection
         await self.db.shutdown()
 
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-        logging.info("Got a new connection")
         conn = Connection(reader, writer)
         self._sessions.append(conn)
-
-        async for message in conn.listen():
-            logging.debug("Got a new message")
-            logging.debug(message)
-            request = ProtocolRequest.model_validate_json(message)
+        peername = writer.get_extra_info("peername")
+        #  Peers of Unix sockets have no address, so their requests are limited by session only
+        peer = peername[0] if isinstance(peername, tuple) else None
+        logging.debug("Got a new connection from %s", peer)
+
+        try:
+            async for message in conn.listen():
+                received = time.monotonic()
+                try:
+                    request = validate_request(message)
+                except ValidationError:
+                    await conn.send_bad_request()
+                    continue
+                sampled = self.request_logger.sample()
+                started = time.perf_counter() if sampled else 0.0
+                conn.is_busy = True
+                try:
+                    response, frame = await self.handle_request(peer, request, conn, received)
+                    await conn.send(frame)
+                finally:
+                    conn.is_busy = False
+                if sampled:
+                    self.log_request(request, response, peer, time.perf_counter() - started, message)
+                if self._draining:
+                    break
+        except OSError:
+            #  Peer has gone, while its response was being sent
+            logging.debug("Connection from %s has been reset", peer)
+        finally:
+            logging.debug("Connection from %s closed, removing it from sessions", peer)
+            self.unsubscribe(conn)
+            await conn.close()
+            self._sessions.remove(conn)
+            if self._draining and not self._sessions:
+                self._drained.set()
+
+    #  Every request gets a response, also the one, whose handler has failed unexpectedly, so that client never waits
+    #  for it forever, and connection, which is not busy anymore, can be drained
+    async def handle_request(
+        self, peer: Optional[str], request: ProtocolRequest, conn: Connection, received: float
+    ) -> Tuple[ProtocolResponse, bytes]:
+        try:
+            self.check_rate_limit(peer, request)
+            deadline = received + request.timeout_ms / 1e3 if request.timeout_ms is not None else None
+            return await run_before_deadline(
+                request.action_type, self.respond(request, conn), deadline, self.shed_stats
+            )
+        except errors.BaseGameServerException as e:
+            error = e
+        except Exception:  #  pylint: disable=broad-exception-caught
+            logging.exception("Failed to handle %s request", request.action_type.value)
+            error = errors.UnknownServerError(request.action_type.value)
+        response = ProtocolResponse.of(ErrorResponse.from_base_gameserver_exception(error))
+        return response, Protocol.construct(response.model_dump())
+
+    def log_request(  #  pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, request: ProtocolRequest, response: ProtocolResponse, peer: Optional[str], elapsed: float, message: bytes
+    ) -> None:
+        fields = {
+            "action": request.action_type.value,
+            "peer": peer,
+            "error_code": response.data.error_code if isinstance(response.data, ErrorResponse) else None,
+            "duration_ms": round(elapsed * 1e3, 3),
+        }
+        self.request_logger.log(fields, message)
+
+    @property
+    def listeners(self) -> List[asyncio.AbstractServer]:
+        servers = [unix_server for _, _, unix_server in self._unix_servers]
+        return [self._socket, *servers] if self._socket is not None else servers
+
+    #  TCP one, which is handed off on restart. Unix sockets are bound by successor again, at the same paths
+    @property
+    def listening_socket(self) -> Optional[socket.socket]:
+        return self._socket.sockets[0] if self._socket is not None else None
+
+    def close_listeners(self) -> None:
+        for listener in self.listeners:
+            listener.close()
+        for path, inode, _ in self._unix_servers:
             try:
-                response = await self.action_dispatcher(request)
-            except errors.BaseGameServerException as e:
-                response = ProtocolResponse(data=ErrorResponse.from_base_gameserver_exception(e))
-
-            await conn.send(Protocol.construct(response.model_dump()))
-
-        logging.info("Connection closed, removing it from sessions")
-        await conn.close()
-        self._sessions.remove(conn)
+                #  Successor, which has bound the path already, owns the socket file now
+                if os.stat(path).st_ino == inode:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    #  Stops accepting connections and lets requests in flight finish. Idle connections are closed right away, busy
+    #  ones right after their response is sent, and the rest once timeout has passed. Returns amount of connections,
+    #  which had to be closed in the middle of a request
+    async def drain(self, timeout: Optional[float] = None) -> int:
+        if timeout is None:
+            timeout = self._settings.drain_timeout
+        self._draining = True
+        self._drained = asyncio.Event()
+        self.close_listeners()
+        if not self._sessions:
+            self._drained.set()
+        for conn in list(self._sessions):
+            if not conn.is_busy:
+                await conn.close()
+
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        interrupted = len(self._sessions)
+        for conn in list(self._sessions):
+            await conn.close()
+        logging.info("Connections are drained, %d of them have been interrupted", interrupted)
+        return interrupted
+
+    #  Requests are limited both by peer address, so that reconnecting does not help, and by session
+
+    def check_rate_limit(self, peer: Optional[str], request: ProtocolRequest) -> None:
+        if not self._settings.rate_limit_settings.enabled:
+            return
+        if not self.rate_limiter.acquire(peer, request.session_uuid, request.action_type):
+            raise errors.RateLimitExceeded(request.action_type.value)
+
+    #  Events
+
+    def subscribe(self, conn: Connection, account_uuid: uuid.UUID) -> None:
+        self.unsubscribe(conn)
+        self._subscribers.setdefault(account_uuid, set()).add(conn)
+        self._subscriptions[conn] = account_uuid
+
+    def unsubscribe(self, conn: Connection) -> None:
+        account_uuid = self._subscriptions.pop(conn, None)
+        if account_uuid is None:
+            return
+        subscribers = self._subscribers[account_uuid]
+        subscribers.discard(conn)
+        if not subscribers:
+            del self._subscribers[account_uuid]
+
+    def publish(self, account_uuid: uuid.UUID, events: List[ServerEvent]) -> None:
+        #  Every change is published right after its commit
+        subscribers = self._subscribers.get(account_uuid)
+        if not subscribers:
+            return
+        frames = [Protocol.construct(ProtocolResponse.of(event).model_dump()) for event in events]
+        for conn in subscribers:
+            for frame in frames:
+                conn.send_nowait(frame)
+
+    #  Identical reads in flight share one response and one frame of it, errors included
+    async def respond(
+        self, request: ProtocolRequest, conn: Optional[Connection] = None
+    ) -> Tuple[ProtocolResponse, bytes]:
+        account = None
+        if request.action_type == ActionType.GET_GAME_DATA_SESSION:
+            #  Account is found once, both for the key and for the read itself
+            account = await self.find_session_account(request.session_uuid)
+        key = self.coalescing_key(request, account)
+        if key is None:
+            return await self.__respond(request, conn, account)
+        response, frame = await self.single_flight.run(key, lambda: self.__respond(request, account=account))
+        #  Game session is shared by every session of the account, each one gets its own uuid back
+        if isinstance(response.data, GameSessionData) and response.data.session_uuid != request.session_uuid:
+            response = ProtocolResponse.of(response.data.model_copy(update={"session_uuid": request.session_uuid}))
+            frame = Protocol.construct(response.model_dump())
+        return response, frame
+
+    #  Game session reads are shared by sessions of the same account, while its state version stays the same. Version
+    #  is read, when request arrives, so a read never joins one, which has started before a change committed before it
+    def coalescing_key(self, request: ProtocolRequest, account: Optional[DBAccount] = None) -> Optional[Hashable]:
+        if request.action_type == ActionType.GET_GAME_DATA_SESSION and account is not None:
+            known_version = request.data.known_version if request.data is not None else None
+            compact = request.data.compact if request.data is not None else False
+            catalog_version = self.catalog.version if compact else None
+            return request.action_type, account.uuid, account.state_version, known_version, compact, catalog_version
+        return None
+
+    async def __respond(
+        self, request: ProtocolRequest, conn: Optional[Connection] = None, account: Optional[DBAccount] = None
+    ) -> Tuple[ProtocolResponse, bytes]:
+        response = await self.action_dispatcher(request, conn, account)
+        return response, Protocol.construct(response.model_dump())
 
     # It would be better if Dispatcher was a class, where you can register handler using decorator
-    async def action_dispatcher(self, request: ProtocolRequest) -> ProtocolResponse:
-        logging.info("Dispatching action %s", request.action_type.value)
+    async def action_dispatcher(
+        self, request: ProtocolRequest, conn: Optional[Connection] = None, account: Optional[DBAccount] = None
+    ) -> ProtocolResponse:
         if request.action_type == ActionType.LOGIN:
             result = await self.login_into_account(request.data)
         elif request.action_type == ActionType.LOGOUT:
             result = await self.logout_from_account(request.session_uuid)
+            if conn is not None:
+                self.unsubscribe(conn)
         elif request.action_type == ActionType.BUY_ITEM:
             result = await self.buy_shop_item(request.session_uuid, request.data)
         elif request.action_type == ActionType.SELL_ITEM:
             result = await self.sell_shop_item(request.session_uuid, request.data)
         elif request.action_type == ActionType.GET_ALL_ITEM_LIST:
             result = await self.get_all_shop_items()
+        elif request.action_type == ActionType.SEARCH_ITEMS:
+            result = await self.search_shop_items(request.data)
         elif request.action_type == ActionType.GET_GAME_DATA_SESSION:
-            result = await self.get_game_session_data(request.session_uuid)
+            known_version = request.data.known_version if request.data is not None else None
+            compact = request.data.compact if request.data is not None else False
+            result = await self.get_game_session_data(request.session_uuid, known_version, compact, account)
+        elif request.action_type == ActionType.STREAM_ITEMS and conn is not None:
+            result = await self.stream_shop_items(request.session_uuid, request.data, conn)
+        elif request.action_type == ActionType.SUBSCRIBE and conn is not None:
+            result = await self.subscribe_to_events(request.session_uuid, conn)
         else:
-            result = ProtocolResponse(data=ErrorResponse.from_base_gameserver_exception(errors.UnknownActionType()))
+            result = ErrorResponse.from_base_gameserver_exception(errors.UnknownActionType())
 
-        return ProtocolResponse(data=result)
+        return ProtocolResponse.of(result)
 
     async def get_all_shop_items(self) -> ShopItemList:
-        logging.info("Begin retrieving all shop items")
-        async with self.db.sessionmaker() as session:
-            shop_item_list = await self.db.get_shop_items_list(session)
-        result = ShopItemList([])
-        for shop_item in shop_item_list:
-            result.append(shop_item.to_shop_item_model())
+        return self.catalog.shop_items
 
-        return result
+    async def search_shop_items(self, params: ItemSearchRequest) -> ShopItemList:
+        shop_items = self.catalog.search_index.search(
+            params.query, params.type, params.min_price, params.max_price, params.limit
+        )
+        return ShopItemList(shop_items)
+
+    #  Chunks are sent as soon as they are ready, with backpressure of the connection, and the returned empty one ends
+    #  the stream. Error ends it as well, also after some chunks have been sent
+    async def stream_shop_items(
+        self, session_uuid: uuid.UUID, params: ItemStreamRequest, conn: Connection
+    ) -> ShopItemChunk:
+        if params.owned:
+            chunks = self.__iter_owned_shop_items(session_uuid, params.chunk_size)
+        else:
+            chunks = self.__iter_catalog(params.chunk_size)
+        async for shop_items in chunks:
+            await conn.send(Protocol.construct(ProtocolResponse.of(ShopItemChunk(shop_items=shop_items)).model_dump()))
+        return ShopItemChunk(shop_items=[], last=True)
+
+    #  Catalog is held in memory, chunks are cut from the snapshot, which was current, when stream has started.
+    #  Nothing is awaited to cut them and drain returns at once, while peer keeps up, so loop is given away between them
+    async def __iter_catalog(self, chunk_size: int) -> AsyncIterator[List[ShopItem]]:
+        shop_items = self.catalog.shop_items.root
+        for start in range(0, len(shop_items), chunk_size):
+            yield shop_items[start : start + chunk_size]
+            await asyncio.sleep(0)
+
+    async def __iter_owned_shop_items(self, session_uuid: uuid.UUID, chunk_size: int) -> AsyncIterator[List[ShopItem]]:
+        async with self.db.sessionmaker_for_session(session_uuid)() as session:
+            account = await self.db.find_account_by_session(session, session_uuid)
+            async for shop_items in self.db.stream_user_owned_items(session, account, chunk_size):
+                yield [shop_item.to_shop_item_model() for shop_item in shop_items]
 
     async def get_owned_shop_items(self, sessio_uuid: uuid.UUID) -> ShopItemList:
-        async with self.db.sessionmaker() as session:
+        async with self.db.sessionmaker_for_session(sessio_uuid)() as session:
             account = await self.db.find_account_by_session(session, sessio_uuid)
             shop_item_list = await self.db.get_user_owned_items_list(session, account)
         result = ShopItemList([])
@@ -128,67 +477,235 @@ class Server:
 
     #  Creates account and its dependencies. Then returns account session
 
+    #  Everything is done in a single transaction on the account's shard. Brand new account owns nothing yet and its
+    #  starting balance is known, so game session of a first login is built without reading anything back
     async def login_into_account(self, params: AccountLoginRequest) -> GameSessionData:
-        async with self.db.sessionmaker.begin() as session:
-            account = await self.db.find_or_create_account(
+        async with self.db.sessionmaker_for_nickname(params.nickname).begin() as session:
+            account, starting_balance_cents = await self.db.find_or_create_account(
                 session,
                 params.nickname,
-                float(self._settings.min_amount_of_money),
-                float(self._settings.max_amount_of_money),
+                self._settings.min_amount_of_money_cents,
+                self._settings.max_amount_of_money_cents,
             )
             account_session = await self.db.create_account_session(session, account)
+            if starting_balance_cents is not None:
+                balance_cents, owned_shop_items = starting_balance_cents, []
+            else:
+                balance_cents = (await self.db.get_account_balance(session, account)).balance_cents
+                owned_shop_items = await self.db.get_user_owned_items_list(session, account)
+
+        return self.__make_game_session_data(
+            account, account_session.uuid, balance_cents, owned_shop_items, params.compact
+        )
 
-        return await self.get_game_session_data(account_session.uuid)
-
-    async def get_game_session_data(self, session_uuild: uuid.UUID) -> GameSessionData:
-        async with self.db.sessionmaker() as session:
-            account = await self.db.find_account_by_session(session, session_uuild)
+    #  Account, which has been found already, is not looked up again. Its state version may then be older than the
+    #  balance and items read after it, so client asks for a delta since it next time and gets those changes again
+    async def get_game_session_data(
+        self,
+        session_uuild: uuid.UUID,
+        known_version: Optional[int] = None,
+        compact: bool = False,
+        account: Optional[DBAccount] = None,
+    ) -> Union[GameSessionData, GameSessionDelta]:
+        async with self.db.sessionmaker_for_session(session_uuild)() as session:
+            if account is None:
+                account = await self.db.find_account_by_session(session, session_uuild)
             balance = await self.db.get_account_balance(session, account)
+            # Delta is possible only while change log still has every change since the known version
+            if known_version is not None and 0 <= account.state_version - known_version <= self.db.ITEM_CHANGES_HISTORY:
+                item_changes = []
+                if known_version < account.state_version:
+                    item_changes = await self.db.get_item_changes_since(session, account, known_version)
+                return self.__make_game_session_delta(account.state_version, balance.balance_cents, item_changes)
+
             owned_shop_items = await self.db.get_user_owned_items_list(session, account)
 
+        return self.__make_game_session_data(account, session_uuild, balance.balance_cents, owned_shop_items, compact)
+
+    def __make_game_session_data(  #  pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        account: DBAccount,
+        session_uuid: uuid.UUID,
+        balance_cents: int,
+        owned_shop_items: List[DBShopItem],
+        compact: bool,
+    ) -> GameSessionData:
         result = ShopItemList([])
+        owned_item_handles: Optional[List[int]] = [] if compact else None
+        catalog = self.catalog
         for shop_item in owned_shop_items:
-            result.append(shop_item.to_shop_item_model())
+            #  Compact clients resolve handles with their copy of the catalog, unknown items are still sent whole
+            catalog_item = catalog.by_uuid.get(shop_item.uuid) if compact else None
+            if catalog_item is not None and catalog_item.handle is not None:
+                owned_item_handles.append(catalog_item.handle)
+            else:
+                result.append(shop_item.to_shop_item_model())
 
         return GameSessionData(
             account_uuid=account.uuid,
             nickname=account.nickname,
-            balance=balance.balance,
-            session_uuid=session_uuild,
+            balance=balance_cents,
+            session_uuid=session_uuid,
             owned_items=result,
+            version=account.state_version,
+            owned_item_handles=owned_item_handles,
+            catalog_version=catalog.version if compact else None,
+        )
+
+    @staticmethod
+    def __make_game_session_delta(
+        version: int, balance_cents: int, item_changes: List[Tuple[DBShopItem, bool]]
+    ) -> GameSessionDelta:
+        # Only the last change of every item matters
+        last_changes: Dict[uuid.UUID, Tuple[DBShopItem, bool]] = {}
+        for shop_item, added in item_changes:
+            last_changes[shop_item.uuid] = (shop_item, added)
+
+        return GameSessionDelta(
+            version=version,
+            balance=balance_cents,
+            added_items=ShopItemList(
+                [shop_item.to_shop_item_model() for shop_item, added in last_changes.values() if added]
+            ),
+            removed_item_uuids=[item_uuid for item_uuid, (_, added) in last_changes.items() if not added],
         )
 
     async def logout_from_account(self, session_uuid: uuid.UUID) -> BasicResponse:
-        async with self.db.sessionmaker.begin() as session:
+        async with self.db.sessionmaker_for_session(session_uuid).begin() as session:
             await self.db.delete_account_session(session, session_uuid)
+        self.session_accounts.discard(session_uuid)
         return BasicResponse(status="ok")
 
+    async def find_session_account(self, session_uuid: uuid.UUID) -> DBAccount:
+        async with self.db.sessionmaker_for_session(session_uuid)() as session:
+            return await self.db.find_account_by_session(session, session_uuid)
+
+    #  Requests with idempotency key are applied once per account, so that a retry from a new session after reconnect
+    #  is not applied again. Retries get the stored result, and the key reused for another action or item is rejected.
+    #  Account of a session is looked up in DB once and then kept in memory, so that a replay never touches DB. Replay
+    #  is then not checked against the session itself, so it still gets the stored result, after the session has
+    #  expired or has been logged out on another server process. Requests, which are applied, are always checked
+
+    async def run_idempotent(
+        self,
+        session_uuid: uuid.UUID,
+        action_type: ActionType,
+        params: ItemRequest,
+        handler: Callable[[uuid.UUID, ItemRequest], Awaitable[BasicResponse]],
+    ) -> BasicResponse:
+        if params.idempotency_key is None:
+            return await handler(session_uuid, params)
+        account_uuid = self.session_accounts.get(session_uuid)
+        if account_uuid is None:
+            account_uuid = (await self.find_session_account(session_uuid)).uuid
+            self.session_accounts.add(session_uuid, account_uuid)
+        return await self.idempotency_cache.run(
+            (account_uuid, params.idempotency_key),
+            lambda: handler(session_uuid, params),
+            fingerprint=(action_type, self.resolve_item_uuid(params)),
+        )
+
+    def resolve_item_uuid(self, params: ItemRequest) -> uuid.UUID:
+        if params.item_uuid is not None:
+            return params.item_uuid
+        shop_item = self.catalog.by_handle.get(params.item_handle)
+        if shop_item is None:
+            raise errors.ShopItemNotFound(str(params.item_handle))
+        return shop_item.uuid
+
     async def buy_shop_item(self, session_uuid: uuid.UUID, params: ItemRequest) -> BasicResponse:
-        async with self.db.sessionmaker.begin() as session:
+        return await self.run_idempotent(session_uuid, ActionType.BUY_ITEM, params, self.__buy_shop_item)
+
+    async def sell_shop_item(self, session_uuid: uuid.UUID, params: ItemRequest) -> BasicResponse:
+        return await self.run_idempotent(session_uuid, ActionType.SELL_ITEM, params, self.__sell_shop_item)
+
+    async def __buy_shop_item(self, session_uuid: uuid.UUID, params: ItemRequest) -> BasicResponse:
+        async with self.db.sessionmaker_for_session(session_uuid).begin() as session:
             account = await self.db.find_account_by_session(session, session_uuid)
-            shop_item = await self.db.find_item_by_uuid(session, params.item_uuid)
+            shop_item = await self.db.find_item_by_uuid(session, self.resolve_item_uuid(params))
             balance = await self.db.get_account_balance(session, account)
-            if balance.balance < shop_item.price:
-                raise errors.NotEnoughFundsInAccountBalance(balance.balance)
+            if balance.balance_cents < shop_item.price:
+                raise errors.NotEnoughFundsInAccountBalance(balance.balance_cents)
 
             await self.db.add_item_ownership_to_account(session, account, shop_item)
-            await self.db.substitute_balance_from_account(session, account, shop_item.price)
-
+            balance = await self.db.substitute_balance_from_account(session, account, shop_item.price)
+            version = await self.db.bump_state_version(session, account, shop_item, added=True)
+
+        self.publish(
+            account.uuid,
+            [
+                ServerEvent(event_type=EventType.ITEM_ADDED, shop_item=shop_item.to_shop_item_model(), version=version),
+                ServerEvent(event_type=EventType.BALANCE_CHANGED, balance=balance.balance_cents, version=version),
+            ],
+        )
         return BasicResponse(status="ok")
 
-    async def sell_shop_item(self, session_uuid: uuid.UUID, params: ItemRequest) -> BasicResponse:
-        async with self.db.sessionmaker.begin() as session:
+    async def __sell_shop_item(self, session_uuid: uuid.UUID, params: ItemRequest) -> BasicResponse:
+        async with self.db.sessionmaker_for_session(session_uuid).begin() as session:
             account = await self.db.find_account_by_session(session, session_uuid)
-            shop_item = await self.db.find_item_by_uuid(session, params.item_uuid)
+            shop_item = await self.db.find_item_by_uuid(session, self.resolve_item_uuid(params))
 
             await self.db.remove_item_ownership_of_account(session, account, shop_item)
-            await self.db.add_balance_to_account(session, account, shop_item.price)
+            balance = await self.db.add_balance_to_account(session, account, shop_item.price)
+            version = await self.db.bump_state_version(session, account, shop_item, added=False)
+
+        self.publish(
+            account.uuid,
+            [
+                ServerEvent(
+                    event_type=EventType.ITEM_REMOVED, shop_item=shop_item.to_shop_item_model(), version=version
+                ),
+                ServerEvent(event_type=EventType.BALANCE_CHANGED, balance=balance.balance_cents, version=version),
+            ],
+        )
+        return BasicResponse(status="ok")
+
+    async def subscribe_to_events(self, session_uuid: uuid.UUID, conn: Connection) -> BasicResponse:
+        async with self.db.sessionmaker_for_session(session_uuid)() as session:
+            account = await self.db.find_account_by_session(session, session_uuid)
 
+        self.subscribe(conn, account.uuid)
         return BasicResponse(status="ok")
 
-    async def change_account_balace(self, session_uuid: uuid.UUID, new_balance: float) -> BasicResponse:
-        async with self.db.sessionmaker.begin() as session:
+    #  Purges in separate short transactions, so that table is never locked for a long time
+
+    async def purge_expired_sessions(self) -> int:
+        session_settings = self._settings.session_settings
+        created_before = utcnow() - datetime.timedelta(seconds=session_settings.ttl)
+        total = 0
+        for sessionmaker in self.db.sessionmakers:
+            while True:
+                async with sessionmaker.begin() as session:
+                    purged = await self.db.purge_expired_sessions(
+                        session, created_before, session_settings.purge_batch_size
+                    )
+                total += purged
+                if purged < session_settings.purge_batch_size:
+                    break
+                # Let other requests run between batches
+                await asyncio.sleep(0)
+
+        return total
+
+    async def purge_expired_sessions_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self._settings.session_settings.purge_interval)
+            try:
+                purged = await self.purge_expired_sessions()
+            except SQLAlchemyError:
+                logging.exception("Failed to purge expired sessions")
+                continue
+            if purged:
+                logging.info("Purged %d expired sessions", purged)
+
+    async def change_account_balace(self, session_uuid: uuid.UUID, new_balance_cents: int) -> BasicResponse:
+        async with self.db.sessionmaker_for_session(session_uuid).begin() as session:
             account = await self.db.find_account_by_session(session, session_uuid)
-            await self.db.set_balance_for_account(session, account, new_balance)
+            balance = await self.db.set_balance_for_account(session, account, new_balance_cents)
+            version = await self.db.bump_state_version(session, account)
 
+        self.publish(
+            account.uuid,
+            [ServerEvent(event_type=EventType.BALANCE_CHANGED, balance=balance.balance_cents, version=version)],
+        )
         return BasicResponse(status="ok")
@@ -2,37 +2,66 @@ import argparse
 import asyncio
 import logging
 import signal
-from gameserver.server import Server
+import sys
+
+from gameserver.server import Server, handoff, logs
+from gameserver.misc.settings import ServerSettings, make_settings_parser, validate_settings
 
 
 def parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--settings-path",
-        dest="settings_path",
-        type=str,
-        default="settings.json",
-        help="Path to the server settings",
-    )
+    return make_settings_parser().parse_args()
+
 
-    return parser.parse_args()
+#  Starts a successor with the listening socket inherited and, once it serves, lets this process drain and exit
+async def hand_off(server: Server, handoff_timeout: float, stop: asyncio.Future) -> None:
+    logging.info("Handing listening socket off to a new server process")
+    successor = await handoff.spawn_successor(server.listening_socket, sys.argv, handoff_timeout)
+    if successor is None:
+        logging.error("Handoff has failed, keep serving")
+        return
+    logging.info("Server process %d serves now, draining connections", successor.pid)
+    if not stop.done():
+        stop.set_result(None)
 
 
 async def main():
     args = parse_args()
-    async with Server(args.settings_path):
+    settings = validate_settings(args.settings_path)
+    #  Records are written on a thread of listener, it is stopped last, so that nothing logged on exit is lost
+    listener = logs.setup_logging(settings.log_settings)
+    try:
+        await serve(args, settings)
+    finally:
+        listener.stop()
+
+
+async def serve(args: argparse.Namespace, settings: ServerSettings) -> None:
+    async with Server(args.settings_path, sock=handoff.inherited_socket()) as server:
+        handoff.notify_ready()
         loop = asyncio.get_running_loop()
+        # Reload items file on demand: kill -HUP <pid>
+        loop.add_signal_handler(signal.SIGHUP, server.request_items_reload)
+
+        stop = loop.create_future()
+
+        def request_stop() -> None:
+            if not stop.done():
+                stop.set_result(None)
+
+        handoff_tasks = []
+
+        # Restart without downtime: kill -USR2 <pid>
+        def request_handoff() -> None:
+            if not handoff_tasks or handoff_tasks[-1].done():
+                handoff_tasks.append(asyncio.create_task(hand_off(server, settings.handoff_timeout, stop)))
 
-        # Dirty hack to run forever, as we don't have other work than to wait until server shutdown
-        infinite_furute = loop.create_future()
-        loop.add_signal_handler(signal.SIGINT, infinite_furute.cancel)
-        loop.add_signal_handler(signal.SIGTERM, infinite_furute.cancel)
-        try:
-            await infinite_furute
-        except asyncio.CancelledError:
-            infinite_furute = None
+        loop.add_signal_handler(signal.SIGINT, request_stop)
+        loop.add_signal_handler(signal.SIGTERM, request_stop)
+        loop.add_signal_handler(signal.SIGUSR2, request_handoff)
+        await stop
+        # Requests in flight are finished before exit, both on shutdown and on handoff
+        await server.drain(settings.drain_timeout)
 
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.DEBUG)
     asyncio.run(main())
@@ -0,0 +1,146 @@
+import json
+import os
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import pytest
+from sqlalchemy import event
+
+from gameserver.server import Server
+
+#  Performance gate for actions of Server. Every action runs against an embedded SQLite database, and statements and
+#  round trips it issues are counted through engine events and checked against budgets declared by tests. Wall times
+#  are compared with the baseline in perf_baseline.json, which is recorded with --update-perf-baseline
+
+ITEMS_PATH = os.path.join(os.path.dirname(__file__), "..", "gameserver", "data", "shop_items.json")
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "perf_baseline.json")
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("perf", "performance budgets")
+    group.addoption("--update-perf-baseline", action="store_true", help="Record wall times of actions as baseline")
+    group.addoption(
+        "--perf-tolerance", type=float, default=5.0, help="How many times an action may be slower than its baseline"
+    )
+
+
+class StatementCounter:
+    def __init__(self) -> None:
+        self.statements = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    #  Every statement, commit and rollback is a round trip to the database, executemany included
+    @property
+    def round_trips(self) -> int:
+        return self.statements + self.commits + self.rollbacks
+
+    def reset(self) -> None:
+        self.statements = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def attach(self, server: Server) -> None:
+        for engine in server.db.engines:
+            event.listen(engine.sync_engine, "before_cursor_execute", self._on_cursor_execute)
+            event.listen(engine.sync_engine, "commit", self._on_commit)
+            event.listen(engine.sync_engine, "rollback", self._on_rollback)
+
+    def detach(self, server: Server) -> None:
+        for engine in server.db.engines:
+            event.remove(engine.sync_engine, "before_cursor_execute", self._on_cursor_execute)
+            event.remove(engine.sync_engine, "commit", self._on_commit)
+            event.remove(engine.sync_engine, "rollback", self._on_rollback)
+
+    def _on_cursor_execute(self, *_) -> None:
+        self.statements += 1
+
+    def _on_commit(self, *_) -> None:
+        self.commits += 1
+
+    def _on_rollback(self, *_) -> None:
+        self.rollbacks += 1
+
+
+class PerfBudget:  #  pylint: disable=too-few-public-methods
+    def __init__(self, baseline: Dict[str, float], tolerance: float, update_baseline: bool) -> None:
+        self.baseline = baseline
+        self.tolerance = tolerance
+        self.update_baseline = update_baseline
+        self.wall_times: Dict[str, float] = {}
+
+    async def check(  #  pylint: disable=too-many-arguments,too-many-locals
+        self,
+        server: Server,
+        name: str,
+        action: Callable[[], Awaitable],
+        *,
+        statements: int,
+        round_trips: int,
+        setup: Optional[Callable[[], Awaitable]] = None,
+        repeat: int = 20,
+    ) -> None:
+        counter = StatementCounter()
+        counts: List[int] = []
+        durations: List[float] = []
+        for _ in range(repeat):
+            if setup is not None:
+                await setup()
+            counter.attach(server)
+            started = time.perf_counter()
+            try:
+                await action()
+            finally:
+                durations.append(time.perf_counter() - started)
+                counter.detach(server)
+            counts.append((counter.statements, counter.round_trips))
+            counter.reset()
+
+        worst_statements = max(statements for statements, _ in counts)
+        worst_round_trips = max(round_trips for _, round_trips in counts)
+        assert worst_statements <= statements, f"{name}: {worst_statements} statements, budget is {statements}"
+        assert worst_round_trips <= round_trips, f"{name}: {worst_round_trips} round trips, budget is {round_trips}"
+
+        wall_time = statistics.median(durations) * 1e3
+        self.wall_times[name] = round(wall_time, 3)
+        if not self.update_baseline and name in self.baseline:
+            #  Millisecond of slack keeps actions, which take microseconds, from failing on scheduling noise
+            limit = self.baseline[name] * self.tolerance + 1.0
+            assert wall_time <= limit, f"{name}: {wall_time:.2f} ms, baseline is {self.baseline[name]:.2f} ms"
+
+
+@pytest.fixture(scope="session")
+def perf_budget(request):
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    update_baseline = request.config.getoption("--update-perf-baseline")
+    budget = PerfBudget(baseline, request.config.getoption("--perf-tolerance"), update_baseline)
+    yield budget
+
+    if update_baseline and budget.wall_times:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted({**baseline, **budget.wall_times}.items())), f, indent=2)
+            f.write("\n")
+
+
+@pytest.fixture
+def embedded_settings_path(tmp_path) -> str:
+    settings = {
+        "host": "127.0.0.1",
+        "port": 3233,
+        "items_path": ITEMS_PATH,
+        "items_reload_interval": 0,
+        "db_settings": {"db_type": "sqlite", "database": str(tmp_path / "gm.db"), "is_test_env": False},
+        "min_amount_of_money_cents": 7000,
+        "max_amount_of_money_cents": 12400,
+        #  Budgets are about queries, not about being rejected
+        "rate_limit_settings": {"enabled": False},
+    }
+    settings_path = str(tmp_path / "settings.json")
+    with open(settings_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+    return settings_path
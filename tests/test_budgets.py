@@ -0,0 +1,122 @@
+import itertools
+import time
+
+import pytest
+
+from gameserver.server import Server
+from gameserver.misc.errors import AccountDoesntOwnItem
+from gameserver.misc.models import AccountLoginRequest, ItemRequest
+from gameserver.misc.protocol import GetGameSessionRequest
+
+#  Statements and round trips, which every action may issue at most. Raising a budget has to be a deliberate change
+BUDGETS = {
+    "login_new_account": (5, 6),
+    "login_existing_account": (6, 7),
+    "get_game_session_data": (4, 5),
+    "get_game_session_delta": (4, 5),
+    #  Whole request, as it comes from a connection. Account is found for coalescing in a transaction of its own, and
+    #  read is done with it, so dispatch adds the end of that transaction only
+    "get_game_session_request": (4, 6),
+    "get_all_shop_items": (0, 0),
+    "get_owned_shop_items": (3, 4),
+    "buy_shop_item": (12, 13),
+    "sell_shop_item": (11, 12),
+    "logout": (2, 3),
+}
+
+
+async def check(perf_budget, server: Server, name: str, action, **kwargs) -> None:
+    statements, round_trips = BUDGETS[name]
+    await perf_budget.check(server, name, action, statements=statements, round_trips=round_trips, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_login_budgets(perf_budget, embedded_settings_path):
+    async with Server(embedded_settings_path) as server:
+        nicknames = (f"budget{index}" for index in itertools.count())
+
+        async def login_new_account():
+            await server.login_into_account(AccountLoginRequest(nickname=next(nicknames)))
+
+        async def login_existing_account():
+            await server.login_into_account(AccountLoginRequest(nickname="rickastley"))
+
+        await login_existing_account()
+        await check(perf_budget, server, "login_new_account", login_new_account)
+        await check(perf_budget, server, "login_existing_account", login_existing_account)
+
+        #  Every logout needs a session of its own, which is created by setup outside of the budget
+        session_uuids = []
+
+        async def login_for_logout():
+            game_session_data = await server.login_into_account(AccountLoginRequest(nickname="rickastley"))
+            session_uuids.append(game_session_data.session_uuid)
+
+        await check(
+            perf_budget,
+            server,
+            "logout",
+            lambda: server.logout_from_account(session_uuids.pop()),
+            setup=login_for_logout,
+        )
+
+
+@pytest.mark.asyncio
+async def test_item_budgets(perf_budget, embedded_settings_path):
+    async with Server(embedded_settings_path) as server:
+        session_uuid = (await server.login_into_account(AccountLoginRequest(nickname="rickastley"))).session_uuid
+        shop_item = (await server.get_all_shop_items()).at(0)
+        item_request = ItemRequest(item_uuid=shop_item.uuid)
+
+        async def make_buyable():
+            try:
+                await server.sell_shop_item(session_uuid, item_request)
+            except AccountDoesntOwnItem:
+                pass
+            await server.change_account_balace(session_uuid, shop_item.price)
+
+        async def make_sellable():
+            await make_buyable()
+            await server.buy_shop_item(session_uuid, item_request)
+
+        await check(
+            perf_budget,
+            server,
+            "buy_shop_item",
+            lambda: server.buy_shop_item(session_uuid, item_request),
+            setup=make_buyable,
+        )
+        await check(
+            perf_budget,
+            server,
+            "sell_shop_item",
+            lambda: server.sell_shop_item(session_uuid, item_request),
+            setup=make_sellable,
+        )
+        await check(perf_budget, server, "get_all_shop_items", server.get_all_shop_items)
+        await check(perf_budget, server, "get_owned_shop_items", lambda: server.get_owned_shop_items(session_uuid))
+
+
+@pytest.mark.asyncio
+async def test_game_session_budgets(perf_budget, embedded_settings_path):
+    async with Server(embedded_settings_path) as server:
+        session_uuid = (await server.login_into_account(AccountLoginRequest(nickname="rickastley"))).session_uuid
+        shop_item = (await server.get_all_shop_items()).at(0)
+        await server.change_account_balace(session_uuid, shop_item.price)
+        await server.buy_shop_item(session_uuid, ItemRequest(item_uuid=shop_item.uuid))
+        version = (await server.get_game_session_data(session_uuid)).version
+
+        await check(perf_budget, server, "get_game_session_data", lambda: server.get_game_session_data(session_uuid))
+        await check(
+            perf_budget,
+            server,
+            "get_game_session_delta",
+            lambda: server.get_game_session_data(session_uuid, known_version=version - 1),
+        )
+        request = GetGameSessionRequest(session_uuid=session_uuid)
+        await check(
+            perf_budget,
+            server,
+            "get_game_session_request",
+            lambda: server.handle_request(None, request, None, time.monotonic()),
+        )
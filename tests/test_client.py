@@ -1,9 +1,48 @@
+import asyncio
+import json
 import logging
+import os
+import subprocess
+import sys
+import uuid
 import pytest
-from hamcrest import assert_that, not_none, none
+from hamcrest import (
+    assert_that,
+    contains_exactly,
+    equal_to,
+    has_entries,
+    has_item,
+    has_properties,
+    instance_of,
+    is_not,
+    less_than_or_equal_to,
+    none,
+    only_contains,
+    not_none,
+)
 
 from gameserver.server import Server
 from gameserver.client import Client
+from gameserver.misc.models import (
+    BasicResponse,
+    ErrorResponse,
+    GameSessionDelta,
+    ItemRequest,
+    ShopItemList,
+    ShopItemType,
+)
+from gameserver.misc.protocol import Protocol
+from gameserver.misc.errors import (
+    ConnectionLost,
+    DeadlineExceeded,
+    RateLimitExceeded,
+    ShopItemNotFound,
+    UnknownServerError,
+)
+from gameserver.misc.settings import RateLimitSettings
+from gameserver.server.ratelimit import RateLimiter
+from gameserver.misc.tls import generate_self_signed_certificate, make_client_context
+from gameserver.server.logs import REQUEST_LOGGER, JSONFormatter
 
 SETTINGS_PATH = "tests/settings.json"
 
@@ -45,3 +84,372 @@ async def test_get_all_items(caplog):
             assert_that(client.game_session, not_none())
 
             await client.send_get_all_items_request()
+
+
+@pytest.mark.asyncio
+async def test_search_items():
+    async with Server(SETTINGS_PATH) as server:
+        async with Client(server._settings.host, server._settings.port) as client:  #  pylint: disable=protected-access
+            await client.send_login_request("rickastley")
+            shop_item = (await client.send_get_all_items_request()).at(0)
+
+            response = await client.send_search_items_request(shop_item.name[:3], item_type=shop_item.type)
+            assert_that(response, instance_of(ShopItemList))
+            assert_that(response.as_dict(), has_entries({str(shop_item.uuid): shop_item}))
+            assert_that(response, only_contains(has_properties(type=shop_item.type)))
+
+            response = await client.send_search_items_request("", max_price=shop_item.price, limit=1)
+            assert_that(response, contains_exactly(has_properties(price=less_than_or_equal_to(shop_item.price))))
+            other_type = next(item_type for item_type in ShopItemType if item_type != shop_item.type)
+            response = await client.send_search_items_request(shop_item.name, item_type=other_type, limit=100)
+            assert_that(response, is_not(has_item(has_properties(uuid=shop_item.uuid))))
+
+
+@pytest.mark.asyncio
+async def test_stream_items():
+    async with Server(SETTINGS_PATH) as server:
+        async with Client(server._settings.host, server._settings.port) as client:  #  pylint: disable=protected-access
+            await client.send_login_request("rickastley")
+            shop_items = await client.send_get_all_items_request()
+
+            chunks = [chunk async for chunk in client.stream_items(chunk_size=3)]
+            assert_that(chunks, only_contains(instance_of(ShopItemList)))
+            assert_that([len(chunk) for chunk in chunks], only_contains(less_than_or_equal_to(3)))
+            assert_that([item for chunk in chunks for item in chunk], equal_to(shop_items.root))
+
+            for shop_item in shop_items.root[:2]:
+                await server.change_account_balace(client.game_session.session_uuid, shop_item.price)
+                await client.send_buy_request(shop_item.uuid)
+            owned = [item async for chunk in client.stream_items(owned=True, chunk_size=1) for item in chunk]
+            assert_that({item.uuid for item in owned}, equal_to({item.uuid for item in shop_items.root[:2]}))
+
+            # Stream, which is left after its first chunk, is skipped by the next request
+            async for chunk in client.stream_items(chunk_size=1):
+                break
+            assert_that(await client.send_get_all_items_request(), equal_to(shop_items))
+
+
+@pytest.mark.asyncio
+async def test_stream_items_ends_after_timeout():
+    async with Server(SETTINGS_PATH) as server:
+        stream_shop_items = server.stream_shop_items
+
+        async def slow_stream_shop_items(session_uuid, params, conn):
+            send = conn.send
+
+            async def slow_send(frame):
+                await asyncio.sleep(0.05)
+                await send(frame)
+
+            conn.send = slow_send
+            try:
+                return await stream_shop_items(session_uuid, params, conn)
+            finally:
+                del conn.send
+
+        server.stream_shop_items = slow_stream_shop_items
+        async with Client(server._settings.host, server._settings.port) as client:  #  pylint: disable=protected-access
+            await client.send_login_request("rickastley")
+
+            chunks = [chunk async for chunk in client.stream_items(chunk_size=1, timeout=0.1)]
+            # Chunks, which have been sent before the deadline, are followed by the error, which ends the stream
+            assert_that(len(chunks), less_than_or_equal_to(3))
+            assert_that(chunks[-1], has_properties(error_code=DeadlineExceeded().code))
+            assert_that(server.shed_stats, has_properties(cancelled=1))
+            assert_that(await client.send_get_all_items_request(), instance_of(ShopItemList))
+
+
+@pytest.mark.asyncio
+async def test_subscription_events():
+    async with Server(SETTINGS_PATH) as server:
+        host, port = server._settings.host, server._settings.port  #  pylint: disable=protected-access
+        async with Client(host, port) as client, Client(host, port) as other_client:
+            nickname = "rickastley"
+
+            await client.send_login_request(nickname)
+            await other_client.send_login_request(nickname)
+            assert_that(await client.send_subscribe_request(), instance_of(BasicResponse))
+            assert_that(await other_client.send_subscribe_request(), instance_of(BasicResponse))
+
+            shop_item = (await client.send_get_all_items_request()).at(0)
+            await server.change_account_balace(client.game_session.session_uuid, shop_item.price)
+            await client.send_buy_request(shop_item.uuid)
+
+            # Events are pushed before response, so game session is already up to date without refreshing
+            assert_that(client.game_session.owned_items, has_item(has_properties(uuid=shop_item.uuid)))
+            assert_that(client.game_session.balance, equal_to(0))
+
+            # Any round trip guarantees that events pushed earlier have been processed
+            await other_client.send_get_all_items_request()
+            assert_that(other_client.game_session.owned_items, has_item(has_properties(uuid=shop_item.uuid)))
+
+            await client.send_sell_request(shop_item.uuid)
+            assert_that(len(client.game_session.owned_items), equal_to(0))
+            assert_that(client.game_session.balance, equal_to(shop_item.price))
+
+
+@pytest.mark.asyncio
+async def test_refresh_game_session_applies_delta():
+    async with Server(SETTINGS_PATH) as server:
+        async with Client(server._settings.host, server._settings.port) as client:  #  pylint: disable=protected-access
+            nickname = "rickastley"
+
+            await client.send_login_request(nickname)
+            shop_item = (await client.send_get_all_items_request()).at(0)
+            await server.change_account_balace(client.game_session.session_uuid, shop_item.price)
+            await server.buy_shop_item(client.game_session.session_uuid, ItemRequest(item_uuid=shop_item.uuid))
+
+            response = await client.refresh_game_session()
+            assert_that(response, instance_of(GameSessionDelta))
+            assert_that(client.game_session.owned_items, has_item(has_properties(uuid=shop_item.uuid)))
+            assert_that(client.game_session.balance, equal_to(0))
+            assert_that(client.game_session.version, equal_to(response.version))
+
+
+@pytest.mark.asyncio
+async def test_compact_client_expands_item_handles():
+    async with Server(SETTINGS_PATH) as server:
+        host, port = server._settings.host, server._settings.port  #  pylint: disable=protected-access
+        async with Client(host, port, compact=True) as client:
+            await client.send_login_request("compact")
+            shop_item = (await client.send_get_all_items_request()).at(0)
+            assert_that(client.find_item_handle(shop_item.uuid), equal_to(shop_item.handle))
+            await server.change_account_balace(client.game_session.session_uuid, shop_item.price)
+            await client.send_buy_request(shop_item.uuid)
+
+        async with Client(host, port, compact=True) as client:
+            game_session = await client.send_login_request("compact")
+            assert_that(game_session.owned_item_handles, none())
+            assert_that(game_session.owned_items, has_item(has_properties(uuid=shop_item.uuid)))
+
+
+@pytest.mark.asyncio
+async def test_server_drains_connections():
+    async with Server(SETTINGS_PATH) as server:
+        host, port = server._settings.host, server._settings.port  #  pylint: disable=protected-access
+        get_all_shop_items = server.get_all_shop_items
+
+        async def slow_get_all_shop_items():
+            await asyncio.sleep(0.2)
+            return await get_all_shop_items()
+
+        server.get_all_shop_items = slow_get_all_shop_items
+        async with Client(host, port) as idle_client, Client(host, port) as busy_client:
+            await idle_client.send_login_request("rickastley")
+            await busy_client.send_login_request("rickastley")
+
+            request = asyncio.create_task(busy_client.send_get_all_items_request())
+            await asyncio.sleep(0.05)
+            interrupted = await server.drain(timeout=5)
+
+            assert_that(interrupted, equal_to(0))
+            # Request in flight has been finished, while idle connection has been closed right away
+            assert_that(await request, instance_of(ShopItemList))
+            with pytest.raises(ConnectionError):
+                await idle_client.send_get_all_items_request()
+
+
+@pytest.mark.asyncio
+async def test_unexpected_error_is_answered():
+    async with Server(SETTINGS_PATH) as server:
+        host, port = server._settings.host, server._settings.port  #  pylint: disable=protected-access
+
+        async def broken_search_shop_items(*args):
+            raise RuntimeError("broken")
+
+        server.search_shop_items = broken_search_shop_items
+        async with Client(host, port) as client:
+            await client.send_login_request("rickastley")
+            response = await client.send_search_items_request("a")
+            assert_that(response, has_properties(error_code=UnknownServerError().code))
+            # Connection is served further, and is drained right away, as it is not busy
+            assert_that(await client.send_get_all_items_request(), instance_of(ShopItemList))
+            assert_that(await asyncio.wait_for(server.drain(timeout=5), 1), equal_to(0))
+
+
+@pytest.mark.asyncio
+async def test_client_reconnects_with_the_same_session():
+    async with Server(SETTINGS_PATH) as server:
+        host, port = server._settings.host, server._settings.port  #  pylint: disable=protected-access
+
+        async def drop_connections():
+            for conn in list(server._sessions):  #  pylint: disable=protected-access
+                await conn.close()
+
+        def drop_after_first_call(action):
+            calls = []
+
+            async def wrapper(*args):
+                result = await action(*args)
+                if not calls:
+                    calls.append(args)
+                    await drop_connections()
+                return result
+
+            return wrapper
+
+        server.buy_shop_item = drop_after_first_call(server.buy_shop_item)
+        server.sell_shop_item = drop_after_first_call(server.sell_shop_item)
+        async with Client(host, port) as client:
+            await client.send_login_request("rickastley")
+            await client.send_subscribe_request()
+            session_uuid = client.game_session.session_uuid
+            shop_item = (await client.send_get_all_items_request()).at(0)
+            await server.change_account_balace(session_uuid, shop_item.price)
+
+            # Idle connection is dropped, next request opens it again and goes on with the same session
+            await drop_connections()
+            await asyncio.sleep(0.05)
+            assert_that(await client.refresh_game_session(), instance_of(GameSessionDelta))
+            assert_that(client, has_properties(reconnects=1, is_subscribed=True))
+            assert_that(client.game_session.session_uuid, equal_to(session_uuid))
+
+            # Buy without idempotency key can not be sent again, as it is unknown whether it has been applied
+            with pytest.raises(ConnectionLost):
+                await client.send_buy_request(shop_item.uuid)
+            assert_that(client.reconnects, equal_to(2))
+
+            # Sell with idempotency key is sent again, and server replies with the result of the first attempt
+            response = await client.send_sell_request(shop_item.uuid, idempotency_key="reconnect")
+            assert_that(response, instance_of(BasicResponse))
+            assert_that(client.reconnects, equal_to(3))
+            assert_that(client.game_session.session_uuid, equal_to(session_uuid))
+
+
+@pytest.mark.asyncio
+async def test_request_timeout_cancels_work_on_server():
+    async with Server(SETTINGS_PATH) as server:
+        host, port = server._settings.host, server._settings.port  #  pylint: disable=protected-access
+        get_game_session_data = server.get_game_session_data
+
+        async def slow_get_game_session_data(*args):
+            await asyncio.sleep(1)
+            return await get_game_session_data(*args)
+
+        server.get_game_session_data = slow_get_game_session_data
+        async with Client(host, port) as client:
+            await client.send_login_request("rickastley")
+
+            with pytest.raises(asyncio.TimeoutError):
+                await client.refresh_game_session(timeout=0.1)
+            # Server has given up on the request as well, and its late error response is skipped by client
+            assert_that(await client.send_get_all_items_request(timeout=1), instance_of(ShopItemList))
+            assert_that(server.shed_stats, has_properties(cancelled=1, expired=0))
+
+
+@pytest.mark.asyncio
+async def test_invalid_frame_drops_connection():
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await reader.read(1)
+        writer.write(Protocol.construct({"kind": "unknown"}))
+        await writer.drain()
+        await reader.read()
+        writer.close()
+
+    listener = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    async with listener:
+        async with Client("127.0.0.1", port, reconnect_attempts=0) as client:
+            # Request, which waits for its response, fails instead of waiting forever
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(client.send_login_request("rickastley"), 1)
+            assert_that(client.is_connection_lost, equal_to(True))
+
+
+@pytest.mark.asyncio
+async def test_tls_session_is_resumed(tmp_path, embedded_settings_path):
+    certfile, keyfile = generate_self_signed_certificate(str(tmp_path))
+    with open(embedded_settings_path, encoding="utf-8") as f:
+        settings = json.load(f)
+    settings["tls_settings"] = {"enabled": True, "certfile": certfile, "keyfile": keyfile}
+    with open(embedded_settings_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+
+    async with Server(embedded_settings_path) as server:
+        host, port = server._settings.host, server._settings.port  #  pylint: disable=protected-access
+        ssl_context = make_client_context(certfile)
+        async with Client(host, port, ssl_context=ssl_context, server_hostname="localhost") as client:
+            await client.send_login_request("rickastley")
+            assert_that(client.tls_session_reused, equal_to(False))
+
+        # Second connection resumes session of the first one instead of full handshake
+        async with Client(host, port, ssl_context=ssl_context, server_hostname="localhost") as client:
+            await client.send_login_request("rickastley")
+            assert_that(await client.send_get_all_items_request(), instance_of(ShopItemList))
+            assert_that(client.tls_session_reused, equal_to(True))
+
+        # Connection, which is opened again after a drop, resumes the session of the dropped one
+        ssl_context = make_client_context(certfile)
+        async with Client(host, port, ssl_context=ssl_context, server_hostname="localhost") as client:
+            await client.send_login_request("rickastley")
+            for conn in list(server._sessions):  #  pylint: disable=protected-access
+                await conn.close()
+            await asyncio.sleep(0.05)
+            assert_that(await client.send_get_all_items_request(), instance_of(ShopItemList))
+            assert_that(client.reconnects, equal_to(1))
+            assert_that(client.tls_session_reused, equal_to(True))
+
+
+@pytest.mark.asyncio
+async def test_client_connects_to_unix_socket(tmp_path, embedded_settings_path):
+    path = str(tmp_path / "gameserver.sock")
+    with open(embedded_settings_path, encoding="utf-8") as f:
+        settings = json.load(f)
+    settings["port"] = None
+    settings["unix_paths"] = [path]
+    with open(embedded_settings_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+
+    async with Server(embedded_settings_path) as server:
+        assert_that(server.listening_socket, none())
+        async with Client(path=path) as client:
+            await client.send_login_request("rickastley")
+            assert_that(await client.send_get_all_items_request(), instance_of(ShopItemList))
+    # Socket file is removed with the server
+    assert_that(os.path.exists(path), equal_to(False))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("log_payloads", [False, True])
+async def test_requests_are_logged_as_structured_records(caplog, embedded_settings_path, log_payloads):
+    with open(embedded_settings_path, encoding="utf-8") as f:
+        settings = json.load(f)
+    settings["log_settings"] = {"request_sample_rate": 1, "log_payloads": log_payloads}
+    with open(embedded_settings_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+    caplog.set_level(logging.INFO, logger=REQUEST_LOGGER)
+
+    async with Server(embedded_settings_path) as server:
+        async with Client(server._settings.host, server._settings.port) as client:  #  pylint: disable=protected-access
+            await client.send_login_request("rickastley")
+            await client.send_buy_request(uuid.uuid4())
+
+    records = [json.loads(JSONFormatter().format(record)) for record in caplog.records if record.name == REQUEST_LOGGER]
+    assert_that(records, contains_exactly(has_entries(action="login"), has_entries(action="buy_item")))
+    assert_that(records[0], has_entries(peer="127.0.0.1", error_code=None, duration_ms=instance_of(float)))
+    assert_that(records[1], has_entries(error_code=ShopItemNotFound().code))
+    # Payloads hold nicknames and session uuids, so they are written only on demand
+    assert_that(all("payload" in record for record in records), equal_to(log_payloads))
+    assert_that(any("rickastley" in str(record) for record in records), equal_to(log_payloads))
+
+
+@pytest.mark.asyncio
+async def test_requests_are_rate_limited():
+    async with Server(SETTINGS_PATH) as server:
+        server.rate_limiter = RateLimiter(RateLimitSettings(peer_rate=0.1, peer_burst=20))
+        async with Client(server._settings.host, server._settings.port) as client:  #  pylint: disable=protected-access
+            await client.send_login_request("rickastley")
+            responses = [await client.send_get_all_items_request() for _ in range(4)]
+
+            assert_that(responses[-1], instance_of(ErrorResponse))
+            assert_that(responses[-1].error_code, equal_to(RateLimitExceeded().code))
+
+
+def test_client_does_not_import_server_modules():
+    code = (
+        "import sys; import gameserver.client; "
+        "print(' '.join(m for m in sys.modules if m.startswith(('sqlalchemy', 'gameserver.db', 'gameserver.server'))))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+
+    assert_that(result.stdout.strip(), equal_to(""))
@@ -1,18 +1,74 @@
+import asyncio
+import datetime
+import json
+import os
 import random
+import socket
+import threading
+import time
+import uuid
 
 import pytest
-from hamcrest import assert_that, equal_to, is_not, has_item, has_properties, instance_of
+from pydantic import ValidationError
+from sqlalchemy import create_engine, event, insert, select, text
+from hamcrest import (
+    assert_that,
+    equal_to,
+    is_not,
+    has_item,
+    has_properties,
+    instance_of,
+    greater_than,
+    has_key,
+    has_length,
+    less_than_or_equal_to,
+    only_contains,
+    not_none,
+)
 
-from gameserver.server import Server
-from gameserver.misc.models import AccountLoginRequest, ItemRequest, GameSessionData, ShopItemList
+from gameserver.server import Server, handoff
+from gameserver.db import tables
+from gameserver.db.migrations import MIGRATION_STEPS, MIGRATIONS, latest_version, mark_step_done, migrate
+from gameserver.server.catalog import Catalog
+from gameserver.server.coalescing import SingleFlight
+from gameserver.server.deadlines import ShedStats, run_before_deadline
+from gameserver.server.idempotency import IdempotencyCache
+from gameserver.server.ratelimit import RateLimiter, TokenBuckets
+from gameserver.server.search import SearchIndex
+from gameserver.misc.connection import Connection
+from gameserver.misc.settings import RateLimitSettings
+from gameserver.misc.models import (
+    ActionType,
+    AccountLoginRequest,
+    GameSessionRequest,
+    ItemRequest,
+    GameSessionData,
+    GameSessionDelta,
+    ShopItem,
+    ShopItemList,
+    ShopItemType,
+)
 from gameserver.misc.errors import (
     AccountSessionNotFound,
+    AccountSessionExpired,
     BaseGameServerException,
+    DeadlineExceeded,
+    IdempotencyKeyReused,
     NotEnoughFundsInAccountBalance,
     AccountAlreadyOwnsItem,
     AccountDoesntOwnItem,
+    ShopItemNotFound,
+)
+from gameserver.misc.protocol import (
+    Protocol,
+    ProtocolResponse,
+    BuyItemRequest,
+    GetAllItemListRequest,
+    GetGameSessionRequest,
+    LogoutRequest,
+    validate_request,
+    validate_response,
 )
-from gameserver.misc.protocol import Protocol, ProtocolResponse
 
 SETTINGS_PATH = "tests/settings.json"
 
@@ -53,7 +109,44 @@ async def test_logout():
 async def test_get_all_item_list():
     async with Server(SETTINGS_PATH) as server:
         shop_item_list = await server.get_all_shop_items()
-        Protocol.construct(ProtocolResponse(data=shop_item_list).model_dump())
+        Protocol.construct(ProtocolResponse.of(shop_item_list).model_dump())
+
+
+def test_search_index():
+    def make_item(name: str, price: int, item_type: ShopItemType = ShopItemType.SHIP) -> ShopItem:
+        return ShopItem(name=name, price=price, type=item_type)
+
+    def search(*args, **kwargs):
+        return [shop_item.name for shop_item in index.search(*args, **kwargs)]
+
+    shop_items = [
+        make_item("Falcon Mk II", 900),
+        make_item("Falcon", 1000),
+        make_item("Falconer", 500),
+        make_item("Iron Falcon", 300),
+        make_item("falcon wing", 200, ShopItemType.EQUIPMENT),
+        make_item("Yamato", 8000),
+    ]
+    #  Numbered items put more tokens under prefix "1" than are merged on every query
+    shop_items.extend(make_item(f"Hull {number}", number, ShopItemType.EQUIPMENT) for number in range(1, 301))
+    index = SearchIndex(shop_items)
+
+    # Whole words go first, shorter names first among them
+    assert_that(search("falcon"), equal_to(["Falcon", "falcon wing", "Iron Falcon", "Falcon Mk II", "Falconer"]))
+    assert_that(search("falcon "), equal_to(["Falcon", "falcon wing", "Iron Falcon", "Falcon Mk II"]))
+    assert_that(search("FALCON m"), equal_to(["Falcon Mk II"]))
+    assert_that(search("fal", limit=2), equal_to(["Falcon", "Falconer"]))
+    assert_that(search("falk"), equal_to([]))
+    # Filters
+    assert_that(search("falcon", item_type=ShopItemType.EQUIPMENT), equal_to(["falcon wing"]))
+    assert_that(search("fal", min_price=400, max_price=950), equal_to(["Falconer", "Falcon Mk II"]))
+    assert_that(search("", max_price=250, limit=3), equal_to(["Hull 1", "Hull 2", "Hull 3"]))
+    # Prefix with prepared postings
+    assert_that(search("hull 2", limit=5), equal_to(["Hull 2", "Hull 20", "Hull 21", "Hull 22", "Hull 23"]))
+    assert_that(search("1", min_price=100, max_price=120), has_length(20))
+    assert_that(search("hull 1", item_type=ShopItemType.SHIP), equal_to([]))
+    assert_that(search("yam"), equal_to(["Yamato"]))
+    assert_that(search("yamato hull"), equal_to([]))
 
 
 @pytest.mark.asyncio
@@ -67,7 +160,7 @@ async def test_buy_item():
         shop_item = random.choice(shop_item_list.root)
 
         # Remove account balance add credits random
-        await server.change_account_balace(game_session_data.session_uuid, float(shop_item.price))
+        await server.change_account_balace(game_session_data.session_uuid, shop_item.price)
 
         game_session_data = await server.get_game_session_data(game_session_data.session_uuid)
 
@@ -82,7 +175,7 @@ async def test_buy_item():
         except BaseGameServerException as e:
             assert_that(isinstance(e, NotEnoughFundsInAccountBalance))
 
-        await server.change_account_balace(game_session_data.session_uuid, float(shop_item.price))
+        await server.change_account_balace(game_session_data.session_uuid, shop_item.price)
 
         try:
             await server.buy_shop_item(game_session_data.session_uuid, ItemRequest(item_uuid=shop_item.uuid))
@@ -101,7 +194,7 @@ async def test_sell_item():
         shop_item = random.choice(shop_item_list.root)
 
         # Remove account balance add credits random
-        await server.change_account_balace(game_session_data.session_uuid, float(shop_item.price))
+        await server.change_account_balace(game_session_data.session_uuid, shop_item.price)
 
         await server.buy_shop_item(game_session_data.session_uuid, ItemRequest(item_uuid=shop_item.uuid))
 
@@ -119,19 +212,631 @@ async def test_sell_item():
             assert_that(isinstance(e, AccountDoesntOwnItem))
 
 
+@pytest.mark.asyncio
+async def test_compact_game_session():
+    async with Server(SETTINGS_PATH) as server:
+        game_session_data = await server.login_into_account(AccountLoginRequest(nickname="compact", compact=True))
+        shop_item = random.choice((await server.get_all_shop_items()).root)
+        assert_that(shop_item.handle, not_none())
+
+        await server.change_account_balace(game_session_data.session_uuid, shop_item.price)
+        await server.buy_shop_item(game_session_data.session_uuid, ItemRequest(item_handle=shop_item.handle))
+
+        game_session_data = await server.get_game_session_data(game_session_data.session_uuid, compact=True)
+        assert_that(game_session_data.owned_item_handles, equal_to([shop_item.handle]))
+        assert_that(len(game_session_data.owned_items), equal_to(0))
+        assert_that(game_session_data.catalog_version, equal_to(server.catalog_version))
+
+        await server.sell_shop_item(game_session_data.session_uuid, ItemRequest(item_handle=shop_item.handle))
+        with pytest.raises(ShopItemNotFound):
+            await server.sell_shop_item(game_session_data.session_uuid, ItemRequest(item_handle=2**31))
+        with pytest.raises(ValidationError):
+            ItemRequest(item_uuid=shop_item.uuid, item_handle=shop_item.handle)
+
+
+@pytest.mark.asyncio
+async def test_statements_hit_compiled_cache():
+    async with Server(SETTINGS_PATH) as server:
+        login_request = AccountLoginRequest(nickname="rickastley")
+
+        game_session_data = await server.login_into_account(login_request)
+        await server.get_game_session_data(game_session_data.session_uuid)
+
+        # Every statement has been compiled at least once, so further calls must only hit the cache
+        server.db.cache_stats.reset()
+        for _ in range(10):
+            await server.get_game_session_data(game_session_data.session_uuid)
+
+        assert_that(server.db.cache_stats.misses, equal_to(0))
+        assert_that(server.db.cache_stats.hits, greater_than(0))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_logins():
+    async with Server(SETTINGS_PATH) as server:
+        nickname = uuid.uuid4().hex[:12]
+        sessions = await asyncio.gather(
+            *(server.login_into_account(AccountLoginRequest(nickname=nickname)) for _ in range(8))
+        )
+
+        assert_that({game_session.account_uuid for game_session in sessions}, has_length(1))
+        assert_that({game_session.balance for game_session in sessions}, has_length(1))
+        assert_that({game_session.session_uuid for game_session in sessions}, has_length(8))
+        async with server.db.sessionmaker_for_nickname(nickname)() as session:
+            accounts = (await session.execute(select(tables.DBAccount).where(tables.DBAccount.nickname == nickname)))
+            assert_that(accounts.scalars().all(), has_length(1))
+
+
+@pytest.mark.asyncio
+async def test_sessions_limit_per_account():
+    async with Server(SETTINGS_PATH) as server:
+        login_request = AccountLoginRequest(nickname="rickastley")
+        max_sessions = server._settings.session_settings.max_per_account  #  pylint: disable=protected-access
+
+        oldest_game_session_data = await server.login_into_account(login_request)
+        for _ in range(max_sessions):
+            game_session_data = await server.login_into_account(login_request)
+
+        # Oldest session has been evicted, the newest one is still alive
+        with pytest.raises(AccountSessionNotFound):
+            await server.get_game_session_data(oldest_game_session_data.session_uuid)
+        await server.get_game_session_data(game_session_data.session_uuid)
+
+
+@pytest.mark.asyncio
+async def test_expired_sessions_are_purged():
+    async with Server(SETTINGS_PATH) as server:
+        login_request = AccountLoginRequest(nickname="rickastley")
+
+        game_session_data = await server.login_into_account(login_request)
+
+        server._settings.session_settings.ttl = 1  #  pylint: disable=protected-access
+        server.db.session_ttl = datetime.timedelta(seconds=1)
+        await asyncio.sleep(2)
+
+        with pytest.raises(AccountSessionExpired):
+            await server.get_game_session_data(game_session_data.session_uuid)
+
+        assert_that(await server.purge_expired_sessions(), greater_than(0))
+        with pytest.raises(AccountSessionNotFound):
+            await server.get_game_session_data(game_session_data.session_uuid)
+
+
+@pytest.mark.asyncio
+async def test_sessionless_requests_are_unauthorized():
+    async with Server(SETTINGS_PATH) as server:
+        shop_item = (await server.get_all_shop_items()).root[0]
+        requests = [
+            GetGameSessionRequest(),
+            BuyItemRequest(data=ItemRequest(item_uuid=shop_item.uuid)),
+            LogoutRequest(),
+        ]
+        for request in requests:
+            response, _ = await server.handle_request(None, request, None, time.monotonic())
+            assert_that(response.data, has_properties(error_code=AccountSessionNotFound().code))
+
+
+@pytest.mark.asyncio
+async def test_schema_is_migrated():
+    async with Server(SETTINGS_PATH) as server:
+        assert_that(await server.db.get_schema_version(), equal_to(latest_version()))
+
+        # Applying migrations again is a no-op
+        assert_that(await server.db.migrate(), equal_to(latest_version()))
+
+        query_plans = await server.db.explain_hot_queries()
+        assert_that(query_plans, has_key("find_account_by_session"))
+        assert_that(query_plans.values(), only_contains(not_none()))
+
+
+def make_database_before_cents(conn) -> None:
+    for pending in MIGRATIONS[:3]:
+        pending.apply(conn)
+    # Balance table as it was before money was stored in cents
+    conn.execute(text("DROP TABLE gm_account_balance"))
+    conn.execute(
+        text("CREATE TABLE gm_account_balance (id INTEGER PRIMARY KEY, account INTEGER, balance NUMERIC(10, 2))")
+    )
+    conn.execute(text("INSERT INTO gm_account_balance (id, account, balance) VALUES (1, 1, 13.52)"))
+    # Uuid as it was stored before it became binary
+    conn.execute(
+        text(
+            "INSERT INTO gm_shop_item (uuid, type, name, price) "
+            "VALUES ('1f1ecd78d8ef4067979b38b9a4be33ee', 'SHIP', 'Sampson', 24)"
+        )
+    )
+    conn.execute(insert(tables.DBSchemaVersion).values(version=3, description="Before cents"))
+
+
+def test_old_database_is_migrated(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        make_database_before_cents(conn)
+
+        assert_that(migrate(conn), equal_to(latest_version()))
+        assert_that(conn.execute(text("SELECT balance_cents FROM gm_account_balance")).scalar(), equal_to(1352))
+        assert_that(conn.execute(text("SELECT price FROM gm_shop_item")).scalar(), equal_to(2400))
+        shop_item_uuid = conn.execute(select(tables.DBShopItem.uuid)).scalar()
+        assert_that(shop_item_uuid, equal_to(uuid.UUID("1f1ecd78d8ef4067979b38b9a4be33ee")))
+    engine.dispose()
+
+
+def test_interrupted_migration_is_resumed(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        make_database_before_cents(conn)
+        # Run, which has converted prices, and has been interrupted before the old balance column is dropped
+        conn.execute(text("UPDATE gm_shop_item SET price = price * 100"))
+        MIGRATION_STEPS.create(conn)
+        mark_step_done(conn, "prices_in_cents")
+
+        assert_that(migrate(conn), equal_to(latest_version()))
+        assert_that(conn.execute(text("SELECT balance_cents FROM gm_account_balance")).scalar(), equal_to(1352))
+        assert_that(conn.execute(text("SELECT price FROM gm_shop_item")).scalar(), equal_to(2400))
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_game_session_delta():
+    async with Server(SETTINGS_PATH) as server:
+        login_request = AccountLoginRequest(nickname="rickastley")
+
+        game_session_data = await server.login_into_account(login_request)
+        session_uuid = game_session_data.session_uuid
+        shop_item = (await server.get_all_shop_items()).at(0)
+
+        await server.change_account_balace(session_uuid, shop_item.price)
+        await server.buy_shop_item(session_uuid, ItemRequest(item_uuid=shop_item.uuid))
+
+        delta = await server.get_game_session_data(session_uuid, game_session_data.version)
+        assert_that(delta, instance_of(GameSessionDelta))
+        assert_that(delta.version, equal_to(game_session_data.version + 2))
+        assert_that(delta.added_items, has_item(has_properties(uuid=shop_item.uuid)))
+        assert_that(delta.balance, equal_to(0))
+
+        # Nothing has changed since the last known version
+        unchanged = await server.get_game_session_data(session_uuid, delta.version)
+        assert_that(unchanged, has_properties(version=delta.version, removed_item_uuids=[]))
+        assert_that(unchanged.added_items.root, equal_to([]))
+
+        await server.sell_shop_item(session_uuid, ItemRequest(item_uuid=shop_item.uuid))
+        delta = await server.get_game_session_data(session_uuid, delta.version)
+        assert_that(delta.removed_item_uuids, equal_to([shop_item.uuid]))
+
+        # Unknown version leads to the full snapshot
+        snapshot = await server.get_game_session_data(session_uuid, delta.version + 1)
+        assert_that(snapshot, instance_of(GameSessionData))
+
+
+@pytest.mark.asyncio
+async def test_idempotent_item_requests():
+    async with Server(SETTINGS_PATH) as server:
+        game_session_data = await server.login_into_account(AccountLoginRequest(nickname="rickastley"))
+        session_uuid = game_session_data.session_uuid
+        shop_item = (await server.get_all_shop_items()).at(0)
+        await server.change_account_balace(session_uuid, shop_item.price * 2)
+
+        buy_request = ItemRequest(item_uuid=shop_item.uuid, idempotency_key="buy-1")
+        # Concurrent retry waits for the first attempt and gets its result
+        responses = await asyncio.gather(
+            server.buy_shop_item(session_uuid, buy_request), server.buy_shop_item(session_uuid, buy_request)
+        )
+        assert_that(responses, only_contains(has_properties(status="ok")))
+        # Replay finds the account of its session in memory, and never touches DB
+        statements = []
+
+        def count_statement(*_):
+            statements.append(1)
+
+        for engine in server.db.engines:
+            event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+        response = await server.buy_shop_item(session_uuid, buy_request)
+        for engine in server.db.engines:
+            event.remove(engine.sync_engine, "before_cursor_execute", count_statement)
+        assert_that(response.status, equal_to("ok"))
+        assert_that(server.idempotency_cache.hits, equal_to(2))
+        assert_that(statements, has_length(0))
+
+        game_session_data = await server.get_game_session_data(session_uuid)
+        assert_that(game_session_data.balance, equal_to(shop_item.price))
+
+        # Request without key is applied again
+        with pytest.raises(AccountAlreadyOwnsItem):
+            await server.buy_shop_item(session_uuid, ItemRequest(item_uuid=shop_item.uuid))
+
+        # Failed requests are not stored
+        sell_request = ItemRequest(item_uuid=shop_item.uuid, idempotency_key="sell-1")
+        await server.sell_shop_item(session_uuid, sell_request)
+        with pytest.raises(AccountDoesntOwnItem):
+            await server.sell_shop_item(session_uuid, ItemRequest(item_uuid=shop_item.uuid, idempotency_key="sell-2"))
+        with pytest.raises(AccountDoesntOwnItem):
+            await server.sell_shop_item(session_uuid, ItemRequest(item_uuid=shop_item.uuid, idempotency_key="sell-2"))
+
+        # Key is kept per account, so retry from a new session after reconnect is not applied again
+        other_session_uuid = (await server.login_into_account(AccountLoginRequest(nickname="rickastley"))).session_uuid
+        response = await server.sell_shop_item(other_session_uuid, sell_request)
+        assert_that(response.status, equal_to("ok"))
+        assert_that(server.idempotency_cache.hits, equal_to(3))
+        # Key, which is reused for another action or item, is rejected instead of replaying the stored result
+        with pytest.raises(IdempotencyKeyReused):
+            await server.buy_shop_item(session_uuid, ItemRequest(item_uuid=shop_item.uuid, idempotency_key="sell-1"))
+        other_item = (await server.get_all_shop_items()).at(1)
+        with pytest.raises(IdempotencyKeyReused):
+            await server.sell_shop_item(session_uuid, ItemRequest(item_uuid=other_item.uuid, idempotency_key="sell-1"))
+        # Handle refers to the same item as its uuid
+        sell_by_handle = ItemRequest(item_handle=shop_item.handle, idempotency_key="sell-1")
+        assert_that((await server.sell_shop_item(session_uuid, sell_by_handle)).status, equal_to("ok"))
+
+        await server.logout_from_account(session_uuid)
+        assert_that(server.session_accounts.get(session_uuid), equal_to(None))
+        assert_that(server.session_accounts.get(other_session_uuid), equal_to(game_session_data.account_uuid))
+
+
+@pytest.mark.asyncio
+async def test_idempotency_cache_is_bounded():
+    cache = IdempotencyCache(max_size=2, ttl=0.05)
+
+    async def action():
+        return object()
+
+    first = await cache.run("first", action)
+    assert_that(await cache.run("first", action), equal_to(first))
+    await cache.run("second", action)
+    await cache.run("third", action)
+    assert_that(len(cache), equal_to(2))
+    assert_that(await cache.run("first", action), is_not(equal_to(first)))
+
+    await asyncio.sleep(0.1)
+    cache.evict_expired()
+    assert_that(len(cache), equal_to(0))
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_is_dropped():
+    server_sock, peer_sock = socket.socketpair()
+    reader, writer = await asyncio.open_connection(sock=server_sock)
+    _, peer_writer = await asyncio.open_connection(sock=peer_sock)
+    conn = Connection(reader, writer, max_push_buffer_size=1024 * 1024)
+
+    # Peer never reads, so pushed frames pile up in the write buffer until the limit
+    frame = Protocol.construct({"payload": "x" * 64 * 1024})
+    for _ in range(1000):
+        conn.send_nowait(frame)
+        if writer.transport.is_closing():
+            break
+    assert_that(writer.transport.is_closing(), equal_to(True))
+    assert_that(writer.transport.get_write_buffer_size(), less_than_or_equal_to(1024 * 1024))
+
+    await conn.close()
+    peer_writer.close()
+
+
+@pytest.mark.asyncio
+async def test_identical_reads_are_coalesced():
+    async with Server(SETTINGS_PATH) as server:
+        game_session_data = await server.login_into_account(AccountLoginRequest(nickname="rickastley"))
+        session_uuid = game_session_data.session_uuid
+        other_session_uuid = (await server.login_into_account(AccountLoginRequest(nickname="rickastley"))).session_uuid
+        request = GetGameSessionRequest(session_uuid=session_uuid)
+        other_request = GetGameSessionRequest(session_uuid=other_session_uuid)
+
+        responses = await asyncio.gather(*(server.respond(request) for _ in range(5)))
+        assert_that({frame for _, frame in responses}, has_length(1))
+        assert_that(responses[0][0].data, has_properties(session_uuid=session_uuid))
+        assert_that(server.coalescing_stats, has_properties(computed=1, coalesced=4))
+
+        # Sessions of the same account share a read, and each one gets its own session back
+        responses = await asyncio.gather(server.respond(request), server.respond(other_request))
+        assert_that(server.coalescing_stats, has_properties(computed=2, coalesced=5))
+        assert_that(responses[1][0].data, has_properties(session_uuid=other_session_uuid, version=0))
+        assert_that(responses[1][1], equal_to(Protocol.construct(responses[1][0].model_dump())))
+
+        assert_that(server.coalescing_key(GetAllItemListRequest()), equal_to(None))
+
+        async def key_of(request):
+            return server.coalescing_key(request, await server.find_session_account(request.session_uuid))
+
+        # Requests, which may get different results, never share one
+        delta_request = GetGameSessionRequest(session_uuid=session_uuid, data=GameSessionRequest(known_version=0))
+        assert_that(await key_of(delta_request), is_not(equal_to(await key_of(request))))
+        # Read, which arrives after a change, does not join the one from before it, while other accounts are unaffected
+        key = await key_of(request)
+        stranger_request = GetGameSessionRequest(
+            session_uuid=(await server.login_into_account(AccountLoginRequest(nickname="stranger"))).session_uuid
+        )
+        stranger_key = await key_of(stranger_request)
+        await server.change_account_balace(session_uuid, 0)
+        assert_that(await key_of(request), is_not(equal_to(key)))
+        assert_that(await key_of(other_request), equal_to(await key_of(request)))
+        assert_that(await key_of(stranger_request), equal_to(stranger_key))
+        assert_that(server.coalescing_key(LogoutRequest(session_uuid=session_uuid)), equal_to(None))
+
+        server.coalescing_stats.reset()
+        assert_that(server.coalescing_stats.coalesce_rate, equal_to(0.0))
+
+
+@pytest.mark.asyncio
+async def test_single_flight_is_cancelled_with_its_last_waiter():
+    single_flight = SingleFlight()
+    started, cancelled = [], []
+
+    async def action():
+        started.append(True)
+        try:
+            await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "done"
+
+    # Work goes on for the others, when one of them leaves
+    first, second = (asyncio.ensure_future(single_flight.run("key", action)) for _ in range(2))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert_that(await second, equal_to("done"))
+    assert_that(first.cancelled(), equal_to(True))
+    assert_that(started, has_length(1))
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(single_flight.run("key", action), 0.01)
+    await asyncio.sleep(0)
+    assert_that(cancelled, has_length(1))
+    assert_that(len(single_flight), equal_to(0))
+    assert_that(single_flight.stats, has_properties(computed=2, coalesced=1, coalesce_rate=1 / 3))
+
+
+def test_rate_limiter():
+    rate_limiter = RateLimiter(
+        RateLimitSettings(peer_rate=1, peer_burst=10, session_rate=1, session_burst=4, max_buckets=2)
+    )
+    session_uuid = uuid.uuid4()
+
+    assert_that(rate_limiter.acquire("127.0.0.1", None, ActionType.LOGIN), equal_to(True))
+    assert_that(rate_limiter.acquire("127.0.0.1", None, ActionType.LOGIN), equal_to(True))
+    # Peer bucket is empty now, session one is not touched
+    assert_that(rate_limiter.acquire("127.0.0.1", session_uuid, ActionType.BUY_ITEM), equal_to(False))
+    assert_that(rate_limiter.acquire("127.0.0.2", session_uuid, ActionType.GET_ALL_ITEM_LIST), equal_to(False))
+    for _ in range(4):
+        assert_that(rate_limiter.acquire("127.0.0.2", session_uuid, ActionType.BUY_ITEM), equal_to(True))
+    assert_that(rate_limiter.acquire("127.0.0.3", session_uuid, ActionType.BUY_ITEM), equal_to(False))
+    assert_that(rate_limiter.rejected, equal_to(3))
+
+    # Least recently used buckets are evicted
+    assert_that(len(rate_limiter.peers), equal_to(2))
+
+
+def test_token_buckets_are_refilled():
+    buckets = TokenBuckets(rate=2, burst=4, max_buckets=10)
+
+    buckets.get("peer", 0).tokens -= 4
+    assert_that(buckets.get("peer", 1).tokens, equal_to(2))
+    assert_that(buckets.get("peer", 100).tokens, equal_to(4))
+
+    # Bucket, which has been refilled up to its burst, is dropped
+    buckets.get("other", 103)
+    assert_that(len(buckets), equal_to(1))
+
+
+def write_items_settings(tmp_path, items_reload_interval: float = 0) -> str:
+    with open(SETTINGS_PATH, encoding="utf-8") as f:
+        settings = json.load(f)
+    with open(settings["items_path"], encoding="utf-8") as f:
+        shop_items = json.load(f)
+
+    settings["items_path"] = str(tmp_path / "shop_items.json")
+    settings["items_reload_interval"] = items_reload_interval
+    with open(settings["items_path"], "w", encoding="utf-8") as f:
+        json.dump(shop_items, f)
+    with open(tmp_path / "settings.json", "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+    return str(tmp_path / "settings.json")
+
+
+def update_items_file(items_path: str, update) -> None:
+    with open(items_path, encoding="utf-8") as f:
+        shop_items = json.load(f)
+    update(shop_items)
+    with open(items_path, "w", encoding="utf-8") as f:
+        json.dump(shop_items, f)
+    # Make sure modification is noticed even on file systems with coarse timestamps
+    mtime = os.stat(items_path).st_mtime + 1
+    os.utime(items_path, (mtime, mtime))
+
+
+@pytest.mark.asyncio
+async def test_items_are_reloaded(tmp_path):
+    async with Server(write_items_settings(tmp_path)) as server:
+        catalog_version = server.catalog_version
+        shop_items = await server.get_all_shop_items()
+        assert_that(await server.reload_items(), equal_to(False))
+
+        login_request = AccountLoginRequest(nickname="rickastley")
+        session_uuid = (await server.login_into_account(login_request)).session_uuid
+        owned_item = shop_items.at(0)
+        await server.change_account_balace(session_uuid, owned_item.price)
+        await server.buy_shop_item(session_uuid, ItemRequest(item_uuid=owned_item.uuid))
+
+        def update(items):
+            items[0]["type"] = "equipment" if items[0]["type"] == "ship" else "ship"
+            items.append({"name": "Hot reload", "price": 1000, "type": "ship"})
+
+        update_items_file(server._settings.items_path, update)  #  pylint: disable=protected-access
+        assert_that(await server.reload_items(), equal_to(True))
+        assert_that(server.catalog_version, equal_to(catalog_version + 1))
+
+        new_shop_items = await server.get_all_shop_items()
+        assert_that(len(new_shop_items), equal_to(len(shop_items) + 1))
+        assert_that(new_shop_items, has_item(has_properties(name="Hot reload", price=1000)))
+        changed_item = new_shop_items.as_dict()[str(owned_item.uuid)]
+        assert_that(changed_item, has_properties(name=owned_item.name, type=is_not(owned_item.type)))
+        # Previous catalog is not changed in place
+        assert_that(shop_items.as_dict()[str(owned_item.uuid)].type, equal_to(owned_item.type))
+
+        game_session_data = await server.get_game_session_data(session_uuid)
+        assert_that(game_session_data.owned_items, has_item(has_properties(uuid=owned_item.uuid)))
+
+
+@pytest.mark.asyncio
+async def test_items_are_diffed_off_the_loop(tmp_path, monkeypatch):
+    async with Server(write_items_settings(tmp_path)) as server:
+        threads = []
+        diff = Catalog.diff
+
+        def recording_diff(catalog, shop_items):
+            threads.append(threading.get_ident())
+            return diff(catalog, shop_items)
+
+        monkeypatch.setattr(Catalog, "diff", recording_diff)
+        assert_that(await server.reload_items(), equal_to(False))
+        assert_that(threads, has_length(1))
+        assert_that(threads[0], is_not(equal_to(threading.get_ident())))
+
+
+@pytest.mark.asyncio
+async def test_items_without_uuids_are_updated(tmp_path, embedded_settings_path):
+    with open(embedded_settings_path, encoding="utf-8") as f:
+        settings = json.load(f)
+    with open(settings["items_path"], encoding="utf-8") as f:
+        shop_items = json.load(f)
+    settings["items_path"] = str(tmp_path / "shop_items.json")
+    with open(settings["items_path"], "w", encoding="utf-8") as f:
+        json.dump(shop_items, f)
+    with open(embedded_settings_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+
+    async with Server(embedded_settings_path) as server:
+        catalog = await server.get_all_shop_items()
+    first, second = (
+        next(shop_item for shop_item in catalog if shop_item.name == item["name"]) for item in shop_items[:2]
+    )
+
+    # Item, whose price has changed, is matched by name and type
+    update_items_file(settings["items_path"], lambda items: items[0].update(price=items[0]["price"] + 1))
+    async with Server(embedded_settings_path) as server:
+        new_catalog = (await server.get_all_shop_items()).as_dict()
+        assert_that(new_catalog, has_length(len(catalog)))
+        assert_that(new_catalog[str(first.uuid)], has_properties(name=first.name, price=first.price + 1))
+
+    # Items file, which breaks unique index, does not stop server from starting
+    def make_conflict(items):
+        items.insert(0, {**items[0], "uuid": str(second.uuid)})
+
+    update_items_file(settings["items_path"], make_conflict)
+    async with Server(embedded_settings_path) as server:
+        assert_that((await server.get_all_shop_items()).as_dict()[str(second.uuid)], equal_to(second))
+
+
+@pytest.mark.asyncio
+async def test_ndjson_items_file(tmp_path):
+    settings_path = write_items_settings(tmp_path)
+    with open(settings_path, encoding="utf-8") as f:
+        settings = json.load(f)
+    with open(settings["items_path"], encoding="utf-8") as f:
+        shop_items = json.load(f)
+
+    settings["items_path"] = str(tmp_path / "shop_items.ndjson")
+    with open(settings["items_path"], "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(shop_item) + "\n" for shop_item in shop_items)
+    with open(settings_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+
+    async with Server(settings_path) as server:
+        catalog = {(shop_item.name, shop_item.price) for shop_item in await server.get_all_shop_items()}
+        assert_that(catalog, equal_to({(shop_item["name"], shop_item["price"]) for shop_item in shop_items}))
+
+
+@pytest.mark.asyncio
+async def test_items_file_is_watched(tmp_path):
+    async with Server(write_items_settings(tmp_path, items_reload_interval=0.05)) as server:
+        catalog_version = server.catalog_version
+
+        update_items_file(
+            server._settings.items_path,  #  pylint: disable=protected-access
+            lambda items: items.append({"name": "Watched", "price": 1100, "type": "equipment"}),
+        )
+        for _ in range(40):
+            if server.catalog_version > catalog_version:
+                break
+            await asyncio.sleep(0.05)
+
+        assert_that(server.catalog_version, equal_to(catalog_version + 1))
+        assert_that(await server.get_all_shop_items(), has_item(has_properties(name="Watched")))
+
+
 def test_validate():
     # pylint: disable=line-too-long
-    game_session_data_json = '{"data": {"account_uuid": "099e9d9c79c54a2397c8904ad903e833", "nickname": "nick", "balance": 13.52, "session_uuid": "5572db08071748bca85924bbf2cbc3fe", "owned_items": [{"uuid": "1f1ecd78d8ef4067979b38b9a4be33ee", "name": "Sampson", "price": 24, "type": "ship"}]}}'
-    game_session_data = ProtocolResponse.model_validate_json(game_session_data_json, strict=True)
+    game_session_data_json = '{"kind": "game_session_data", "data": {"account_uuid": "099e9d9c79c54a2397c8904ad903e833", "nickname": "nick", "balance": 1352, "session_uuid": "5572db08071748bca85924bbf2cbc3fe", "owned_items": [{"uuid": "1f1ecd78d8ef4067979b38b9a4be33ee", "name": "Sampson", "price": 2400, "type": "ship"}]}}'
+    game_session_data = validate_response(game_session_data_json, strict=True)
     assert_that(game_session_data.data, instance_of(GameSessionData))
 
+    # Payload is validated only against the model of its kind
+    with pytest.raises(ValidationError):
+        validate_response(game_session_data_json.replace('"game_session_data"', '"game_session_delta"'), strict=True)
+
+    buy_item_json = '{"action_type": "buy_item", "session_uuid": null, "data": {"item_uuid": "1f1ecd78d8ef4067979b38b9a4be33ee"}}'
+    assert_that(validate_request(buy_item_json), instance_of(BuyItemRequest))
+    with pytest.raises(ValidationError):
+        validate_request('{"action_type": "buy_item", "session_uuid": null, "data": {"nickname": "nick"}}')
+    assert_that(validate_request('{"action_type": "logout", "session_uuid": null}'), instance_of(LogoutRequest))
+
     shop_item_list_json = (
-        '[{"uuid": "1f1ecd78d8ef4067979b38b9a4be33ee", "name": "Sampson", "price": 24, "type": "ship"}]'
+        '[{"uuid": "1f1ecd78d8ef4067979b38b9a4be33ee", "name": "Sampson", "price": 2400, "type": "ship"}]'
     )
     shop_item_list = ShopItemList.model_validate_json(shop_item_list_json)
     assert_that(shop_item_list, instance_of(ShopItemList))
 
     # pylint: disable=protected-access
-    shop_item_list_json = '[{"uuid": "1f1ecd78d8ef4067979b38b9a4be33ee", "name": "Sampson", "price": 24, "type": "ship"}, {"uuid": "1cd5dc973a2f48b19c170558d7c4550e", "name": "garbage can", "price": 43, "type": "equipment"}]'
+    shop_item_list_json = '[{"uuid": "1f1ecd78d8ef4067979b38b9a4be33ee", "name": "Sampson", "price": 2400, "type": "ship"}, {"uuid": "1cd5dc973a2f48b19c170558d7c4550e", "name": "garbage can", "price": 4300, "type": "equipment"}]'
     shop_item_list = ShopItemList.model_validate_json(shop_item_list_json)
     assert_that(shop_item_list, instance_of(ShopItemList))
+
+
+SUCCESSOR_CODE = """
+from gameserver.server import handoff
+sock = handoff.inherited_socket()
+handoff.notify_ready()
+conn, _ = sock.accept()
+conn.sendall(b"successor")
+conn.close()
+"""
+
+
+@pytest.mark.asyncio
+async def test_listening_socket_is_handed_off():
+    sock = socket.create_server(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+
+    assert_that(await handoff.spawn_successor(sock, ["-c", "pass"], timeout=10), equal_to(None))
+
+    successor = await handoff.spawn_successor(sock, ["-c", SUCCESSOR_CODE], timeout=10)
+    assert_that(successor, not_none())
+    # Predecessor stops listening, while the socket stays open in successor
+    sock.close()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    assert_that(await reader.read(), equal_to(b"successor"))
+    writer.close()
+    assert_that(await successor.wait(), equal_to(0))
+
+
+@pytest.mark.asyncio
+async def test_requests_are_shed_after_deadline():
+    shed_stats = ShedStats()
+    handled = []
+
+    async def handler(delay: float) -> str:
+        await asyncio.sleep(delay)
+        handled.append(delay)
+        return "done"
+
+    now = time.monotonic()
+    # Expired request is dropped without running its handler
+    with pytest.raises(DeadlineExceeded):
+        await run_before_deadline(ActionType.BUY_ITEM, handler(0), now - 1, shed_stats)
+    # Read-only handler is cancelled in flight, while handler, which writes, runs to the end
+    with pytest.raises(DeadlineExceeded):
+        await run_before_deadline(ActionType.GET_GAME_DATA_SESSION, handler(0.2), now + 0.05, shed_stats)
+    result = await run_before_deadline(ActionType.SELL_ITEM, handler(0.1), time.monotonic() + 0.05, shed_stats)
+
+    assert_that(result, equal_to("done"))
+    assert_that(handled, equal_to([0.1]))
+    assert_that(shed_stats, has_properties(expired=1, cancelled=1, total=2))
@@ -0,0 +1,113 @@
+import json
+import os
+from typing import List
+
+import pytest
+from hamcrest import assert_that, equal_to, greater_than, has_item, has_properties
+
+from gameserver.server import Server
+from gameserver.db import DBManager
+from gameserver.db.resharding import reshard
+from gameserver.misc.models import AccountLoginRequest, ItemRequest
+from gameserver.misc.settings import validate_settings
+
+ITEMS_PATH = os.path.join(os.path.dirname(__file__), "..", "gameserver", "data", "shop_items.json")
+NICKNAMES = [f"player{index}" for index in range(24)]
+
+
+def write_settings(path: str, shard_paths: List[str]) -> str:
+    settings = {
+        "host": "127.0.0.1",
+        "port": 3233,
+        "items_path": ITEMS_PATH,
+        "db_settings": {
+            "db_type": "sqlite",
+            "database": shard_paths[0],
+            "is_test_env": False,
+            "shards": [{"db_type": "sqlite", "database": shard_path} for shard_path in shard_paths],
+        },
+        "min_amount_of_money_cents": 7000,
+        "max_amount_of_money_cents": 12400,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+    return path
+
+
+async def count_accounts(server: Server) -> List[int]:
+    result = []
+    for sessionmaker in server.db.sessionmakers:
+        async with sessionmaker() as session:
+            accounts = 0
+            for nickname in NICKNAMES:
+                if await server.db.find_account_by_nickname(session, nickname):
+                    accounts += 1
+            result.append(accounts)
+    return result
+
+
+@pytest.mark.asyncio
+async def test_accounts_are_spread_across_shards(tmp_path):
+    shard_paths = [str(tmp_path / f"shard{index}.db") for index in range(3)]
+    settings_path = write_settings(str(tmp_path / "settings.json"), shard_paths)
+
+    async with Server(settings_path) as server:
+        for nickname in NICKNAMES:
+            game_session_data = await server.login_into_account(AccountLoginRequest(nickname=nickname))
+            # Session is resolved on the shard of its account
+            await server.get_game_session_data(game_session_data.session_uuid)
+
+        accounts_per_shard = await count_accounts(server)
+        assert_that(sum(accounts_per_shard), equal_to(len(NICKNAMES)))
+        assert_that(max(accounts_per_shard), greater_than(0))
+        assert_that(len([accounts for accounts in accounts_per_shard if accounts]), greater_than(1))
+
+
+@pytest.mark.asyncio
+async def test_shop_items_are_replicated(tmp_path):
+    shard_paths = [str(tmp_path / f"shard{index}.db") for index in range(3)]
+    settings_path = write_settings(str(tmp_path / "settings.json"), shard_paths)
+
+    async with Server(settings_path) as server:
+        catalogs = []
+        for sessionmaker in server.db.sessionmakers:
+            async with sessionmaker() as session:
+                catalogs.append(sorted(item.uuid for item in await server.db.get_shop_items_list(session)))
+
+        for catalog in catalogs:
+            assert_that(catalog, equal_to(catalogs[0]))
+
+
+@pytest.mark.asyncio
+async def test_reshard_keeps_accounts(tmp_path):
+    old_settings_path = write_settings(str(tmp_path / "old.json"), [str(tmp_path / "shard0.db")])
+    new_settings_path = write_settings(
+        str(tmp_path / "new.json"), [str(tmp_path / f"shard{index}.db") for index in range(3)]
+    )
+
+    game_sessions = {}
+    async with Server(old_settings_path) as server:
+        shop_item = (await server.get_all_shop_items()).at(0)
+        for nickname in NICKNAMES:
+            game_session_data = await server.login_into_account(AccountLoginRequest(nickname=nickname))
+            await server.change_account_balace(game_session_data.session_uuid, shop_item.price)
+            await server.buy_shop_item(game_session_data.session_uuid, ItemRequest(item_uuid=shop_item.uuid))
+            game_sessions[nickname] = game_session_data
+
+    source = DBManager(validate_settings(old_settings_path).db_settings)
+    target = DBManager(validate_settings(new_settings_path).db_settings)
+    await source.init_db_engine(migrate=False)
+    await target.init_db_engine()
+    try:
+        assert_that(await reshard(source, target), greater_than(0))
+    finally:
+        await source.shutdown()
+        await target.shutdown()
+
+    async with Server(new_settings_path) as server:
+        assert_that(sum(await count_accounts(server)), equal_to(len(NICKNAMES)))
+        for nickname, old_game_session_data in game_sessions.items():
+            # Sessions moved along with their accounts
+            game_session_data = await server.get_game_session_data(old_game_session_data.session_uuid)
+            assert_that(game_session_data.account_uuid, equal_to(old_game_session_data.account_uuid))
+            assert_that(game_session_data.owned_items, has_item(has_properties(uuid=shop_item.uuid)))
@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+from contextlib import AsyncExitStack
+import statistics
+import tempfile
+import time
+from typing import List
+
+from common import write_settings
+
+from gameserver.client import Client
+from gameserver.server import Server
+
+#  Bursts of identical reads, as after a server-wide event: every client refreshes the same game session at the same
+#  moment. Requests per second and the share of them, which have joined a read in flight, with coalescing and without
+#  it. Runs with and without it take turns, and the median of them is printed, so that drift of the machine affects
+#  both the same way
+
+
+async def measure(server: Server, clients: List[Client], bursts: int) -> float:
+    server.coalescing_stats.reset()
+    started = time.perf_counter()
+    for _ in range(bursts):
+        await asyncio.gather(*(client.refresh_game_session() for client in clients))
+    return len(clients) * bursts / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser("Read coalescing benchmark")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--port", type=int, default=3245)
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        async with Server(write_settings(directory, args.port)) as server, AsyncExitStack() as stack:
+            clients = [await stack.enter_async_context(Client("127.0.0.1", args.port)) for _ in range(args.clients)]
+            await clients[0].send_login_request("coalescing")
+            for client in clients[1:]:
+                client.game_session = clients[0].game_session.model_copy(deep=True)
+
+            coalescing_key = server.coalescing_key
+            rates = {False: [], True: []}
+            coalesce_rates = []
+            for _ in range(args.runs):
+                for coalescing in (False, True):
+                    #  Request without a key is always served on its own
+                    server.coalescing_key = coalescing_key if coalescing else lambda request, account: None
+                    rates[coalescing].append(await measure(server, clients, args.bursts))
+                coalesce_rates.append(server.coalescing_stats.coalesce_rate)
+
+            for coalescing, name in ((False, "without coalescing"), (True, "coalesced")):
+                print(
+                    f"{name:<20} {statistics.median(rates[coalescing]):8.0f} requests/s "
+                    f"(min {min(rates[coalescing]):6.0f}, max {max(rates[coalescing]):6.0f})"
+                )
+            print(f"{'shared reads':<20} {statistics.median(coalesce_rates):8.1%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+from typing import Any, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+#  pylint: disable-next=import-error,wrong-import-position,wrong-import-order
+from generate_items import iter_items, write_items
+
+#  Helpers shared by benchmarks: settings of an embedded server on SQLite, generated catalogs, command line arguments
+#  and latency percentiles. Benchmarks are run as scripts, so this module is imported by its name
+
+ITEMS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "gameserver", "data", "shop_items.json"
+)
+
+
+#  Server never drops the database of a benchmark and is never rate limited, extra keys are added to settings as is
+def write_settings(directory: str, port: int, items_path: str = ITEMS_PATH, name: str = "gm", **extra: Any) -> str:
+    settings = {
+        "host": "127.0.0.1",
+        "port": port,
+        "items_path": items_path,
+        "items_reload_interval": 0,
+        "db_settings": {"db_type": "sqlite", "database": os.path.join(directory, f"{name}.db"), "is_test_env": False},
+        "min_amount_of_money_cents": 7000,
+        "max_amount_of_money_cents": 12400,
+        "rate_limit_settings": {"enabled": False},
+        **extra,
+    }
+    settings_path = os.path.join(directory, f"{name}.json")
+    with open(settings_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+    return settings_path
+
+
+def write_generated_items(directory: str, count: int, seed: int) -> str:
+    items_path = os.path.join(directory, "shop_items.json")
+    write_items(items_path, iter_items(random.Random(seed), count, 100, 100000))
+    return items_path
+
+
+def parse_timing_arguments(description: str, iterations: int) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description)
+    parser.add_argument("--iterations", type=int, default=iterations)
+    parser.add_argument("--repeat", type=int, default=5)
+    return parser.parse_args()
+
+
+def format_latency(durations: List[float]) -> str:
+    durations = sorted(durations)
+    p99 = durations[int(len(durations) * 0.99)]
+    return f"p50 {statistics.median(durations) * 1e6:7.0f} us, p99 {p99 * 1e6:7.0f} us"
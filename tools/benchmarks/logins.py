@@ -0,0 +1,53 @@
+import argparse
+import asyncio
+import time
+import uuid
+from typing import List
+
+from gameserver.misc.models import AccountLoginRequest
+from gameserver.server import Server
+
+#  Login storm against an in-process server: first logins of new accounts, logins of returning ones and concurrent
+#  first logins under the same nickname. Statements are counted through compiled cache stats of the DB engines.
+#  Use settings of a test database, as the server may recreate it on startup
+
+
+async def login_all(server: Server, nicknames: List[str], concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login(nickname: str) -> None:
+        async with semaphore:
+            await server.login_into_account(AccountLoginRequest(nickname=nickname))
+
+    await asyncio.gather(*(login(nickname) for nickname in nicknames))
+
+
+async def measure(server: Server, name: str, nicknames: List[str], concurrency: int) -> None:
+    server.db.cache_stats.reset()
+    started = time.perf_counter()
+    await login_all(server, nicknames, concurrency)
+    elapsed = time.perf_counter() - started
+    statements = server.db.cache_stats.hits + server.db.cache_stats.misses
+    print(f"{name:<24} {len(nicknames) / elapsed:8.0f} logins/s, {statements / len(nicknames):5.1f} statements/login")
+
+
+async def run(settings_path: str, accounts: int, concurrency: int) -> None:
+    async with Server(settings_path) as server:
+        nicknames = [uuid.uuid4().hex[:12] for _ in range(accounts)]
+        await measure(server, "first logins", nicknames, concurrency)
+        await measure(server, "returning logins", nicknames, concurrency)
+        await measure(server, "same nickname storm", [uuid.uuid4().hex[:12]] * concurrency, concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser("Login storm benchmark")
+    parser.add_argument("--settings-path", type=str, default="tests/settings.json")
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+
+    args = parser.parse_args()
+    asyncio.run(run(args.settings_path, args.accounts, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
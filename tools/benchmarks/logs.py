@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from common import write_settings
+
+from gameserver.client import Client
+from gameserver.server import Server
+from gameserver.server.logs import RequestLogger, make_formatter, setup_logging
+from gameserver.misc.settings import LogSettings
+
+#  Request throughput of embedded server with logging at every level. Records are written to a file, through the
+#  queue, whose thread does formatting and I/O, and, for comparison, right on the event loop
+
+SCENARIOS = {
+    "warning": {"level": "WARNING"},
+    "info, 1% sampled": {"level": "INFO", "request_sample_rate": 0.01},
+    "info, every request": {"level": "INFO", "request_sample_rate": 1},
+    "info, on the loop": {"level": "INFO", "request_sample_rate": 1},
+    "debug with payloads": {"level": "DEBUG", "request_sample_rate": 1, "log_payloads": True},
+}
+
+
+#  Handlers of root logger write to the file right away, as without the queue
+def setup_logging_on_loop(log_settings: LogSettings) -> logging.Handler:
+    handler = logging.FileHandler(log_settings.path, encoding="utf-8")
+    handler.setFormatter(make_formatter(log_settings))
+    root = logging.getLogger()
+    for previous in root.handlers[:]:
+        root.removeHandler(previous)
+    root.addHandler(handler)
+    root.setLevel(log_settings.level)
+    return handler
+
+
+async def run_clients(port: int, clients: int, requests: int) -> float:
+    async def run_client(index: int) -> None:
+        async with Client("127.0.0.1", port) as client:
+            await client.send_login_request(f"logs{index}")
+            for _ in range(requests):
+                await client.refresh_game_session()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_client(index) for index in range(clients)))
+    return clients * requests / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser("Logging benchmark")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per client")
+    parser.add_argument("--structured", action="store_true", help="Write records as JSON")
+    parser.add_argument("--port", type=int, default=3242)
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        async with Server(write_settings(directory, args.port)) as server:
+            for name, scenario in SCENARIOS.items():
+                log_path = os.path.join(directory, f"{len(os.listdir(directory))}.log")
+                log_settings = LogSettings(path=log_path, structured=args.structured, **scenario)
+                server.request_logger = RequestLogger(log_settings.request_sample_rate, log_settings.log_payloads)
+                if name.endswith("on the loop"):
+                    handler = setup_logging_on_loop(log_settings)
+                    rate = await run_clients(args.port, args.clients, args.requests)
+                    handler.close()
+                else:
+                    listener = setup_logging(log_settings)
+                    rate = await run_clients(args.port, args.clients, args.requests)
+                    listener.stop()
+                    listener.handlers[0].close()
+
+                with open(log_path, encoding="utf-8") as f:
+                    records = sum(1 for _ in f)
+                print(f"{name:<24} {rate:8.0f} requests/s, {records:7} records")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+import argparse
+import random
+import timeit
+import uuid
+
+from gameserver.misc.models import ActionType
+from gameserver.misc.settings import RateLimitSettings
+from gameserver.server.ratelimit import RateLimiter
+
+#  Measures overhead of rate limiting per request, when requests come from many peers and sessions at random,
+#  and checks that amount of buckets stays bounded
+
+
+def run(iterations: int, repeat: int, peers: int, max_buckets: int) -> None:
+    rate_limiter = RateLimiter(RateLimitSettings(max_buckets=max_buckets))
+    requests = [
+        (f"10.0.{index // 256 % 256}.{index % 256}", uuid.uuid4(), random.choice(list(ActionType)))
+        for index in range(peers)
+    ]
+    requests = [random.choice(requests) for _ in range(iterations)]
+
+    def acquire_all():
+        for peer, session_uuid, action_type in requests:
+            rate_limiter.acquire(peer, session_uuid, action_type)
+
+    best = min(timeit.repeat(acquire_all, number=1, repeat=repeat))
+    print(f"{peers} peers: {best / iterations * 1e6:6.2f} us/request")
+    print(f"buckets: {len(rate_limiter.peers)} peer, {len(rate_limiter.sessions)} session (max {max_buckets})")
+    print(f"rejected: {rate_limiter.rejected}")
+
+
+def main():
+    parser = argparse.ArgumentParser("Rate limiter overhead benchmark")
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--peers", type=int, default=50000)
+    parser.add_argument("--max-buckets", type=int, default=10000)
+
+    args = parser.parse_args()
+    run(args.iterations, args.repeat, args.peers, args.max_buckets)
+
+
+if __name__ == "__main__":
+    main()
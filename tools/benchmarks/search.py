@@ -0,0 +1,71 @@
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from common import format_latency, iter_items
+
+from gameserver.misc.models import ShopItem, ShopItemList, ShopItemType
+from gameserver.server.search import SearchIndex, tokenize
+
+#  Time to build the search index of a big catalog and latency of queries against it. Queries are prefixes and
+#  words of names of random items, alone and with type and price filters, as they are typed into a search box
+
+Query = Tuple[str, Dict[str, Any]]
+
+
+def load_items(args: argparse.Namespace) -> List[ShopItem]:
+    if args.items_path:
+        with open(args.items_path, "r", encoding="utf-8") as f:
+            if args.items_path.endswith((".ndjson", ".jsonl")):
+                return [ShopItem.model_validate_json(line) for line in f if line.strip()]
+            return ShopItemList.model_validate_json(f.read()).root
+    rng = random.Random(args.seed)
+    items = iter_items(rng, args.count, 100, 100000, unique_names=args.unique_names)
+    return [ShopItem.model_validate(item) for item in items]
+
+
+def make_queries(rng: random.Random, shop_items: List[ShopItem], count: int) -> Dict[str, List[Query]]:
+    queries: Dict[str, List[Query]] = {"prefix": [], "words": [], "type": [], "price range": [], "all filters": []}
+    for _ in range(count):
+        tokens = tokenize(rng.choice(shop_items).name) or [""]
+        prefix = tokens[0][: rng.randint(1, max(1, len(tokens[0])))]
+        price = rng.randint(100, 100000)
+        price_range = {"min_price": price, "max_price": price + rng.choice([100, 1000, 10000])}
+        item_type = rng.choice(list(ShopItemType))
+        queries["prefix"].append((prefix, {}))
+        queries["words"].append((" ".join(tokens), {}))
+        queries["type"].append((prefix, {"item_type": item_type}))
+        queries["price range"].append((prefix, price_range))
+        queries["all filters"].append((prefix, {"item_type": item_type, **price_range}))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser("Item search benchmark")
+    parser.add_argument("--count", type=int, default=1000000, help="Items to generate")
+    parser.add_argument("--unique-names", action="store_true", help="Give every generated item its own name")
+    parser.add_argument("--items-path", help="Items file to index instead of generated items")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries of every kind")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args()
+    shop_items = load_items(args)
+    started = time.perf_counter()
+    index = SearchIndex(shop_items)
+    print(f"{len(index)} items, {len(index.tokens)} tokens, built in {time.perf_counter() - started:.2f} s")
+
+    rng = random.Random(args.seed)
+    for name, queries in make_queries(rng, shop_items, args.queries).items():
+        durations = []
+        found = 0
+        for query, filters in queries:
+            started = time.perf_counter()
+            found += len(index.search(query, limit=args.limit, **filters))
+            durations.append(time.perf_counter() - started)
+        print(f"{name:<12} {format_latency(durations)}, {found / len(queries):5.1f} results")
+
+
+if __name__ == "__main__":
+    main()
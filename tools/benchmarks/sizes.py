@@ -0,0 +1,79 @@
+import argparse
+import sqlite3
+import uuid
+
+from gameserver.misc.models import GameSessionData, ItemRequest, ShopItem, ShopItemList, ShopItemType
+from gameserver.misc.protocol import Protocol
+
+#  Reports sizes instead of timings: bytes on the wire for item references and game session, and bytes on disk
+#  for uuid columns with their unique index, stored as text and as BINARY(16)
+
+UUID_SCHEMAS = {
+    "text": "CREATE TABLE account (id INTEGER PRIMARY KEY, uuid VARCHAR(36) NOT NULL UNIQUE, nickname VARCHAR(12))",
+    "binary": "CREATE TABLE account (id INTEGER PRIMARY KEY, uuid BINARY(16) NOT NULL UNIQUE, nickname VARCHAR(12))",
+}
+
+
+def frame_size(model) -> int:
+    return len(Protocol.construct(model.model_dump()))
+
+
+def report_payloads(owned_items: int) -> None:
+    item_uuid = uuid.uuid4()
+    print(f"{'item request by uuid':<32} {frame_size(ItemRequest(item_uuid=item_uuid)):8} bytes")
+    print(f"{'item request by handle':<32} {frame_size(ItemRequest(item_handle=owned_items)):8} bytes")
+
+    shop_items = [
+        ShopItem(uuid=uuid.uuid4(), name=f"Item {index}", price=index * 100, type=ShopItemType.SHIP, handle=index)
+        for index in range(owned_items)
+    ]
+    game_session = {
+        "account_uuid": uuid.uuid4(),
+        "nickname": "rickastley",
+        "balance": 0,
+        "session_uuid": uuid.uuid4(),
+    }
+    full = GameSessionData(owned_items=ShopItemList(shop_items), **game_session)
+    compact = GameSessionData(
+        owned_items=ShopItemList([]),
+        owned_item_handles=[shop_item.handle for shop_item in shop_items],
+        catalog_version=1,
+        **game_session,
+    )
+    print(f"{f'game session, {owned_items} items':<32} {frame_size(full):8} bytes")
+    print(f"{f'compact game session, {owned_items} items':<32} {frame_size(compact):8} bytes")
+
+
+def report_table_sizes(rows: int) -> None:
+    for name, schema in UUID_SCHEMAS.items():
+        connection = sqlite3.connect(":memory:")
+        connection.execute(schema)
+        connection.executemany(
+            "INSERT INTO account (uuid, nickname) VALUES (?, ?)",
+            (
+                (str(value) if name == "text" else value.bytes, f"player{index}")
+                for index, value in ((index, uuid.uuid4()) for index in range(rows))
+            ),
+        )
+        connection.commit()
+        sizes = dict(connection.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+        index_size = sum(size for table, size in sizes.items() if table.startswith("sqlite_autoindex"))
+        print(
+            f"{f'{name} uuids, {rows} rows':<32} table {sizes['account'] / 1024:8.0f} KiB, "
+            f"unique index {index_size / 1024:8.0f} KiB"
+        )
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser("Payload and storage size report")
+    parser.add_argument("--owned-items", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=100000)
+
+    args = parser.parse_args()
+    report_payloads(args.owned_items)
+    report_table_sizes(args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+from gameserver.misc.protocol import Protocol, GetAllItemListRequest
+from gameserver.misc.settings import load_settings
+
+#  Every measurement runs in a fresh interpreter, as it is what every short-lived bot pays for. Import time covers
+#  modules of client_cli and server_cli only, time to first request covers the whole process start as well
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+IMPORT_CODE = """
+import time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+from gameserver.misc.protocol import warmup
+warmup()
+print(imported - started, time.perf_counter() - imported)
+"""
+
+CLIENT_CODE = """
+import asyncio
+from gameserver.client import Client
+
+async def main():
+    async with Client({host!r}, {port}) as client:
+        await client.send_login_request("startup")
+
+asyncio.run(main())
+"""
+
+
+def run_python(code: str) -> str:
+    return subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+
+
+def measure_imports(module: str, repeat: int) -> None:
+    import_times, warmup_times = [], []
+    for _ in range(repeat):
+        import_time, warmup_time = map(float, run_python(IMPORT_CODE.format(module=module)).split())
+        import_times.append(import_time)
+        warmup_times.append(warmup_time)
+    print(
+        f"{module:<24} import {statistics.median(import_times) * 1e3:7.1f} ms, "
+        f"warmup {statistics.median(warmup_times) * 1e3:6.1f} ms"
+    )
+
+
+async def wait_for_first_response(host: str, port: int, timeout: float) -> None:
+    request = GetAllItemListRequest()
+    frame = Protocol.construct(request.model_dump(mode="json"))
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.005)
+            continue
+        writer.write(frame)
+        await writer.drain()
+        header = await reader.readexactly(Protocol.HEADER_TOTAL_SIZE)
+        await reader.readexactly(int(header[: Protocol.HEADER_SIZE]))
+        writer.close()
+        await writer.wait_closed()
+        return
+
+
+def measure_server(settings_path: str, timeout: float) -> subprocess.Popen:
+    settings = load_settings(settings_path)
+    started = time.perf_counter()
+    server = subprocess.Popen(  #  pylint: disable=consider-using-with
+        [sys.executable, "-m", "gameserver.server_cli", "--settings-path", settings_path],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    asyncio.run(wait_for_first_response(settings.host, settings.port, timeout))
+    print(f"{'server_cli':<24} first response in {(time.perf_counter() - started) * 1e3:7.1f} ms")
+    return server
+
+
+def measure_client(settings_path: str, repeat: int) -> None:
+    settings = load_settings(settings_path)
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run_python(CLIENT_CODE.format(host=settings.host, port=settings.port))
+        durations.append(time.perf_counter() - started)
+    print(f"{'client':<24} login done in {statistics.median(durations) * 1e3:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser("Startup benchmark")
+    parser.add_argument("--settings-path", type=str, default="settings.json")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--imports-only", action="store_true", help="Do not start server and client")
+
+    args = parser.parse_args()
+    for module in ("gameserver.client_cli", "gameserver.server_cli"):
+        measure_imports(module, args.repeat)
+    if args.imports_only:
+        return
+
+    server = measure_server(os.path.abspath(args.settings_path), args.timeout)
+    try:
+        measure_client(args.settings_path, args.repeat)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
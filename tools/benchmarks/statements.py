@@ -0,0 +1,52 @@
+import timeit
+import uuid
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from common import parse_timing_arguments
+
+from gameserver.db import tables, statements
+from gameserver.db.statements import CompiledCacheStats
+
+#  Measures python-side overhead of a single hot query: statement construction, cache key generation,
+#  compiled cache lookup and ORM result processing. In-memory SQLite keeps the DB round trip out of the picture
+
+
+def run(iterations: int, repeat: int) -> None:
+    engine = create_engine("sqlite://")
+    tables.BaseTable.metadata.create_all(engine)
+    cache_stats = CompiledCacheStats()
+    cache_stats.attach(engine)
+
+    session_uuid = uuid.uuid4()
+    with Session(engine) as session:
+        session.add(tables.DBAccount(id=1, nickname="bench"))
+        session.add(tables.DBAccountSession(uuid=session_uuid, account=1))
+        session.commit()
+
+        def build_per_call():
+            session.execute(
+                select(tables.DBAccountSession).where(tables.DBAccountSession.uuid == session_uuid)
+            ).scalar()
+
+        def prebuilt():
+            session.execute(statements.SELECT_ACCOUNT_SESSION_BY_UUID, {"session_uuid": session_uuid}).scalar()
+
+        for name, func in (("build per call", build_per_call), ("prebuilt", prebuilt)):
+            func()
+            cache_stats.reset()
+            best = min(timeit.repeat(func, number=iterations, repeat=repeat))
+            print(
+                f"{name:<16} {best / iterations * 1e6:8.2f} us/query, "
+                f"compiled cache hit rate {cache_stats.hit_rate:.2%}"
+            )
+
+
+def main():
+    args = parse_timing_arguments("Statement overhead benchmark", 5000)
+    run(args.iterations, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
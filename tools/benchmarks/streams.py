@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import tempfile
+import time
+import tracemalloc
+from typing import Awaitable, Callable
+
+from common import write_generated_items, write_settings
+
+from gameserver.client import Client
+from gameserver.server import Server
+
+#  The whole catalog as one response against the same catalog streamed in chunks: time to the first item, time to
+#  the last one and peak memory of the process, which runs both server and client, while the catalog is received
+
+
+async def measure(name: str, receive: Callable[[Callable[[int], None]], Awaitable[None]]) -> None:
+    first = None
+    received = 0
+
+    def on_items(count: int) -> None:
+        nonlocal first, received
+        if first is None:
+            first = time.perf_counter()
+        received += count
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await receive(on_items)
+    finished = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<16} {received} items, first after {(first - started) * 1e3:7.1f} ms, "
+        f"last after {(finished - started) * 1e3:7.1f} ms, peak memory {peak / 2**20:7.1f} MiB"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser("Item stream benchmark")
+    parser.add_argument("--count", type=int, default=200000, help="Items to generate")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--port", type=int, default=3244)
+    parser.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        items_path = write_generated_items(directory, args.count, args.seed)
+        async with Server(write_settings(directory, args.port, items_path)):
+            async with Client("127.0.0.1", args.port) as client:
+                await client.send_login_request("streams")
+
+                async def get_all(on_items: Callable[[int], None]) -> None:
+                    on_items(len(await client.send_get_all_items_request()))
+
+                async def stream(on_items: Callable[[int], None]) -> None:
+                    async for chunk in client.stream_items(chunk_size=args.chunk_size):
+                        on_items(len(chunk))
+
+                await measure("stream_items", stream)
+                await measure("get_all_items", get_all)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import ssl
+import tempfile
+import time
+from typing import Optional
+
+from common import format_latency, write_settings
+
+from gameserver.server import Server
+from gameserver.misc.protocol import Protocol, GetAllItemListRequest
+from gameserver.misc.tls import ResumingSSLContext, generate_self_signed_certificate, make_client_context
+
+#  Cost of TLS for short-lived connections: connections per second for connect, one request and close, without TLS,
+#  with full handshake every time and with resumed sessions, and then latency of requests on one open connection.
+#  Servers run in the same process on SQLite, so both sides of every handshake are measured
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, frame: bytes) -> None:
+    writer.write(frame)
+    await writer.drain()
+    header = await reader.readexactly(Protocol.HEADER_TOTAL_SIZE)
+    await reader.readexactly(int(header[: Protocol.HEADER_SIZE]))
+
+
+async def measure_connections(  #  pylint: disable=too-many-arguments,too-many-positional-arguments
+    name: str, port: int, ssl_context: Optional[ResumingSSLContext], frame: bytes, connections: int, resume: bool
+) -> None:
+    reused = 0
+    started = time.perf_counter()
+    for _ in range(connections):
+        reader, writer = await asyncio.open_connection(
+            "127.0.0.1", port, ssl=ssl_context, server_hostname="localhost" if ssl_context else None
+        )
+        await request(reader, writer, frame)
+        ssl_object = writer.get_extra_info("ssl_object")
+        if ssl_object is not None:
+            reused += ssl_object.session_reused
+            if resume:
+                ssl_context.session = ssl_object.session
+        writer.close()
+        await writer.wait_closed()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<20} {connections / elapsed:8.0f} connections/s, {reused:5} of {connections} resumed")
+
+
+async def measure_requests(
+    name: str, port: int, ssl_context: Optional[ssl.SSLContext], frame: bytes, requests: int
+) -> None:
+    reader, writer = await asyncio.open_connection(
+        "127.0.0.1", port, ssl=ssl_context, server_hostname="localhost" if ssl_context else None
+    )
+    durations = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        await request(reader, writer, frame)
+        durations.append(time.perf_counter() - started)
+    writer.close()
+    await writer.wait_closed()
+    print(f"{name:<20} {format_latency(durations)} per request")
+
+
+async def main():
+    parser = argparse.ArgumentParser("TLS benchmark")
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--minimum-version", choices=["TLSv1.2", "TLSv1.3"], default="TLSv1.2")
+    parser.add_argument("--port", type=int, default=3240, help="Plain server listens here, TLS one on the next port")
+
+    args = parser.parse_args()
+    frame = Protocol.construct(GetAllItemListRequest().model_dump(mode="json"))
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = generate_self_signed_certificate(directory)
+        tls_settings = {
+            "enabled": True,
+            "certfile": certfile,
+            "keyfile": keyfile,
+            "minimum_version": args.minimum_version,
+        }
+        plain_settings_path = write_settings(directory, args.port, name=str(args.port))
+        tls_settings_path = write_settings(directory, args.port + 1, name=str(args.port + 1), tls_settings=tls_settings)
+
+        async with Server(plain_settings_path), Server(tls_settings_path):
+            tls_port = args.port + 1
+            #  Context, which is never given a session, does the full handshake on every connection
+            full_context = make_client_context(certfile, args.minimum_version)
+            resuming_context = make_client_context(certfile, args.minimum_version)
+
+            await measure_connections("plain", args.port, None, frame, args.connections, resume=False)
+            await measure_connections("tls full handshake", tls_port, full_context, frame, args.connections, False)
+            await measure_connections("tls resumed", tls_port, resuming_context, frame, args.connections, True)
+
+            await measure_requests("plain", args.port, None, frame, args.requests)
+            await measure_requests("tls", tls_port, full_context, frame, args.requests)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import Awaitable, Callable, Tuple
+
+from common import format_latency, write_settings
+
+from gameserver.client import Client
+from gameserver.server import Server
+from gameserver.misc.protocol import Protocol
+
+#  Loopback TCP against Unix socket of the same server. Latency is measured on one connection, with frames, which
+#  server rejects before dispatch, so that only transport and framing are left, and with game session refreshes.
+#  Throughput is requests per second of many clients refreshing their game sessions at once
+
+Streams = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+async def measure_frames(name: str, open_streams: Callable[[], Awaitable[Streams]], requests: int) -> None:
+    #  Frame, which is not a valid request, is answered with BadRequest by connection itself
+    frame = Protocol.construct({})
+    reader, writer = await open_streams()
+    durations = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        writer.write(frame)
+        await writer.drain()
+        header = await reader.readexactly(Protocol.HEADER_TOTAL_SIZE)
+        await reader.readexactly(int(header[: Protocol.HEADER_SIZE]))
+        durations.append(time.perf_counter() - started)
+    writer.close()
+    await writer.wait_closed()
+    print(f"{name + ' frames':<28} {format_latency(durations)}")
+
+
+async def measure_refreshes(name: str, make_client: Callable[[], Client], requests: int) -> None:
+    async with make_client() as client:
+        await client.send_login_request("uds")
+        durations = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            await client.refresh_game_session()
+            durations.append(time.perf_counter() - started)
+    print(f"{name + ' game sessions':<28} {format_latency(durations)}")
+
+
+async def measure_throughput(name: str, make_client: Callable[[], Client], clients: int, requests: int) -> None:
+    async def run_client(index: int) -> None:
+        async with make_client() as client:
+            await client.send_login_request(f"uds{index}")
+            for _ in range(requests):
+                await client.refresh_game_session()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_client(index) for index in range(clients)))
+    print(f"{name + ' throughput':<28} {clients * requests / (time.perf_counter() - started):8.0f} requests/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser("Unix socket benchmark")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests of latency measurements")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--client-requests", type=int, default=500, help="Requests per client of throughput")
+    parser.add_argument("--port", type=int, default=3243)
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "gameserver.sock")
+        async with Server(write_settings(directory, args.port, unix_paths=[path])):
+            transports = {
+                "tcp": (
+                    lambda: asyncio.open_connection("127.0.0.1", args.port),
+                    lambda: Client("127.0.0.1", args.port),
+                ),
+                "unix": (lambda: asyncio.open_unix_connection(path), lambda: Client(path=path)),
+            }
+            for name, (open_streams, _) in transports.items():
+                await measure_frames(name, open_streams, args.requests)
+            for name, (_, make_client) in transports.items():
+                await measure_refreshes(name, make_client, args.requests)
+            for name, (_, make_client) in transports.items():
+                await measure_throughput(name, make_client, args.clients, args.client_requests)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+import timeit
+from typing import Optional, Union
+import uuid
+
+from pydantic import BaseModel, UUID4
+
+from common import parse_timing_arguments
+
+from gameserver.misc.models import (
+    AccountLoginRequest,
+    ActionType,
+    BasicResponse,
+    ErrorResponse,
+    GameSessionData,
+    GameSessionDelta,
+    GameSessionRequest,
+    ItemRequest,
+    ServerEvent,
+    ShopItem,
+    ShopItemList,
+    ShopItemType,
+)
+from gameserver.misc.protocol import (
+    BuyItemRequest,
+    GetAllItemListRequest,
+    LoginRequest,
+    ProtocolResponse,
+    validate_request,
+    validate_response,
+    warmup,
+)
+
+#  Compares validation cost per message of discriminated envelopes against untagged unions, which pydantic has to
+#  try member by member
+
+
+class UntaggedRequest(BaseModel):
+    action_type: ActionType
+    session_uuid: Optional[UUID4]
+    data: Union[ItemRequest, AccountLoginRequest, GameSessionRequest, None]
+
+
+class UntaggedResponse(BaseModel):
+    data: Union[GameSessionData, GameSessionDelta, BasicResponse, ShopItemList, ErrorResponse, ServerEvent]
+
+
+def make_messages():
+    shop_items = ShopItemList(
+        [ShopItem(uuid=uuid.uuid4(), name=f"item {index}", price=index, type=ShopItemType.SHIP) for index in range(20)]
+    )
+    requests = {
+        "login": LoginRequest(data=AccountLoginRequest(nickname="nick")),
+        "buy_item": BuyItemRequest(session_uuid=uuid.uuid4(), data=ItemRequest(item_uuid=uuid.uuid4())),
+        "get_all_item_list": GetAllItemListRequest(session_uuid=uuid.uuid4()),
+    }
+    responses = {
+        "basic": BasicResponse(status="ok"),
+        "error": ErrorResponse(error_code=1000, message="Bad Request", value=None),
+        "shop_item_list": shop_items,
+        "game_session_data": GameSessionData(
+            account_uuid=uuid.uuid4(), nickname="nick", balance=100, session_uuid=uuid.uuid4(), owned_items=shop_items
+        ),
+    }
+    return (
+        {name: request.model_dump_json().encode() for name, request in requests.items()},
+        {name: ProtocolResponse.of(response).model_dump_json().encode() for name, response in responses.items()},
+    )
+
+
+def measure(func, iterations: int, repeat: int) -> float:
+    best = min(timeit.repeat(func, number=iterations, repeat=repeat))
+    return best / iterations * 1e6
+
+
+def run(iterations: int, repeat: int) -> None:
+    warmup()
+    requests, responses = make_messages()
+
+    print(f"{'message':<24} {'untagged':>12} {'discriminated':>14}")
+    for name, message in requests.items():
+        untagged = measure(lambda message=message: UntaggedRequest.model_validate_json(message), iterations, repeat)
+        tagged = measure(lambda message=message: validate_request(message), iterations, repeat)
+        print(f"{'request ' + name:<24} {untagged:9.2f} us {tagged:11.2f} us")
+    for name, message in responses.items():
+        untagged = measure(
+            lambda message=message: UntaggedResponse.model_validate_json(message, strict=True), iterations, repeat
+        )
+        tagged = measure(lambda message=message: validate_response(message, strict=True), iterations, repeat)
+        print(f"{'response ' + name:<24} {untagged:9.2f} us {tagged:11.2f} us")
+
+
+def main():
+    args = parse_timing_arguments("Message validation benchmark", 20000)
+    run(args.iterations, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
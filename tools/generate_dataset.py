@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import time
+from typing import Dict, List
+import uuid
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from generate_items import iter_items, write_items  #  pylint: disable=import-error
+from gameserver.db import DBManager, tables
+from gameserver.db.sharding import hash_point
+from gameserver.misc.models import ShopItemType
+from gameserver.misc.settings import validate_settings
+
+#  Fills databases of settings with a deterministic dataset at production scale: the catalog on every shard, and
+#  accounts with balances and owned items on their shards. Rows are written with multi-row inserts in batches, and
+#  ids are assigned here, so nothing is read back. Nothing else may write into the databases meanwhile.
+#  Popularity of items follows Zipf's law: item of rank r is owned 1 / r ** skew times as often as the first one
+
+
+class ShardBatch:  #  pylint: disable=too-few-public-methods
+    def __init__(self, next_account_id: int) -> None:
+        self.next_account_id = next_account_id
+        self.accounts: List[Dict[str, object]] = []
+        self.balances: List[Dict[str, object]] = []
+        self.ownership: List[Dict[str, object]] = []
+
+
+async def next_id(session: AsyncSession, table) -> int:
+    return ((await session.execute(select(func.max(table.id)))).scalar() or 0) + 1
+
+
+async def insert_items(db: DBManager, seed: int, args: argparse.Namespace) -> List[int]:
+    first_item_ids = []
+    for sessionmaker in db.sessionmakers:
+        #  Every shard gets the same items, as the generator is started again with the same seed
+        items = iter_items(random.Random(seed), args.items, args.start_price, args.end_price, unique_names=True)
+        async with sessionmaker.begin() as session:
+            first_item_id = await next_id(session, tables.DBShopItem)
+            first_item_ids.append(first_item_id)
+            for index, batch in enumerate(batched(items, args.batch_size)):
+                rows = [
+                    dict(
+                        item,
+                        id=first_item_id + index * args.batch_size + offset,
+                        uuid=uuid.UUID(item["uuid"]),
+                        type=ShopItemType(item["type"]),
+                    )
+                    for offset, item in enumerate(batch)
+                ]
+                await session.execute(insert(tables.DBShopItem.__table__), rows)
+
+    return first_item_ids
+
+
+async def flush(db: DBManager, shard: int, batch: ShardBatch) -> None:
+    if not batch.accounts:
+        return
+    async with db.sessionmakers[shard].begin() as session:
+        await session.execute(insert(tables.DBAccount.__table__), batch.accounts)
+        await session.execute(insert(tables.DBAccountBalance.__table__), batch.balances)
+        if batch.ownership:
+            await session.execute(insert(tables.DBShopItem2Account.__table__), batch.ownership)
+    batch.accounts, batch.balances, batch.ownership = [], [], []
+
+
+async def insert_accounts(  #  pylint: disable=too-many-locals
+    db: DBManager, seed: int, first_item_ids: List[int], args: argparse.Namespace
+) -> int:
+    rng = random.Random(f"{seed}:accounts")
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) ** args.popularity_skew for rank in range(args.items)))
+    item_indexes = range(args.items)
+    digits = 12 - len(args.nickname_prefix)
+    ownership_rows = 0
+
+    batches = []
+    for sessionmaker in db.sessionmakers:
+        async with sessionmaker() as session:
+            batches.append(ShardBatch(await next_id(session, tables.DBAccount)))
+
+    for index in range(args.accounts):
+        nickname = f"{args.nickname_prefix}{index:0{digits}d}"
+        shard = db.ring.shard_for_nickname(nickname)
+        batch = batches[shard]
+        account_id = batch.next_account_id
+        batch.next_account_id += 1
+
+        batch.accounts.append(
+            {
+                "id": account_id,
+                #  Same layout as uuids made by the server: shard point first, then random bits
+                "uuid": uuid.UUID(int=(hash_point(nickname) << 96) | rng.getrandbits(96), version=4),
+                "nickname": nickname,
+                "state_version": 0,
+            }
+        )
+        batch.balances.append({"account": account_id, "balance_cents": rng.randint(args.min_balance, args.max_balance)})
+
+        owned_count = min(args.items, int(rng.expovariate(1 / args.items_per_account))) if args.items_per_account else 0
+        for item_index in set(rng.choices(item_indexes, cum_weights=cum_weights, k=owned_count)):
+            batch.ownership.append({"account": account_id, "shop_item": first_item_ids[shard] + item_index})
+            ownership_rows += 1
+
+        if len(batch.accounts) >= args.batch_size:
+            await flush(db, shard, batch)
+
+    for shard, batch in enumerate(batches):
+        await flush(db, shard, batch)
+
+    return ownership_rows
+
+
+def batched(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser("Dataset generator")
+    parser.add_argument("--settings-path", type=str, default="settings.json")
+    parser.add_argument("--seed", type=int, default=None, help="Same seed gives the same dataset")
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--start-price", type=int, default=500, help="Cents")
+    parser.add_argument("--end-price", type=int, default=10000, help="Cents")
+    parser.add_argument("--items-output", type=str, default=None, help="Also write the catalog to this items file")
+    parser.add_argument("--accounts", type=int, default=100000)
+    parser.add_argument("--nickname-prefix", type=str, default="bot")
+    parser.add_argument("--min-balance", type=int, default=None, help="Cents, taken from settings by default")
+    parser.add_argument("--max-balance", type=int, default=None, help="Cents, taken from settings by default")
+    parser.add_argument("--items-per-account", type=float, default=5, help="Mean of exponential distribution")
+    parser.add_argument("--popularity-skew", type=float, default=1.0, help="Zipf exponent, 0 means uniform")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per insert")
+
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    settings = validate_settings(args.settings_path)
+    if args.min_balance is None:
+        args.min_balance = settings.min_amount_of_money_cents
+    if args.max_balance is None:
+        args.max_balance = settings.max_amount_of_money_cents
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    logging.info("Generating dataset with seed %d", seed)
+
+    if args.items_output:
+        items = iter_items(random.Random(seed), args.items, args.start_price, args.end_price, unique_names=True)
+        write_items(args.items_output, items)
+
+    db = DBManager(settings.db_settings)
+    #  Test databases are not dropped here, unlike on server startup
+    await db.init_db_engine(migrate=False)
+    try:
+        await db.migrate()
+
+        started = time.perf_counter()
+        first_item_ids = await insert_items(db, seed, args)
+        logging.info("%d items have been inserted into %d shards", args.items, len(first_item_ids))
+        ownership_rows = await insert_accounts(db, seed, first_item_ids, args)
+        elapsed = time.perf_counter() - started
+    finally:
+        await db.shutdown()
+
+    logging.info(
+        "%d accounts with %d owned items have been inserted in %.1f s, %.0f rows/s",
+        args.accounts,
+        ownership_rows,
+        elapsed,
+        (args.items * len(first_item_ids) + args.accounts * 2 + ownership_rows) / elapsed,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
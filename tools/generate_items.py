@@ -1,51 +1,85 @@
 import argparse
+import json
+import os
 import random
+from typing import Dict, Iterator, List
+import uuid
 
-from gameserver.misc.models import ShopItem, ShopItemList, ShopItemType
+from gameserver.misc.models import ShopItemType
 
+#  Items are generated one by one and written right away, so that millions of them never sit in memory. The same
+#  seed always gives the same items, uuids included, so a file and a database filled from it describe the same catalog
 
-def generate(count: int, start_price: int, end_price: int) -> ShopItemList:
-    result = ShopItemList([])
-    ship_names = []
-    equipment_names = []
-    with open("ship_names.txt", "r", encoding="utf-8")as f:
-        for ship_name in f.readlines():
-            ship_names.append(ship_name.rstrip())
+NAMES_DIR = os.path.dirname(os.path.abspath(__file__))
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
 
-    with open("equipment_names.txt", "r", encoding="utf-8") as f:
-        for equip_name in f.readlines():
-            equipment_names.append(equip_name.rstrip())
 
-    for _ in range(count):
-        if random.random() <= 0.6:
+def read_names(filename: str) -> List[str]:
+    with open(os.path.join(NAMES_DIR, filename), "r", encoding="utf-8") as f:
+        return [name.rstrip() for name in f if name.strip()]
+
+
+def iter_items(
+    rng: random.Random, count: int, start_price: int, end_price: int, unique_names: bool = False
+) -> Iterator[Dict[str, object]]:
+    ship_names = read_names("ship_names.txt")
+    equipment_names = read_names("equipment_names.txt")
+
+    for index in range(count):
+        if rng.random() <= 0.6:
             item_type = ShopItemType.SHIP
-            item_name = random.choice(ship_names)
+            item_name = rng.choice(ship_names)
         else:
             item_type = ShopItemType.EQUIPMENT
-            item_name = random.choice(equipment_names)
+            item_name = rng.choice(equipment_names)
+        if unique_names:
+            #  Name is cut, so that it still fits the column with the suffix
+            item_name = f"{item_name[:48]} #{index}"
+
+        yield {
+            "uuid": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "name": item_name,
+            "price": rng.randint(start_price, end_price),
+            "type": item_type.value,
+        }
+
 
-        result.append(ShopItem(
-            name=item_name,
-            price=random.randint(start_price, end_price),
-            type=item_type
-        ))
+def write_items(path: str, items: Iterator[Dict[str, object]]) -> int:
+    written = 0
+    is_ndjson = path.endswith(NDJSON_SUFFIXES)
+    with open(path, "w", encoding="utf-8") as f:
+        if not is_ndjson:
+            f.write("[\n")
+        for item in items:
+            if not is_ndjson and written:
+                f.write(",\n")
+            f.write(json.dumps(item, ensure_ascii=False))
+            if is_ndjson:
+                f.write("\n")
+            written += 1
+        if not is_ndjson:
+            f.write("\n]\n")
 
-    return result
+    return written
 
 
 def main():
     parser = argparse.ArgumentParser("Item Generator")
     parser.add_argument("--count", type=int, default=10)
-    parser.add_argument("--start-price", type=int, default=5, metavar="start_price")
-    parser.add_argument("--end-price", type=int, default=100, metavar="end_price")
+    parser.add_argument("--start-price", type=int, default=500, metavar="start_price", help="Cents")
+    parser.add_argument("--end-price", type=int, default=10000, metavar="end_price", help="Cents")
+    parser.add_argument("--seed", type=int, default=None, help="Same seed gives the same items")
+    parser.add_argument("--unique-names", action="store_true", help="Suffix names with item index")
+    parser.add_argument(
+        "--output", type=str, default="shop_items.json", help="Items are written as NDJSON to .ndjson or .jsonl file"
+    )
 
     args = parser.parse_args()
 
-    item_list = generate(args.count, args.start_price, args.end_price)
+    items = iter_items(random.Random(args.seed), args.count, args.start_price, args.end_price, args.unique_names)
+    written = write_items(args.output, items)
+    print(f"{written} items have been written to {args.output}")
 
-    print(item_list.model_dump_json())
-    with open("shop_items.json", "w", encoding="utf-8") as f:
-        f.write(item_list.model_dump_json(indent=2))
 
 if __name__ == "__main__":
     main()